@@ -0,0 +1,115 @@
+"""
+Add USSC variables to the Parquet store without re-parsing every year.
+For each year in data/ingest_manifest.json, only the new variables are decoded
+from the year's raw records (the .dat, or the cached zip it was parsed from),
+using the year's compiled layout from sas_layout, and added as
+columns to the existing partition. FY2024 is read from opafy24nid.csv through
+wide_csv's column index.
+
+Added variables are recorded in data/extra_vars.json, so parse_all_years.py /
+reparse_missing.py keep extracting them on later re-parses.
+
+Usage: python add_variable.py BOOTEFCT [MORE ...] [--force]
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import case_store
+import sas_layout
+from dat_reader import read_dat, read_zip
+from ingest import KEY_VARS, dat_digest, load_extra_vars, load_manifest, save_extra_vars, save_manifest
+
+STORE_PATH = os.path.join("data", "combined_all_years.parquet")
+
+
+def year_layout(year, entry):
+    """The year's compiled layout: as saved at parse time, or compiled from its .sas if it predates the registry."""
+    layout = sas_layout.load(year)
+    if layout is not None:
+        return layout
+    source = entry["source"]["path"]
+    if not source.endswith(".zip"):
+        source = (entry.get("layout") or {}).get("path")
+        if not source:
+            return None
+    return sas_layout.year_layout(year, source)
+
+
+def extract(year, entry, names):
+    """
+    Decode just `names` from a year's raw records.
+    Returns (DataFrame or None, resolved {var: source var}).
+    """
+    source = entry["source"]["path"]
+    if dat_digest(source, entry["source"])["sha256"] != entry["source"]["sha256"]:
+        raise ValueError(f"{source} changed since FY{year} was stored; re-parse that year first")
+
+    if source.endswith(".csv"):  # FY2024: pulled from the wide CSV the slim file came from
+        import wide_csv
+        if not os.path.exists(wide_csv.DATA_PATH):
+            return None, {}
+        df = wide_csv.read_columns(wide_csv.DATA_PATH, names)
+        return df, {c: c for c in df.columns}
+
+    layout = year_layout(year, entry)
+    if layout is None:
+        return None, {}
+    colspecs, resolved, _ = sas_layout.resolve(layout, names)
+    if not colspecs:
+        return None, {}
+    read = read_zip if source.endswith(".zip") else read_dat
+    return read(source, colspecs), resolved
+
+
+def main():
+    force = "--force" in sys.argv
+    names = [a.upper() for a in sys.argv[1:] if not a.startswith("--")]
+    if not names:
+        print(__doc__)
+        sys.exit(1)
+    manifest = load_manifest()
+    if not manifest:
+        print("❌ No ingest manifest; run parse_all_years.py first")
+        sys.exit(1)
+
+    for year, entry in sorted(manifest.items()):
+        # Skip variables the year already has, or whose layout is known to lack them
+        todo = [n for n in names if force or not (entry.get("coverage", {}).get(n) or n in entry.get("missing", []))]
+        if not todo:
+            print(f"✓ FY{year}: already has {', '.join(names)}")
+            continue
+        try:
+            df, resolved = extract(year, entry, todo)
+        except Exception as e:
+            print(f"  ❌ FY{year}: {e}")
+            continue
+        rows = entry["rows"]
+        # Every partition gets every column (all-null where the year lacks it), so the store schema stays uniform
+        cols = pd.DataFrame({n: (df[n].to_numpy("float64") if df is not None and n in df.columns
+                                 else np.full(rows, np.nan)) for n in todo})
+        try:
+            case_store.add_columns(year, cols, STORE_PATH)
+        except ValueError as e:
+            print(f"  ❌ {e}")
+            continue
+        entry.setdefault("resolved", {})
+        if entry["resolved"] is not None:
+            entry["resolved"].update(resolved)
+        entry["missing"] = list(dict.fromkeys(v for v in entry.get("missing", []) + todo if v not in resolved))
+        entry.setdefault("coverage", {}).update(
+            {n: round(float(cols[n].notna().sum()) / rows, 4) if rows else 0.0 for n in todo})
+        save_manifest(manifest)
+        found = [n for n in todo if n in resolved]
+        print(f"  FY{year}: added {', '.join(found) or 'nothing'}"
+              + (f" (not in this year: {', '.join(n for n in todo if n not in resolved)})" if len(found) < len(todo) else ""))
+
+    extra = load_extra_vars()
+    save_extra_vars(extra + [n for n in names if n not in extra and n not in KEY_VARS])
+    print(f"\n✅ {', '.join(names)} added to {STORE_PATH} ({case_store.store_size_mb(STORE_PATH):.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""
+Analysis-ready case table shared by app.py and precompute.py.
+The validity filter, compact types and derived label columns (Race, Offense,
+District Name, Crim History, Below Guideline, Plea Type, ...) are applied once
+and saved as one uncompressed .npy file per column:
+
+    data/analysis_table/columns.json   column names, kinds and category labels
+    data/analysis_table/NN.npy         values (codes for categoricals)
+    data/analysis_table/NN.mask.npy    null mask for nullable integer columns
+    data/analysis_table.json           sha256 of every source file it was built from
+
+load() memory-maps the columns while the recorded source hashes (and
+BUILD_VERSION) still match, and rebuilds them otherwise. The frame it returns
+is backed directly by the mapped files (read-only), so there is no parsing at
+startup and every process that loads it shares one page-cache copy.
+
+Usage: python analysis_table.py [--force]
+"""
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import case_schema
+from districts import DISTRICT_MAP
+from ingest import file_digest
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+TABLE_PATH = os.path.join(DATA_DIR, "analysis_table")
+META_PATH = os.path.join(DATA_DIR, "analysis_table.json")
+STORE_PATH = os.path.join(DATA_DIR, "combined_all_years.parquet")
+CSV_PATHS = [os.path.join(DATA_DIR, "combined_all_years.csv"),
+             os.path.join(DATA_DIR, "combined_fy19_fy24.csv")]
+
+# Bump whenever clean() changes, so existing artifacts are rebuilt
+BUILD_VERSION = 2
+
+RACE_MAP = {1: "White", 2: "Black", 3: "Hispanic"}
+SEX_MAP = {0: "Male", 1: "Female"}
+OFFENSE_MAP = {
+    1: "Admin of Justice", 2: "Antitrust", 3: "Arson",
+    4: "Assault", 5: "Bribery/Corruption", 6: "Burglary/Trespass",
+    7: "Child Pornography", 8: "Commercialized Vice",
+    9: "Drug Possession", 10: "Drug Trafficking",
+    11: "Environmental", 12: "Extortion/Racketeering", 13: "Firearms",
+    14: "Food & Drug", 15: "Forgery/Counterfeiting", 16: "Fraud/Theft/Embezzlement",
+    17: "Immigration", 18: "Individual Rights", 19: "Kidnapping",
+    20: "Manslaughter", 21: "Money Laundering", 22: "Murder",
+    23: "National Defense", 24: "Obscenity/Sex Offenses", 25: "Prison Offenses",
+    26: "Robbery", 27: "Sexual Abuse", 28: "Stalking/Harassment",
+    29: "Tax", 30: "Other"
+}
+PLEA_MAP = {1: "Plea Deal", 2: "Plea Deal", 3: "Plea Deal",
+            5: "Straight Plea", 8: "Trial", 9: "Plea Deal"}
+CRIM_HISTORY_BINS = [-1, 0, 3, 6, 10, 200]
+CRIM_HISTORY_LABELS = ["0 pts", "1-3 pts", "4-6 pts", "7-10 pts", "10+ pts"]
+
+
+def source_files():
+    """Files the table is built from: the store's partitions if there is a store, else the first CSV found."""
+    if os.path.isdir(STORE_PATH):
+        return sorted(os.path.join(root, name)
+                      for root, _, names in os.walk(STORE_PATH)
+                      for name in names if name.endswith(".parquet"))
+    if os.path.exists(STORE_PATH):
+        return [STORE_PATH]
+    for path in CSV_PATHS:
+        if os.path.exists(path):
+            return [path]
+    raise FileNotFoundError(f"No case data found in {DATA_DIR}")
+
+
+def read_source():
+    """The raw case table, pulling only the analysis columns and valid rows from the store."""
+    if os.path.isdir(STORE_PATH):
+        import case_store
+        return case_store.read_store(columns=case_store.ANALYSIS_COLUMNS,
+                                     filters=case_store.VALID_FILTERS, path=STORE_PATH)
+    path = source_files()[0]
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_csv(path, low_memory=False)
+
+
+def clean(raw):
+    """Apply the validity filter, compact types and derived columns; returns a new DataFrame."""
+    df = raw[
+        (raw["SENTTOT"] >= 0) & (raw["SENTTOT"] < 470) &
+        (raw["NEWRACE"].isin([1, 2, 3])) &
+        (raw["XMINSOR"] >= 0) & (raw["XMINSOR"] < 9996) &
+        (raw["OFFGUIDE"].notna()) &
+        (raw["CRIMPTS"].notna()) & (raw["CRIMPTS"] >= 0) &
+        (raw["AGE"].notna()) & (raw["AGE"] > 0)
+    ].copy()
+    # Small nullable ints for the coded columns (a no-op for a typed store)
+    case_schema.apply_schema(df)
+
+    df["Race"] = df["NEWRACE"].map(RACE_MAP)
+    df["Sex"] = df["MONSEX"].map(SEX_MAP)
+    df["Offense"] = df["OFFGUIDE"].map(OFFENSE_MAP).fillna("Other")
+    df["Year"] = df["FISCAL_YEAR"].astype(int)
+    guideline_min = df["XMINSOR"].astype("float64")
+    df["Below Guideline"] = df["SENTTOT"] < guideline_min
+    df["Departure"] = df["SENTTOT"] - guideline_min
+    df["District Name"] = df["DISTRICT"].astype(int).map(DISTRICT_MAP).fillna(df["DISTRICT"].astype(str))
+    df["Crim History"] = pd.cut(df["CRIMPTS"], bins=CRIM_HISTORY_BINS, labels=CRIM_HISTORY_LABELS)
+    df["Plea Type"] = df["DSPLEA"].map(PLEA_MAP)
+    case_schema.categorize(df)
+    return df.reset_index(drop=True)
+
+
+def write_columns(df, path=TABLE_PATH):
+    """Save df as per-column .npy files under path, replacing whatever was there."""
+    tmp = path + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    columns = []
+    for i, name in enumerate(df.columns):
+        col, spec = df[name], {"name": name, "file": f"{i:02d}"}
+        if isinstance(col.dtype, pd.CategoricalDtype):
+            values = col.cat.codes.to_numpy()
+            spec.update(kind="category", categories=list(col.cat.categories), ordered=col.cat.ordered)
+        elif isinstance(col.array, pd.arrays.IntegerArray):
+            values = col.array._data
+            np.save(os.path.join(tmp, f"{i:02d}.mask.npy"), col.array._mask)
+            spec.update(kind="masked", dtype=str(col.dtype))
+        elif col.dtype.kind in "biuf":
+            values = col.to_numpy()
+            spec.update(kind="numpy")
+        else:
+            raise TypeError(f"Can't map column {name!r} of dtype {col.dtype}")
+        np.save(os.path.join(tmp, f"{i:02d}.npy"), values, allow_pickle=False)
+        columns.append(spec)
+    with open(os.path.join(tmp, "columns.json"), "w") as f:
+        json.dump({"rows": len(df), "columns": columns}, f, indent=2)
+    # Processes still mapping the old files keep them until they exit
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+
+def open_columns(path=TABLE_PATH):
+    """DataFrame over the memory-mapped column files; no column is read or copied up front."""
+    with open(os.path.join(path, "columns.json")) as f:
+        layout = json.load(f)
+    data = {}
+    for spec in layout["columns"]:
+        # np.asarray drops the np.memmap subclass but keeps the view onto the mapping
+        values = np.asarray(np.load(os.path.join(path, spec["file"] + ".npy"), mmap_mode="r"))
+        if spec["kind"] == "category":
+            dtype = pd.CategoricalDtype(spec["categories"], ordered=spec["ordered"])
+            data[spec["name"]] = pd.Categorical.from_codes(values, dtype=dtype)
+        elif spec["kind"] == "masked":
+            mask = np.asarray(np.load(os.path.join(path, spec["file"] + ".mask.npy"), mmap_mode="r"))
+            data[spec["name"]] = pd.arrays.IntegerArray(values, mask, copy=False)
+        else:
+            data[spec["name"]] = values
+    # copy=False keeps each column as its own block over the mapped file
+    return pd.DataFrame(data, copy=False)
+
+
+def _load_meta():
+    if not os.path.exists(META_PATH):
+        return {}
+    with open(META_PATH) as f:
+        return json.load(f)
+
+
+def _current_sources(meta):
+    """Digests of the current source files, reusing recorded hashes for unchanged files."""
+    cached = {s["path"]: s for s in meta.get("sources", [])}
+    return [file_digest(path, cached.get(path)) for path in source_files()]
+
+
+def _hashes(sources):
+    return [(s["path"], s["sha256"]) for s in sources]
+
+
+def is_current(meta, sources):
+    """True if the artifact exists and was built by this BUILD_VERSION from the same source content."""
+    return (os.path.exists(os.path.join(TABLE_PATH, "columns.json")) and meta.get("version") == BUILD_VERSION
+            and _hashes(meta.get("sources", [])) == _hashes(sources))
+
+
+def _save_meta(rows, sources):
+    with open(META_PATH + ".tmp", "w") as f:
+        json.dump({"version": BUILD_VERSION, "rows": rows, "sources": sources}, f, indent=2)
+    os.replace(META_PATH + ".tmp", META_PATH)
+
+
+def build(sources=None):
+    """Rebuild the artifact from the raw source and return the table."""
+    t = time.time()
+    sources = sources or _current_sources({})
+    df = clean(read_source())
+    os.makedirs(DATA_DIR, exist_ok=True)
+    write_columns(df)
+    _save_meta(len(df), sources)
+    print(f"🔨 Built {TABLE_PATH}: {len(df):,} rows in {time.time() - t:.1f}s")
+    return open_columns()
+
+
+def load(force=False):
+    """The analysis-ready table (read-only, memory-mapped), rebuilt first if the source changed."""
+    meta = _load_meta()
+    sources = _current_sources(meta)
+    if not force and is_current(meta, sources):
+        if sources != meta["sources"]:  # touched but unchanged; remember the new mtimes
+            _save_meta(meta.get("rows"), sources)
+        return open_columns()
+    return build(sources)
+
+
+def main():
+    t = time.time()
+    df = load(force="--force" in sys.argv)
+    print(f"✅ {len(df):,} rows ready in {time.time() - t:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
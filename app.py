@@ -8,12 +8,13 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from districts import DISTRICT_MAP
 from district_coords import DISTRICT_COORDS
 from regression_utils import (
     run_overall_regression, run_yearly_regression,
     run_offense_regressions, run_leniency_regression,
-    predict_sentence, compute_human_cost, get_offense_trends
+    predict_sentence, compute_human_cost, get_offense_trends,
+    run_controlled_regression, controlled_options, run_fixed_effects_regression,
+    run_leniency_by
 )
 import precomputed_data as pcd
 
@@ -82,60 +83,13 @@ st.markdown("""
 FOOTER = '<div class="footer">⚖️ Justice Index · Data from the <a href="https://www.ussc.gov/research/datafiles/commission-datafiles">US Sentencing Commission</a> · Built by Bruno Beckman</div>'
 
 # ── Data loading ──────────────────────────────────────────────
-@st.cache_data
+@st.cache_resource
 def load_data():
-    import os
-    pq = os.path.join(os.path.dirname(__file__), "data", "combined_all_years.parquet")
-    if os.path.exists(pq):
-        df = pd.read_parquet(pq)
-    else:
-        df = pd.read_csv("data/combined_all_years.csv", low_memory=False)
-    df = df[
-        (df["SENTTOT"] >= 0) & (df["SENTTOT"] < 470) &
-        (df["NEWRACE"].isin([1, 2, 3])) &
-        (df["XMINSOR"] >= 0) & (df["XMINSOR"] < 9996) &
-        (df["OFFGUIDE"].notna()) &
-        (df["CRIMPTS"].notna()) & (df["CRIMPTS"] >= 0) &
-        (df["AGE"].notna()) & (df["AGE"] > 0)
-    ].copy()
-
-    for col in ["NEWRACE", "MONSEX", "CRIMHIST", "WEAPON", "CITIZEN", "NEWEDUC", "INOUT", "PRESENT"]:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-            mask = df[col].notna()
-            df.loc[mask, col] = df.loc[mask, col].astype(int)
-
-    race_map = {1: "White", 2: "Black", 3: "Hispanic"}
-    sex_map = {0: "Male", 1: "Female"}
-    offense_map = {
-        1: "Admin of Justice", 2: "Antitrust", 3: "Arson",
-        4: "Assault", 5: "Bribery/Corruption", 6: "Burglary/Trespass",
-        7: "Child Pornography", 8: "Commercialized Vice",
-        9: "Drug Possession", 10: "Drug Trafficking",
-        11: "Environmental", 12: "Extortion/Racketeering", 13: "Firearms",
-        14: "Food & Drug", 15: "Forgery/Counterfeiting", 16: "Fraud/Theft/Embezzlement",
-        17: "Immigration", 18: "Individual Rights", 19: "Kidnapping",
-        20: "Manslaughter", 21: "Money Laundering", 22: "Murder",
-        23: "National Defense", 24: "Obscenity/Sex Offenses", 25: "Prison Offenses",
-        26: "Robbery", 27: "Sexual Abuse", 28: "Stalking/Harassment",
-        29: "Tax", 30: "Other"
-    }
-
-    df["Race"] = df["NEWRACE"].map(race_map)
-    df["Sex"] = df["MONSEX"].map(sex_map)
-    df["Offense"] = df["OFFGUIDE"].map(offense_map).fillna("Other")
-    df["Year"] = df["FISCAL_YEAR"].astype(int)
-    df["Below Guideline"] = df["SENTTOT"] < df["XMINSOR"]
-    df["Departure"] = df["SENTTOT"] - df["XMINSOR"]
-    df["District Name"] = df["DISTRICT"].astype(int).map(DISTRICT_MAP).fillna(df["DISTRICT"].astype(str))
-    df["Crim History"] = pd.cut(df["CRIMPTS"], bins=[-1, 0, 3, 6, 10, 200],
-                                 labels=["0 pts", "1-3 pts", "4-6 pts", "7-10 pts", "10+ pts"])
-
-    plea_map = {1: "Plea Deal", 2: "Plea Deal", 3: "Plea Deal",
-                5: "Straight Plea", 8: "Trial", 9: "Plea Deal"}
-    df["Plea Type"] = df["DSPLEA"].map(plea_map)
-
-    return df
+    # Filtered, typed and labelled once by analysis_table; rebuilt only when the source changes.
+    # The frame is read-only and memory-mapped, so it's shared as a resource (no per-session
+    # copy) and every worker process maps the same page-cache pages.
+    import analysis_table
+    return analysis_table.load()
 
 # Only load full DataFrame if precomputed data is not available
 if USE_PRECOMPUTED:
@@ -314,7 +268,7 @@ if page == "🏠 Same Crime, Different Time":
         if len(subset) < 30:
             st.warning("Not enough cases for this combination. Try broadening filters.")
         else:
-            race_stats = subset.groupby("Race")["SENTTOT"].agg(["mean", "median", "count", "std"]).round(1)
+            race_stats = subset.groupby("Race", observed=True)["SENTTOT"].agg(["mean", "median", "count", "std"]).round(1)
 
             cols = st.columns(3)
             for i, race in enumerate(["White", "Black", "Hispanic"]):
@@ -371,7 +325,7 @@ if page == "🏠 Same Crime, Different Time":
                 st.plotly_chart(fig, width="stretch")
 
             with c2:
-                below_rates = subset.groupby("Race")["Below Guideline"].mean() * 100
+                below_rates = subset.groupby("Race", observed=True)["Below Guideline"].mean() * 100
                 fig2 = go.Figure()
                 for race in ["White", "Black", "Hispanic"]:
                     if race not in below_rates.index:
@@ -619,11 +573,25 @@ elif page == "📈 The Trend":
 
     with tab3:
         off_yearly = get_offense_trends(df)
+        # Without stored regression cells (or the case table) only the precomputed trends are offered
+        trend_years, trend_offenses = controlled_options(df) or ([], [])
 
-        off_choice = st.selectbox("Select offense", ["Drug Trafficking", "Firearms", "Robbery"])
+        off_choice = st.selectbox("Select offense",
+                                  list(dict.fromkeys(["Drug Trafficking", "Firearms", "Robbery"] + trend_offenses)))
 
-        if off_choice in off_yearly and len(off_yearly[off_choice]) > 0:
+        if off_choice in off_yearly:
             odf = off_yearly[off_choice]
+        else:
+            # Any other offense is fitted per year from the stored regression cells
+            trend_rows = []
+            for year in trend_years:
+                fit = run_controlled_regression((year, year), (off_choice,), df, offense_dummies=False)
+                if fit is not None:
+                    black = next(c for c in fit["coefficients"] if c["variable"] == "Black (vs White)")
+                    trend_rows.append({"Year": year, "Effect": round(black["effect"], 1)})
+            odf = pd.DataFrame(trend_rows)
+
+        if len(odf) > 0:
             fig = go.Figure()
             fig.add_trace(go.Bar(x=odf["Year"], y=odf["Effect"],
                                 marker_color=["#E45756" if v > 0 else "#4C78A8" for v in odf["Effect"]]))
@@ -668,7 +636,7 @@ elif page == "🗺️ The Lottery":
         dist_stats = dist_stats.sort_values("avg", ascending=False)
     else:
         geo = df[df["Offense"] == offense_choice]
-        dist_stats = geo.groupby(["DISTRICT", "District Name"]).agg(
+        dist_stats = geo.groupby(["DISTRICT", "District Name"], observed=True).agg(
             avg=("SENTTOT", "mean"), med=("SENTTOT", "median"), n=("SENTTOT", "count"),
             below=("Below Guideline", "mean")
         ).reset_index()
@@ -777,9 +745,9 @@ elif page == "🗺️ The Lottery":
                 st.plotly_chart(fig_gap, width="stretch")
     else:
         geo = df[df["Offense"] == offense_choice]
-        race_by_dist = geo.groupby(["DISTRICT", "District Name", "Race"])["SENTTOT"].agg(["mean", "count"]).reset_index()
+        race_by_dist = geo.groupby(["DISTRICT", "District Name", "Race"], observed=True)["SENTTOT"].agg(["mean", "count"]).reset_index()
         bw_pivot = race_by_dist[race_by_dist["Race"].isin(["White", "Black"])].pivot_table(
-            index=["DISTRICT", "District Name"], columns="Race", values=["mean", "count"]
+            index=["DISTRICT", "District Name"], columns="Race", values=["mean", "count"], observed=True
         )
         bw_pivot.columns = [f"{c[1]}_{c[0]}" for c in bw_pivot.columns]
         bw_pivot = bw_pivot.reset_index()
@@ -994,8 +962,8 @@ elif page == "🔎 Your District":
         st.divider()
 
         st.markdown("### Racial Breakdown")
-        race_stats = dist_df.groupby("Race")["SENTTOT"].agg(["mean", "median", "count"]).round(1)
-        nat_race = nat_df.groupby("Race")["SENTTOT"].agg(["mean"]).round(1)
+        race_stats = dist_df.groupby("Race", observed=True)["SENTTOT"].agg(["mean", "median", "count"]).round(1)
+        nat_race = nat_df.groupby("Race", observed=True)["SENTTOT"].agg(["mean"]).round(1)
 
         cols = st.columns(3)
         for i, race in enumerate(["White", "Black", "Hispanic"]):
@@ -1034,7 +1002,7 @@ elif page == "🔎 Your District":
 
         st.divider()
         st.markdown("### Top Offenses")
-        off_stats = dist_df.groupby("Offense")["SENTTOT"].agg(["mean", "count"]).round(1)
+        off_stats = dist_df.groupby("Offense", observed=True)["SENTTOT"].agg(["mean", "count"]).round(1)
         off_stats = off_stats[off_stats["count"] >= 10].sort_values("count", ascending=False).head(10)
         off_stats.columns = ["Avg Sentence (mo)", "Cases"]
 
@@ -1053,7 +1021,7 @@ elif page == "🔎 Your District":
 
         st.divider()
         st.markdown("### Sentencing Trend")
-        yr_stats = dist_df.groupby(["Year", "Race"])["SENTTOT"].agg(["mean", "count"]).reset_index()
+        yr_stats = dist_df.groupby(["Year", "Race"], observed=True)["SENTTOT"].agg(["mean", "count"]).reset_index()
         yr_stats = yr_stats[yr_stats["count"] >= 10]
 
         if len(yr_stats) > 2:
@@ -1068,7 +1036,7 @@ elif page == "🔎 Your District":
 
         st.divider()
         st.markdown("### How Does This District Rank?")
-        all_dist = nat_df.groupby("District Name")["SENTTOT"].agg(["mean", "count"]).reset_index()
+        all_dist = nat_df.groupby("District Name", observed=True)["SENTTOT"].agg(["mean", "count"]).reset_index()
         all_dist = all_dist[all_dist["count"] >= 50].sort_values("mean", ascending=False).reset_index(drop=True)
         all_dist.index = all_dist.index + 1
         rank = all_dist[all_dist["District Name"] == selected_dist].index
@@ -1264,6 +1232,38 @@ elif page == "🔬 The Evidence":
         for every 1-month increase in the guideline minimum, actual sentences increase by ~0.6 months.
         """)
 
+        fe = run_fixed_effects_regression(df)
+        if fe:
+            fe_black = next(c for c in fe["coefficients"] if c["variable"] == "Black (vs White)")
+            st.caption(f"Robustness check: with fixed effects for every district, year and offense "
+                       f"(standard errors clustered by district), the Black effect is "
+                       f"**{fe_black['effect']:+.1f} months** (p = {fe_black['pvalue']:.4f}, "
+                       f"R² = {fe['r_squared']:.2f}, {fe['n_obs']:,} cases).")
+
+        ev_options = controlled_options(df)
+        if ev_options:
+            st.markdown("#### Narrow the model")
+            ev_years, ev_offenses = ev_options
+            fc1, fc2 = st.columns([1, 2])
+            with fc1:
+                if len(ev_years) > 1:
+                    ev_range = st.slider("Fiscal years", ev_years[0], ev_years[-1], (ev_years[0], ev_years[-1]))
+                else:
+                    ev_range = (ev_years[0], ev_years[-1])
+            with fc2:
+                ev_picked = st.multiselect("Offenses (all if none selected)", ev_offenses)
+            if ev_range != (ev_years[0], ev_years[-1]) or ev_picked:
+                narrowed = run_controlled_regression(ev_range, tuple(ev_picked) or None, df)
+                if narrowed is None:
+                    st.info("Fewer than 50 cases match this selection — widen it to fit the model.")
+                else:
+                    nb = next(c for c in narrowed["coefficients"] if c["variable"] == "Black (vs White)")
+                    sig_note = "" if nb["significant"] else " (not significant)"
+                    st.metric(f"Black penalty, FY{ev_range[0]}–FY{ev_range[1]}",
+                              f"{nb['effect']:+.1f} months{sig_note}",
+                              help=f"Same controls as the full model · {narrowed['n_obs']:,} cases · "
+                                   f"R² = {narrowed['r_squared']:.2f} · HC1 robust p = {nb['pvalue']:.4f}")
+
     with tab2:
         st.markdown("### Race Effect by Offense Type (Controlled)")
 
@@ -1326,6 +1326,29 @@ elif page == "🔬 The Evidence":
                 f"sentence compared to White defendants with the same offense, criminal history, and demographics. "
                 f"Women are **{(female_or-1)*100:.0f}% more likely** to receive leniency.")
 
+        if run_leniency_by("Year", df) is not None:
+            st.markdown("#### Black odds ratio by group")
+            lb_by = st.radio("Fit a separate model for each", ["Year", "Offense", "District"], horizontal=True)
+            lb_df = run_leniency_by(lb_by, df)
+            lb_ok = lb_df[lb_df["Status"] == "converged"]
+            if lb_by != "Year":
+                lb_ok = lb_ok.sort_values("Black_OR")
+            fig = go.Figure()
+            fig.add_trace(go.Bar(x=lb_ok[lb_by].astype(str), y=lb_ok["Black_OR"],
+                                 marker_color=["#E45756" if v < 1 else "#4C78A8" for v in lb_ok["Black_OR"]],
+                                 customdata=np.stack([lb_ok["Black_pvalue"], lb_ok["N"]], axis=-1),
+                                 hovertemplate="%{x}<br>OR = %{y:.2f}<br>p = %{customdata[0]:.4f}"
+                                               "<br>%{customdata[1]:,} cases<extra></extra>"))
+            fig.add_hline(y=1, line_color="gray", line_dash="dash")
+            fig.update_layout(yaxis_title="Odds Ratio, Black vs White", height=400, template="plotly_white")
+            st.plotly_chart(fig, width="stretch")
+            lb_skipped = len(lb_df) - len(lb_ok)
+            st.caption(f"One logit per {lb_by.lower()} with robust standard errors, same controls as above "
+                       f"(groups of 200+ cases)."
+                       + (f" {lb_skipped} group(s) left out: the outcome is perfectly predicted there "
+                          f"(separation), its controls are collinear, or the fit did not converge."
+                          if lb_skipped else ""))
+
     st.markdown(FOOTER, unsafe_allow_html=True)
 
 # ══════════════════════════════════════════════════════════════
@@ -1393,8 +1416,8 @@ elif page == "👤 Gender Gap":
         </div>
         """, unsafe_allow_html=True)
 
-        gender_by_off = gender_df.groupby(["Offense", "Sex"])["SENTTOT"].mean().unstack("Sex")
-        counts = gender_df.groupby(["Offense", "Sex"])["SENTTOT"].count().unstack("Sex")
+        gender_by_off = gender_df.groupby(["Offense", "Sex"], observed=True)["SENTTOT"].mean().unstack("Sex")
+        counts = gender_df.groupby(["Offense", "Sex"], observed=True)["SENTTOT"].count().unstack("Sex")
         mask = (counts["Male"] >= 50) & (counts["Female"] >= 50)
         gender_by_off = gender_by_off[mask]
         gender_by_off["Gap"] = gender_by_off["Male"] - gender_by_off["Female"]
@@ -1519,7 +1542,7 @@ elif page == "⚖️ Plea vs Trial":
 
         st.divider()
 
-        plea_stats = plea_df.groupby(["Plea Type", "Race"])["SENTTOT"].agg(["mean", "count"]).reset_index()
+        plea_stats = plea_df.groupby(["Plea Type", "Race"], observed=True)["SENTTOT"].agg(["mean", "count"]).reset_index()
 
         fig = px.bar(plea_stats, x="Plea Type", y="mean", color="Race",
                     color_discrete_map=RACE_COLORS, barmode="group",
@@ -1534,7 +1557,7 @@ elif page == "⚖️ Plea vs Trial":
         how juries decide, or how judges sentence after conviction.""")
 
         st.markdown("### Who Goes to Trial?")
-        trial_rates = plea_df.groupby("Race")["Plea Type"].apply(
+        trial_rates = plea_df.groupby("Race", observed=True)["Plea Type"].apply(
             lambda x: (x == "Trial").mean() * 100).reset_index()
         trial_rates.columns = ["Race", "Trial Rate %"]
 
@@ -1550,7 +1573,7 @@ elif page == "⚖️ Plea vs Trial":
             key="plea_offense")
 
         off_plea = plea_df[plea_df["Offense"] == off_choice]
-        off_stats = off_plea.groupby(["Plea Type", "Race"])["SENTTOT"].agg(["mean", "count"]).reset_index()
+        off_stats = off_plea.groupby(["Plea Type", "Race"], observed=True)["SENTTOT"].agg(["mean", "count"]).reset_index()
         off_stats = off_stats[off_stats["count"] >= 10]
 
         fig3 = px.bar(off_stats, x="Plea Type", y="mean", color="Race",
@@ -1,137 +1,104 @@
 """
 Parse all USSC FY2002-2024 .dat files and combine into one CSV.
+Usage: python build_all_years.py [--workers N] [--max-memory-mb MB]
 """
 import os
-import re
-import zipfile
 import pandas as pd
+import ingest_profile
+import sas_layout
+from dat_reader import read_dat, read_zip
+from ingest import (DAT_YEARS, KEY_VARS, conform, join_csv_parts, map_years, pool_args, print_year_summaries,
+                    write_csv_part, year_source)
 
 DATA_DIR = "data"
+OUT_PATH = os.path.join(DATA_DIR, "combined_fy02_fy24.csv")
 
-KEY_VARS = ["SENTTOT", "NEWRACE", "MONSEX", "AGE", "OFFGUIDE", "DISTRICT",
-            "XMINSOR", "XMAXSOR", "CRIMHIST", "CRIMPTS", "CITIZEN",
-            "NEWEDUC", "WEAPON", "SENTIMP", "DSPLEA", "INOUT", "PRESENT"]
-
-def parse_sas_positions(sas_path):
-    """Extract variable name -> (start, end) from SAS INPUT statement only."""
-    with open(sas_path, 'r', errors='replace') as f:
-        text = f.read()
-    
-    input_match = re.search(r'INPUT\s(.*?);', text, re.DOTALL | re.IGNORECASE)
-    if not input_match:
-        raise ValueError(f"No INPUT section found in {sas_path}")
-    input_text = input_match.group(1)
-    
-    positions = {}
-    for m in re.finditer(r'(\w+)\s+\$?\s*(\d+)-(\d+)', input_text):
-        name = m.group(1).upper()
-        start = int(m.group(2)) - 1
-        end = int(m.group(3))
-        positions[name] = (start, end)
-    
-    for m in re.finditer(r'(\w+)\s+\$?\s*(\d+)(?:\s|$)', input_text):
-        name = m.group(1).upper()
-        pos = int(m.group(2))
-        if name not in positions and pos > 10:
-            positions[name] = (pos - 1, pos)
-    
-    return positions
+COLUMNS = KEY_VARS + ["FISCAL_YEAR"]
 
 # All years FY02-FY23 from .dat files
-YEARS = {}
-for y in range(2, 24):
-    suffix = f"{y:02d}"
-    YEARS[suffix] = f"20{suffix}"
+YEARS = DAT_YEARS
 
-all_frames = []
 
-for suffix, year_label in sorted(YEARS.items()):
-    extract_dir = os.path.join(DATA_DIR, f"sas_fy{suffix}")
-    
-    # Try to find and unzip if not extracted
-    if not os.path.exists(extract_dir):
-        os.makedirs(extract_dir, exist_ok=True)
-        # Handle variant zip names
-        zip_candidates = [
-            os.path.join(DATA_DIR, f"opafy{suffix}nid.zip"),
-            os.path.join(DATA_DIR, f"opafy{suffix}-nid.zip"),
-        ]
-        zip_path = None
-        for zp in zip_candidates:
-            if os.path.exists(zp):
-                zip_path = zp
-                break
-        if zip_path:
-            print(f"Unzipping {zip_path}...")
-            try:
-                with zipfile.ZipFile(zip_path, 'r') as z:
-                    z.extractall(extract_dir)
-            except Exception as e:
-                print(f"  ⚠️  Failed to unzip {year_label}: {e}")
-                continue
-        else:
-            print(f"⚠️  No zip found for FY{year_label}, skipping")
-            continue
-    
-    # Find .sas and .dat files
-    sas_file = None
-    dat_file = None
-    for f in os.listdir(extract_dir):
-        fl = f.lower()
-        if fl.endswith('.sas'):
-            sas_file = os.path.join(extract_dir, f)
-        if fl.endswith('.dat'):
-            dat_file = os.path.join(extract_dir, f)
-    
-    if not sas_file or not dat_file:
-        print(f"⚠️  FY{year_label}: missing .sas or .dat, skipping")
-        continue
+def process_year(suffix, year_label, profile=None):
+    """Parse one fiscal year (extracted dir or zip), profiling it as it decodes; returns a DataFrame, or None to skip."""
+    source = year_source(suffix, year_label)
+    if source is None:
+        return None
+    sas_file, dat_file, zip_path = source
     
     print(f"Processing FY{year_label}...")
     
     try:
-        positions = parse_sas_positions(sas_file)
+        layout = sas_layout.year_layout(year_label, zip_path or sas_file)
     except Exception as e:
         print(f"  ⚠️  SAS parse failed: {e}")
-        continue
+        return None
     
-    available = {v: positions[v] for v in KEY_VARS if v in positions}
-    missing = [v for v in KEY_VARS if v not in positions]
+    available, _, missing = sas_layout.resolve(layout, KEY_VARS)
     if missing:
         print(f"  Missing vars: {missing}")
     
     print(f"  Found {len(available)}/{len(KEY_VARS)} key variables")
     
-    colspecs = [(pos[0], pos[1]) for pos in available.values()]
-    names = list(available.keys())
-    
     try:
-        df = pd.read_fwf(dat_file, colspecs=colspecs, names=names,
-                          na_values=['.', ' .', '  .', '   .'])
+        df = (read_zip(zip_path, available, profile=profile) if zip_path
+              else read_dat(dat_file, available, profile=profile))
         df["FISCAL_YEAR"] = int(year_label)
-        all_frames.append(df)
         print(f"  → {len(df):,} cases")
+        return df
     except Exception as e:
         print(f"  ❌ Failed to read: {e}")
-        continue
+        return None
+
+
+def csv_year(suffix, year_label):
+    """Parse one year and write it to its own CSV part; returns (part path, summary, profile)."""
+    profile = ingest_profile.new()
+    df = process_year(suffix, year_label, profile)
+    if df is None:
+        return None
+    df = conform(df, COLUMNS)
+    return (write_csv_part(df, OUT_PATH, year_label), ingest_profile.year_summary(profile, KEY_VARS),
+            ingest_profile.summarize(profile, KEY_VARS))
+
+
+def main():
+    args = pool_args()
+    parts, summaries, profiles = [], {}, {}
+    
+    # Years run in parallel, each writing its own part; results come back in year order
+    for (_, year_label), result in map_years(csv_year, sorted(YEARS.items()),
+                                             workers=args.workers, max_memory_mb=args.max_memory_mb):
+        if result is not None:
+            parts.append(result[0])
+            summaries[year_label] = result[1]
+            profiles[year_label] = result[2]
+    
+    # Add FY2024 from slim CSV
+    slim_path = os.path.join(DATA_DIR, "individual_fy24", "slim.csv")
+    if os.path.exists(slim_path):
+        print("Loading FY2024 from slim CSV...")
+        df24 = pd.read_csv(slim_path, low_memory=False)
+        profile = ingest_profile.update(ingest_profile.new(), df24[[c for c in KEY_VARS if c in df24]])
+        df24["FISCAL_YEAR"] = 2024
+        df24 = conform(df24, COLUMNS)
+        parts.append(write_csv_part(df24, OUT_PATH, "2024"))
+        summaries["2024"] = ingest_profile.year_summary(profile, KEY_VARS)
+        profiles["2024"] = ingest_profile.summarize(profile, KEY_VARS)
+        print(f"  → {len(df24):,} cases")
+        del df24
 
-# Add FY2024 from slim CSV
-slim_path = os.path.join(DATA_DIR, "individual_fy24", "slim.csv")
-if os.path.exists(slim_path):
-    print("Loading FY2024 from slim CSV...")
-    df24 = pd.read_csv(slim_path, low_memory=False)
-    df24["FISCAL_YEAR"] = 2024
-    all_frames.append(df24)
-    print(f"  → {len(df24):,} cases")
+    if not parts:
+        print("❌ No data loaded!")
+        return
 
-print(f"\nCombining {len(all_frames)} years...")
-combined = pd.concat(all_frames, ignore_index=True)
-print(f"Total: {len(combined):,} cases across {combined['FISCAL_YEAR'].nunique()} years")
+    print(f"\nCombining {len(parts)} years...")
+    join_csv_parts(parts, OUT_PATH)
+    print_year_summaries(summaries)
+    ingest_profile.save(profiles)
+    ingest_profile.print_drift(profiles)
+    print(f"\n✅ Saved to {OUT_PATH} ({os.path.getsize(OUT_PATH)/1024/1024:.1f} MB)")
 
-for year in sorted(combined["FISCAL_YEAR"].unique()):
-    n = len(combined[combined["FISCAL_YEAR"] == year])
-    print(f"  {int(year)}: {n:,} cases")
 
-out_path = os.path.join(DATA_DIR, "combined_fy02_fy24.csv")
-combined.to_csv(out_path, index=False)
-print(f"\n✅ Saved to {out_path} ({os.path.getsize(out_path)/1024/1024:.1f} MB)")
+if __name__ == "__main__":
+    main()
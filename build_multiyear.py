@@ -2,29 +2,33 @@
 Justice Index — Multi-Year Data Builder
 Reads SAS (.sas7bdat) files from USSC FY2019-2024, extracts key columns,
 and produces a single combined slim CSV for analysis.
+Only the key columns are read, in row chunks spread across worker processes.
+Usage: python build_multiyear.py [--workers N]
 """
 import os
 import glob
 import zipfile
 import pandas as pd
 import pyreadstat
+import ingest_profile
+from ingest import KEY_VARS, conform, join_csv_parts, pool_args, print_year_summaries, write_csv_part
 
 DATA_DIR = "data"
 OUT_FILE = "data/combined_fy19_fy24.csv"
 
-KEY_COLS = [
-    "DISTRICT", "OFFGUIDE", "SENTTOT", "SENTIMP",
-    "XMINSOR", "XMAXSOR", "NEWRACE", "MONSEX", "AGE",
-    "CITIZEN", "NEWEDUC", "CRIMHIST", "CRIMPTS", "WEAPON",
-    "DSPLEA", "INOUT", "PRESENT",
-]
-
 YEARS = {
     "19": "FY2019", "20": "FY2020", "21": "FY2021",
     "22": "FY2022", "23": "FY2023", "24": "FY2024",
 }
 
-all_frames = []
+COLUMNS = KEY_VARS + ["FISCAL_YEAR"]
+
+# Rows per chunk; with ~17 columns a chunk is a few MB whatever the file's width
+CHUNK_ROWS = 100_000
+READERS = {".sas7bdat": pyreadstat.read_sas7bdat, ".sav": pyreadstat.read_sav}
+
+args = pool_args()
+parts, summaries, profiles = [], {}, {}
 
 for suffix, label in sorted(YEARS.items()):
     # FY2024 already has a CSV slim file
@@ -33,9 +37,14 @@ for suffix, label in sorted(YEARS.items()):
         if os.path.exists(slim_path):
             print(f"Loading {label} from existing slim CSV...")
             df = pd.read_csv(slim_path, low_memory=False)
+            profile = ingest_profile.update(ingest_profile.new(), df[[c for c in KEY_VARS if c in df]])
             df["FISCAL_YEAR"] = int(f"20{suffix}")
-            all_frames.append(df)
+            df = conform(df, COLUMNS)
+            parts.append(write_csv_part(df, OUT_FILE, suffix))
+            summaries[f"20{suffix}"] = ingest_profile.year_summary(profile, KEY_VARS)
+            profiles[f"20{suffix}"] = ingest_profile.summarize(profile, KEY_VARS)
             print(f"  → {len(df):,} cases")
+            del df
             continue
 
     zip_path = os.path.join(DATA_DIR, f"opafy{suffix}nid.zip")
@@ -71,45 +80,51 @@ for suffix, label in sorted(YEARS.items()):
     ext = os.path.splitext(sas_file)[1].lower()
     print(f"  Reading {os.path.basename(sas_file)}...")
     
+    read = READERS.get(ext)
+    if read is None:
+        print(f"  ⚠️  Unknown format: {ext}")
+        continue
+
     try:
-        if ext == ".sas7bdat":
-            df, meta = pyreadstat.read_sas7bdat(sas_file, usecols=[c for c in KEY_COLS])
-        elif ext == ".sav":
-            df, meta = pyreadstat.read_sav(sas_file, usecols=[c for c in KEY_COLS])
-        else:
-            print(f"  ⚠️  Unknown format: {ext}")
-            continue
+        # Column names come from the header alone, so usecols always matches (any case)
+        _, meta = read(sas_file, metadataonly=True)
+        names = {c.upper(): c for c in meta.column_names}
+        usecols = [names[v] for v in KEY_VARS if v in names]
+        print(f"  {len(usecols)}/{len(KEY_VARS)} key variables of {len(meta.column_names):,} columns")
+
+        # Row chunks of just those columns, decoded across worker processes and
+        # appended to the year's part file as they arrive
+        part, profile = None, ingest_profile.new()
+        for chunk, _ in pyreadstat.read_file_in_chunks(
+                read, sas_file, chunksize=CHUNK_ROWS, usecols=usecols,
+                multiprocess=args.workers > 1, num_processes=args.workers):
+            chunk = chunk.rename(columns=str.upper)
+            ingest_profile.update(profile, chunk)
+            chunk["FISCAL_YEAR"] = int(f"20{suffix}")
+            chunk = conform(chunk, COLUMNS)
+            part = write_csv_part(chunk, OUT_FILE, suffix, append=part is not None)
     except Exception as e:
-        # If usecols fails (column names differ), read all and filter
-        print(f"  Trying full read (column mismatch)...")
-        try:
-            if ext == ".sas7bdat":
-                df, meta = pyreadstat.read_sas7bdat(sas_file)
-            else:
-                df, meta = pyreadstat.read_sav(sas_file)
-            available = [c for c in KEY_COLS if c in df.columns]
-            df = df[available]
-        except Exception as e2:
-            print(f"  ❌ Failed to read {label}: {e2}")
-            continue
-    
-    df["FISCAL_YEAR"] = int(f"20{suffix}")
-    all_frames.append(df)
-    print(f"  → {len(df):,} cases, {len(df.columns)} columns")
+        print(f"  ❌ Failed to read {label}: {e}")
+        continue
+
+    if part is None:
+        print(f"  ⚠️  {label}: no rows")
+        continue
+    parts.append(part)
+    summaries[f"20{suffix}"] = ingest_profile.year_summary(profile, KEY_VARS)
+    profiles[f"20{suffix}"] = ingest_profile.summarize(profile, KEY_VARS)
+    print(f"  → {profile['rows']:,} cases")
 
-if not all_frames:
+if not parts:
     print("❌ No data loaded!")
     exit(1)
 
-print(f"\nCombining {len(all_frames)} years...")
-combined = pd.concat(all_frames, ignore_index=True)
-print(f"Total: {len(combined):,} cases across {combined['FISCAL_YEAR'].nunique()} years")
-print(f"Years: {sorted(combined['FISCAL_YEAR'].unique())}")
+print(f"\nCombining {len(parts)} years...")
+join_csv_parts(parts, OUT_FILE)
 
 # Quick sanity check
-for year in sorted(combined["FISCAL_YEAR"].unique()):
-    n = len(combined[combined["FISCAL_YEAR"] == year])
-    print(f"  {year}: {n:,} cases")
+print_year_summaries(summaries)
+ingest_profile.save(profiles)
+ingest_profile.print_drift(profiles)
 
-combined.to_csv(OUT_FILE, index=False)
 print(f"\n✅ Saved to {OUT_FILE} ({os.path.getsize(OUT_FILE)/1024/1024:.1f} MB)")
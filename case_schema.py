@@ -0,0 +1,119 @@
+"""
+Compact in-memory schema for the combined USSC case table.
+Coded variables are nullable Int8/Int16 instead of float64, and the label
+columns app.py / precompute.py derive (Race, Offense, District Name, ...) are
+categoricals over shared dictionaries instead of one string per row.
+
+Usage: python case_schema.py   # memory report for the stored case table
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+from districts import DISTRICT_MAP
+
+# Coded USSC variables → smallest nullable integer that holds every valid code
+# (XMINSOR/XMAXSOR use 9996-9999 as life/missing sentinels, hence Int16)
+CASE_DTYPES = {
+    "NEWRACE": "Int8", "MONSEX": "Int8", "AGE": "Int8", "OFFGUIDE": "Int8",
+    "DISTRICT": "Int8", "XMINSOR": "Int16", "XMAXSOR": "Int16",
+    "CRIMHIST": "Int8", "CRIMPTS": "Int8", "CITIZEN": "Int8", "NEWEDUC": "Int8",
+    "WEAPON": "Int8", "SENTIMP": "Int8", "DSPLEA": "Int8", "INOUT": "Int8",
+    "PRESENT": "Int8", "FISCAL_YEAR": "int16",
+}
+
+# Label dictionaries are sorted so grouping and sorting order match plain strings
+LABEL_DTYPES = {
+    "Race": pd.CategoricalDtype(["Black", "Hispanic", "White"]),
+    "Sex": pd.CategoricalDtype(["Female", "Male"]),
+    "Plea Type": pd.CategoricalDtype(["Plea Deal", "Straight Plea", "Trial"]),
+    "Offense": pd.CategoricalDtype(sorted([
+        "Admin of Justice", "Antitrust", "Arson", "Assault", "Bribery/Corruption",
+        "Burglary/Trespass", "Child Pornography", "Commercialized Vice", "Drug Possession",
+        "Drug Trafficking", "Environmental", "Extortion/Racketeering", "Firearms",
+        "Food & Drug", "Forgery/Counterfeiting", "Fraud/Theft/Embezzlement", "Immigration",
+        "Individual Rights", "Kidnapping", "Manslaughter", "Money Laundering", "Murder",
+        "National Defense", "Obscenity/Sex Offenses", "Prison Offenses", "Robbery",
+        "Sexual Abuse", "Stalking/Harassment", "Tax", "Other",
+    ])),
+    "District Name": pd.CategoricalDtype(sorted(set(DISTRICT_MAP.values()))),
+}
+
+
+def _fits(values, dtype):
+    """True if every non-null value is a whole number inside dtype's range."""
+    info = np.iinfo(dtype.lower())
+    v = values.dropna().to_numpy(dtype="float64")
+    return bool(np.all((v == np.floor(v)) & (v >= info.min) & (v <= info.max)))
+
+
+def apply_schema(df):
+    """
+    Cast coded columns to CASE_DTYPES in place and return df. A column whose
+    values don't fit its declared type (fractions, out-of-range codes) is kept
+    as float64 with a warning rather than silently truncated.
+    """
+    for col, dtype in CASE_DTYPES.items():
+        if col not in df.columns or df[col].dtype == dtype:
+            continue
+        values = pd.to_numeric(df[col], errors="coerce")
+        if _fits(values, dtype):
+            df[col] = values.astype(dtype)
+        else:
+            print(f"⚠️  {col} doesn't fit {dtype}, keeping float64")
+            df[col] = values.astype("float64")
+    return df
+
+
+def to_category(series, name):
+    """Cast a label column to its shared dtype, adding any labels the dictionary lacks."""
+    dtype = LABEL_DTYPES[name]
+    extra = set(series.dropna().unique()) - set(dtype.categories)
+    if extra:
+        dtype = pd.CategoricalDtype(sorted(set(dtype.categories) | extra))
+    return series.astype(dtype)
+
+
+def categorize(df):
+    """Cast every label column present in df to its shared categorical dtype, in place."""
+    for name in LABEL_DTYPES:
+        if name in df.columns:
+            df[name] = to_category(df[name], name)
+    return df
+
+
+def _legacy_bytes(col):
+    """Bytes the column took before the schema: float64 numbers, Python strings for labels."""
+    if col.name in LABEL_DTYPES:
+        counts = col.value_counts()
+        strings = sum(int(n) * sys.getsizeof(label) for label, n in counts.items())
+        return 8 * len(col) + strings + sys.getsizeof(np.nan) * int(col.isna().sum())
+    if col.name in CASE_DTYPES:
+        return 8 * len(col)
+    return col.memory_usage(deep=True, index=False)
+
+
+def memory_report(df):
+    """Print per-column and total memory for df against its float64/object equivalent."""
+    rows = []
+    for name in df.columns:
+        rows.append((name, str(df[name].dtype), _legacy_bytes(df[name]),
+                     df[name].memory_usage(deep=True, index=False)))
+    print(f"  {'column':<16} {'dtype':<10} {'before':>10} {'after':>10}")
+    for name, dtype, before, after in rows:
+        print(f"  {name:<16} {dtype[:10]:<10} {before/1e6:>8.1f}MB {after/1e6:>8.1f}MB")
+    before = sum(r[2] for r in rows)
+    after = sum(r[3] for r in rows)
+    print(f"  {'total':<27} {before/1e6:>8.1f}MB {after/1e6:>8.1f}MB ({before/max(after, 1):.1f}× smaller)")
+
+
+def main():
+    import case_store
+    print("Loading case table...")
+    df = case_store.read_store() if case_store.exists() else pd.read_csv(case_store.CSV_PATH, low_memory=False)
+    memory_report(apply_schema(df))
+
+
+if __name__ == "__main__":
+    main()
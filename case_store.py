@@ -0,0 +1,176 @@
+"""
+Year-partitioned Parquet store for the combined USSC case table.
+Replaces data/combined_all_years.csv with a hive-partitioned dataset:
+
+    data/combined_all_years.parquet/FISCAL_YEAR=2015/part-0.parquet
+
+Columns are written with case_schema's compact types and zstd-compressed, and readers only pull the
+columns and fiscal years (partitions) they ask for, with other predicates
+pushed down to Parquet row-group statistics.
+
+Usage: python case_store.py [combined_all_years.csv]   # convert an existing CSV
+"""
+import os
+import sys
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from case_schema import CASE_DTYPES, apply_schema
+
+STORE_PATH = os.path.join(os.path.dirname(__file__), "data", "combined_all_years.parquet")
+CSV_PATH = os.path.join(os.path.dirname(__file__), "data", "combined_all_years.csv")
+
+YEAR_COL = "FISCAL_YEAR"
+_NULLABLE = {pa.int8(): pd.Int8Dtype(), pa.int16(): pd.Int16Dtype()}
+_PARTITIONING = ds.partitioning(pa.schema([(YEAR_COL, pa.int16())]), flavor="hive")
+
+# Columns the app and precompute use, and the validity filter they both apply
+ANALYSIS_COLUMNS = ["SENTTOT", "NEWRACE", "MONSEX", "AGE", "OFFGUIDE", "DISTRICT",
+                    "XMINSOR", "CRIMHIST", "CRIMPTS", "CITIZEN", "NEWEDUC", "WEAPON",
+                    "DSPLEA", "INOUT", "PRESENT"]
+VALID_FILTERS = [("SENTTOT", ">=", 0), ("SENTTOT", "<", 470), ("NEWRACE", "in", [1, 2, 3]),
+                 ("XMINSOR", ">=", 0), ("XMINSOR", "<", 9996),
+                 ("CRIMPTS", ">=", 0), ("AGE", ">", 0)]
+
+
+def exists(path=STORE_PATH):
+    return os.path.isdir(path) and any(d.startswith(f"{YEAR_COL}=") for d in os.listdir(path))
+
+
+def _to_table(df):
+    """Arrow table typed by case_schema (int8/int16 codes, NaN → null); other columns float64."""
+    cols = {c: pd.to_numeric(df[c], errors="coerce") for c in df.columns}
+    cols = apply_schema(pd.DataFrame(cols))
+    for c in cols.columns:
+        if c not in CASE_DTYPES:
+            cols[c] = cols[c].astype("float64")
+    return pa.Table.from_pandas(cols, preserve_index=False)
+
+
+def write_store(df, path=STORE_PATH):
+    """
+    Write df (which must have FISCAL_YEAR) into the store.
+    Only the years present in df are replaced; other partitions are left alone.
+    """
+    ds.write_dataset(
+        _to_table(df), path, format="parquet", partitioning=_PARTITIONING,
+        existing_data_behavior="delete_matching",
+        basename_template="part-{i}.parquet",
+        preserve_order=True,  # rows stay in .dat record order, which add_columns relies on
+        file_options=ds.ParquetFileFormat().make_write_options(compression="zstd"),
+    )
+
+
+def append_store(df, path=STORE_PATH):
+    """
+    Add df's rows (which must have FISCAL_YEAR) after those already stored: each
+    year in df gets one more part file, so a year can be written chunk by chunk.
+    """
+    for year, rows in df.groupby(YEAR_COL, sort=True):
+        part_dir = partition_path(year, path)
+        os.makedirs(part_dir, exist_ok=True)
+        files = _part_files(part_dir)
+        n = int(os.path.basename(files[-1])[5:-8]) + 1 if files else 0
+        pq.write_table(_to_table(rows.drop(columns=YEAR_COL)), os.path.join(part_dir, f"part-{n}.parquet"),
+                       compression="zstd")
+
+
+def partition_path(year, path=STORE_PATH):
+    return os.path.join(path, f"{YEAR_COL}={int(year)}")
+
+
+def _part_files(part_dir):
+    parts = [f for f in os.listdir(part_dir) if f.startswith("part-") and f.endswith(".parquet")]
+    return [os.path.join(part_dir, f) for f in sorted(parts, key=lambda f: int(f[5:-8]))]
+
+
+def add_columns(year, cols, path=STORE_PATH):
+    """
+    Add (or replace) columns in one year's partition. cols must have one row per
+    stored case, in stored (record) order. Parquet files can't grow a column in
+    place, so the partition is rewritten as a single file.
+    """
+    part_dir = partition_path(year, path)
+    files = _part_files(part_dir)
+    table = pa.concat_tables([pq.read_table(f) for f in files])
+    if table.num_rows != len(cols):
+        raise ValueError(f"FY{year}: {len(cols):,} values for {table.num_rows:,} stored cases")
+    new = _to_table(cols)
+    for name in new.column_names:
+        if name in table.column_names:
+            table = table.drop_columns([name])
+        table = table.append_column(new.schema.field(name), new.column(name))
+    tmp = os.path.join(part_dir, ".part-0.parquet.tmp")
+    pq.write_table(table, tmp, compression="zstd")
+    for f in files:
+        os.remove(f)
+    os.replace(tmp, os.path.join(part_dir, "part-0.parquet"))
+
+
+def store_size_mb(path=STORE_PATH):
+    return sum(os.path.getsize(os.path.join(r, f)) for r, _, fs in os.walk(path) for f in fs) / 1024 / 1024
+
+
+def _dataset(path):
+    return ds.dataset(path, format="parquet", partitioning=_PARTITIONING)
+
+
+def store_years(path=STORE_PATH):
+    """Sorted fiscal years present in the store."""
+    if not exists(path):
+        return []
+    return sorted(int(d.split("=", 1)[1]) for d in os.listdir(path) if d.startswith(f"{YEAR_COL}="))
+
+
+def _scan(years, filters, columns, path):
+    """(dataset, filter expression, columns) for read_store and iter_store."""
+    dataset = _dataset(path)
+    expr = None
+    if years is not None:
+        expr = (ds.field(YEAR_COL) >= years[0]) & (ds.field(YEAR_COL) <= years[1])
+    if filters:
+        extra = pq.filters_to_expression(filters)
+        expr = extra if expr is None else expr & extra
+    if columns is not None:
+        columns = [c for c in columns if c != YEAR_COL and c in dataset.schema.names] + [YEAR_COL]
+    return dataset, expr, columns
+
+
+def read_store(columns=None, years=None, filters=None, path=STORE_PATH):
+    """
+    Load the case table.
+      columns: list of columns to read (None = all). FISCAL_YEAR is always included.
+      years:   (min_year, max_year) inclusive; prunes whole partitions.
+      filters: extra predicates in pandas/pyarrow DNF form, e.g. [('SENTTOT', '<', 470)].
+    """
+    dataset, expr, columns = _scan(years, filters, columns, path)
+    return dataset.to_table(columns=columns, filter=expr).to_pandas(types_mapper=_NULLABLE.get)
+
+
+def iter_store(columns=None, years=None, filters=None, batch_rows=250_000, path=STORE_PATH):
+    """
+    read_store as a stream of DataFrames of at most batch_rows rows, in store order.
+    Batches are decoded one at a time (no read-ahead), so memory is bounded by
+    the batch size and a row group, not by the size of the table.
+    """
+    dataset, expr, columns = _scan(years, filters, columns, path)
+    scanner = ds.Scanner.from_dataset(dataset, columns=columns, filter=expr, batch_size=batch_rows,
+                                      batch_readahead=0, fragment_readahead=0)
+    for batch in scanner.to_batches():
+        if batch.num_rows:
+            yield batch.to_pandas(types_mapper=_NULLABLE.get)
+
+
+def main():
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else CSV_PATH
+    print(f"Converting {csv_path}...")
+    df = pd.read_csv(csv_path, low_memory=False)
+    write_store(df)
+    print(f"✅ Saved {len(df):,} cases across {df[YEAR_COL].nunique()} years to {STORE_PATH} ({store_size_mb():.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
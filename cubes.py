@@ -0,0 +1,539 @@
+"""
+Summary cubes for the descriptive sections of precomputed.json.
+Instead of a row-level table, cases are folded into:
+
+    cells   count / sum / sum of squares of SENTTOT, below-guideline count and
+            first row position per (year, offense, crim-history band, race,
+            sex, district, plea type) cell
+    hists   SENTTOT value counts over a few coarser groupings, so medians are exact
+
+describe() builds every descriptive section from the cubes alone. precompute.py
+builds them from its case table; this script builds them while the .dat records
+are decoded, one chunk at a time, so no combined table ever exists:
+
+    python cubes.py [--workers N]   # refresh the descriptive sections of data/precomputed.json
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from analysis_table import CRIM_HISTORY_LABELS, clean
+from case_schema import LABEL_DTYPES, to_category
+from districts import DISTRICT_MAP
+from ingest import DAT_YEARS, KEY_VARS, conform, map_years, pool_args, year_source
+
+CUBES_DIR = os.path.join("data", "cubes")
+PRECOMPUTED_PATH = os.path.join("data", "precomputed.json")
+
+RACES = ["White", "Black", "Hispanic"]
+CH_LEVELS = ["All levels"] + CRIM_HISTORY_LABELS
+LOTTERY_OFFENSES = ["Drug Trafficking", "Firearms", "Fraud/Theft/Embezzlement", "Robbery"]
+
+# Cell dimensions; labels are stored as codes into these fixed dictionaries (-1 = missing)
+LABELS = {
+    "Offense": list(LABEL_DTYPES["Offense"].categories),
+    "Crim History": CRIM_HISTORY_LABELS,
+    "Race": list(LABEL_DTYPES["Race"].categories),
+    "Sex": list(LABEL_DTYPES["Sex"].categories),
+    "Plea Type": list(LABEL_DTYPES["Plea Type"].categories),
+}
+DIMS = ["Year", "Offense", "Crim History", "Race", "Sex", "DISTRICT", "Plea Type"]
+MEASURES = {"n": "sum", "sum": "sum", "sumsq": "sum", "below": "sum", "first": "min"}
+
+# Groupings that need exact medians
+HISTS = {
+    "year_offense_ch_race": ["Year", "Offense", "Crim History", "Race"],
+    "district_offense": ["DISTRICT", "Offense"],
+    "district_race": ["DISTRICT", "Race"],
+}
+
+
+# ── Building ──────────────────────────────────────────────────
+
+def _codes(df):
+    """Cleaned case table → integer dimension columns plus SENTTOT and the below flag."""
+    out = pd.DataFrame({"Year": df["Year"].to_numpy("int64"),
+                        "DISTRICT": df["DISTRICT"].to_numpy("int64")})
+    for name, labels in LABELS.items():
+        out[name] = pd.Categorical(df[name].astype(object), categories=labels).codes.astype("int64")
+    out["SENTTOT"] = df["SENTTOT"].to_numpy("float64")
+    out["below"] = df["Below Guideline"].to_numpy("int64")
+    return out
+
+
+def aggregate(df, offset=0):
+    """Cubes for one cleaned frame; row positions in `first` start at offset."""
+    c = _codes(df)
+    c["sumsq"] = c["SENTTOT"] ** 2
+    c["first"] = np.arange(offset, offset + len(c))
+    cells = c.groupby(DIMS, sort=False).agg(
+        n=("SENTTOT", "size"), sum=("SENTTOT", "sum"), sumsq=("sumsq", "sum"),
+        below=("below", "sum"), first=("first", "min")).reset_index()
+    hists = {name: c.groupby(by + ["SENTTOT"], sort=False).size().rename("n").reset_index()
+             for name, by in HISTS.items()}
+    return {"cells": cells, "hists": hists, "rows": len(c)}
+
+
+def merge(parts):
+    """Fold cubes from several chunks (in row order, `first` already offset) into one."""
+    parts = [p for p in parts if p is not None]
+    cells = pd.concat([p["cells"] for p in parts], ignore_index=True)
+    cells = cells.groupby(DIMS, sort=True).agg(MEASURES).reset_index()
+    hists = {}
+    for name, by in HISTS.items():
+        h = pd.concat([p["hists"][name] for p in parts], ignore_index=True)
+        hists[name] = h.groupby(by + ["SENTTOT"], sort=True)["n"].sum().reset_index()
+    return {"cells": cells, "hists": hists, "rows": sum(p["rows"] for p in parts)}
+
+
+def _shift(cube, offset):
+    cube["cells"]["first"] += offset
+    return cube
+
+
+def from_frame(df):
+    """Cubes for an already-cleaned case table (analysis_table.load())."""
+    return merge([aggregate(df)])
+
+
+def save(cube, path=CUBES_DIR):
+    os.makedirs(path, exist_ok=True)
+    cube["cells"].to_parquet(os.path.join(path, "cells.parquet"), index=False)
+    for name, h in cube["hists"].items():
+        h.to_parquet(os.path.join(path, f"hist_{name}.parquet"), index=False)
+
+
+def load(path=CUBES_DIR):
+    cells = pd.read_parquet(os.path.join(path, "cells.parquet"))
+    hists = {name: pd.read_parquet(os.path.join(path, f"hist_{name}.parquet")) for name in HISTS}
+    return {"cells": cells, "hists": hists, "rows": int(cells["n"].sum())}
+
+
+# ── Queries ───────────────────────────────────────────────────
+
+def _labelled(frame):
+    """Codes → categorical labels (missing → NaN), same dictionaries as the case table."""
+    frame = frame.copy()
+    for name, labels in LABELS.items():
+        if name in frame.columns:
+            frame[name] = pd.Categorical.from_codes(frame[name], categories=labels)
+    return frame
+
+
+def stats(cells, by):
+    """n, mean, std, below rate and first row per group of cells (groups sorted by `by`)."""
+    g = cells.groupby(by, observed=True, sort=True).agg(MEASURES) if by else cells.agg(MEASURES).to_frame().T
+    g["mean"] = g["sum"] / g["n"]
+    var = (g["sumsq"] - g["sum"] ** 2 / g["n"]) / (g["n"] - 1)
+    g["std"] = np.sqrt(var.clip(lower=0)).where(g["n"] > 1)
+    g["below_rate"] = g["below"] / g["n"]
+    return g
+
+
+def medians(hist, by):
+    """Exact SENTTOT median per group, from value counts (same as Series.median)."""
+    h = hist.groupby(by + ["SENTTOT"], observed=True, sort=True)["n"].sum().reset_index()
+    key = h[by] if by else pd.Series(0, index=h.index)
+    grp = h.groupby([key[c] for c in by] if by else key, sort=False)["n"]
+    total, cum = grp.transform("sum"), grp.cumsum()
+    prev = cum - h["n"]
+    lo = h[(prev <= (total - 1) // 2) & ((total - 1) // 2 < cum)]
+    hi = h[(prev <= total // 2) & (total // 2 < cum)]
+    if not by:
+        return float((lo["SENTTOT"].iloc[0] + hi["SENTTOT"].iloc[0]) / 2)
+    lo = lo.set_index(by)["SENTTOT"]
+    hi = hi.set_index(by)["SENTTOT"]
+    return (lo + hi) / 2
+
+
+def _safe(v):
+    """Convert numpy types to JSON-safe Python types."""
+    if isinstance(v, (np.integer,)):
+        return int(v)
+    if isinstance(v, (np.floating,)):
+        return round(float(v), 4)
+    if isinstance(v, (np.bool_,)):
+        return bool(v)
+    if pd.isna(v):
+        return None
+    return v
+
+
+def _district_name(code):
+    return DISTRICT_MAP.get(int(code), str(int(code)))
+
+
+def describe(cube):
+    """Every descriptive section of precomputed.json, from cubes alone."""
+    cells = _labelled(cube["cells"])
+    hists = {name: _labelled(h) for name, h in cube["hists"].items()}
+    h_cell, h_dist_off, h_dist_race = (hists["year_offense_ch_race"], hists["district_offense"],
+                                       hists["district_race"])
+    results = {}
+    total = stats(cells, []).iloc[0]
+    by_race = stats(cells, ["Race"])
+    years = sorted(int(y) for y in cells["Year"].unique())
+
+    # ── Summary stats ──
+    print("Computing summary stats...")
+    # Districts in order of first appearance, then by name (as drop_duplicates + a stable sort would give)
+    districts = [int(d) for d in stats(cells, ["DISTRICT"]).sort_values("first").index]
+    results['summary'] = {
+        'total_cases': int(total["n"]),
+        'year_min': years[0],
+        'year_max': years[-1],
+        'years': years,
+        'all_offenses': sorted(cells["Offense"].dropna().unique().tolist()),
+        'all_districts': sorted([{'code': code, 'name': _district_name(code)} for code in districts],
+                                key=lambda x: x['name']),
+        'crim_history_levels': CRIM_HISTORY_LABELS,
+        'national_avg_sentence': _safe(total["mean"]),
+        'national_median_sentence': _safe(medians(h_dist_race, [])),
+        'national_below_guideline': _safe(total["below_rate"] * 100),
+        'national_race_avg': {race: _safe(by_race["mean"].get(race, np.nan)) for race in RACES},
+        'n_black': int(by_race["n"].get("Black", 0)),
+    }
+
+    # ── Page: Same Crime Different Time ──
+    # Offense × race × crim_history stats, with yearly breakdown
+    print("Computing Same Crime Different Time stats...")
+    same_crime = {}
+    by_off = {
+        "all": (stats(cells, ["Offense", "Race"]), medians(h_cell, ["Offense", "Race"])),
+        "ch": (stats(cells, ["Offense", "Crim History", "Race"]),
+               medians(h_cell, ["Offense", "Crim History", "Race"])),
+    }
+    by_year = {
+        "all": (stats(cells, ["Offense", "Year", "Race"]), medians(h_cell, ["Offense", "Year", "Race"])),
+        "ch": (stats(cells, ["Offense", "Crim History", "Year", "Race"]),
+               medians(h_cell, ["Offense", "Crim History", "Year", "Race"])),
+    }
+    off_totals = stats(cells, ["Offense"])
+    ch_totals = stats(cells, ["Offense", "Crim History"])
+    ch_years = stats(cells, ["Offense", "Crim History", "Year"])
+    all_years = stats(cells, ["Offense", "Year"])
+    # Offenses in order of first appearance, as df['Offense'].unique() would give
+    for offense in off_totals.sort_values("first").index:
+        same_crime[offense] = {}
+        for ch in CH_LEVELS:
+            key = () if ch == "All levels" else (ch,)
+            kind = "all" if ch == "All levels" else "ch"
+            st, med = by_off[kind]
+            n_subset = off_totals.loc[offense, "n"] if ch == "All levels" else (
+                ch_totals["n"].get((offense, ch), 0))
+
+            race_stats = {}
+            below_rates = {}
+            for race in RACES:
+                idx = (offense, *key, race)
+                if idx not in st.index:
+                    continue
+                row = st.loc[idx]
+                race_stats[race] = {
+                    'mean': _safe(row["mean"]),
+                    'median': _safe(med.loc[idx]),
+                    'count': int(row["n"]),
+                    'std': _safe(row["std"]),
+                }
+                below_rates[race] = _safe(row["below_rate"] * 100)
+
+            yearly = {}
+            yst, ymed = by_year[kind]
+            present = all_years if ch == "All levels" else ch_years
+            for year in years:
+                if (offense, *key, year) not in present.index:
+                    continue
+                yearly[str(year)] = {}
+                for race in RACES:
+                    idx = (offense, *key, year, race)
+                    if idx not in yst.index:
+                        continue
+                    row = yst.loc[idx]
+                    yearly[str(year)][race] = {
+                        'mean': _safe(row["mean"]),
+                        'median': _safe(ymed.loc[idx]),
+                        'count': int(row["n"]),
+                        'std': _safe(row["std"]),
+                        'below_rate': _safe(row["below_rate"] * 100),
+                    }
+
+            same_crime[offense][ch] = {
+                'race_stats': race_stats,
+                'below_rates': below_rates,
+                'yearly': yearly,
+                'total_count': int(n_subset),
+            }
+    results['same_crime'] = same_crime
+
+    # ── Page: The Lottery ──
+    print("Computing Lottery (district) stats...")
+    lottery = {}
+    dist_off = stats(cells, ["Offense", "DISTRICT"])
+    dist_off_med = medians(h_dist_off, ["Offense", "DISTRICT"])
+    dist_off_race = stats(cells, ["Offense", "DISTRICT", "Race"])
+    for offense in LOTTERY_OFFENSES:
+        dist_list = []
+        if offense in dist_off.index.get_level_values(0):
+            for dist_code, row in dist_off.loc[offense].iterrows():
+                if row["n"] < 10:
+                    continue
+                dist_list.append({
+                    'district_code': int(dist_code),
+                    'district_name': _district_name(dist_code),
+                    'avg': _safe(row["mean"]),
+                    'med': _safe(dist_off_med.loc[(offense, dist_code)]),
+                    'n': int(row["n"]),
+                    'below': _safe(row["below_rate"] * 100),
+                })
+        dist_list.sort(key=lambda x: x['avg'], reverse=True)
+
+        # Black-White gap by district
+        bw_gaps = []
+        if offense in dist_off_race.index.get_level_values(0):
+            for dist_code, grp in dist_off_race.loc[offense].groupby(level=0):
+                grp = grp.droplevel(0)
+                if "Black" not in grp.index or "White" not in grp.index:
+                    continue
+                b, w = grp.loc["Black"], grp.loc["White"]
+                if b["n"] < 20 or w["n"] < 20:
+                    continue
+                bw_gaps.append({
+                    'district_code': int(dist_code),
+                    'district_name': _district_name(dist_code),
+                    'black_mean': _safe(b["mean"]),
+                    'white_mean': _safe(w["mean"]),
+                    'black_count': int(b["n"]),
+                    'white_count': int(w["n"]),
+                    'gap': _safe(b["mean"] - w["mean"]),
+                })
+        bw_gaps.sort(key=lambda x: x['gap'], reverse=True)
+
+        lottery[offense] = {
+            'districts': dist_list,
+            'bw_gaps': bw_gaps,
+        }
+    results['lottery'] = lottery
+
+    # ── Page: Your District ──
+    print("Computing Your District stats...")
+    nat_avg = _safe(total["mean"])
+    nat_median = _safe(medians(h_dist_race, []))
+    nat_below = _safe(total["below_rate"] * 100)
+    nat_race_avg = {race: _safe(by_race["mean"].get(race, np.nan)) for race in RACES}
+
+    # All-district ranking (by name, as districts sharing a name are pooled)
+    named = cells.assign(**{"District Name": to_category(cells["DISTRICT"].map(_district_name), "District Name")})
+    all_dist_rank = stats(named, ["District Name"])[["mean", "n"]].rename(columns={"n": "count"}).reset_index()
+    all_dist_rank = all_dist_rank[all_dist_rank['count'] >= 50].sort_values('mean', ascending=False).reset_index(drop=True)
+    all_dist_rank.index = all_dist_rank.index + 1
+    rank_lookup = {row['District Name']: idx for idx, row in all_dist_rank.iterrows()}
+    total_ranked = len(all_dist_rank)
+
+    dist = stats(cells, ["DISTRICT"])
+    dist_med = medians(h_dist_race, ["DISTRICT"])
+    dist_race = stats(cells, ["DISTRICT", "Race"])
+    dist_race_med = medians(h_dist_race, ["DISTRICT", "Race"])
+    dist_offense = stats(cells, ["DISTRICT", "Offense"])
+    dist_year_race = stats(cells, ["DISTRICT", "Year", "Race"])
+
+    your_district = {}
+    for dist_code, row in dist.iterrows():
+        dist_code = int(dist_code)
+        dist_name = _district_name(dist_code)
+        if row["n"] < 10:
+            continue
+
+        d = {
+            'district_code': dist_code,
+            'total_cases': int(row["n"]),
+            'avg_sentence': _safe(row["mean"]),
+            'median_sentence': _safe(dist_med.loc[dist_code]),
+            'below_guideline_pct': _safe(row["below_rate"] * 100),
+        }
+
+        race_breakdown = {}
+        for race in RACES:
+            if (dist_code, race) not in dist_race.index:
+                continue
+            r = dist_race.loc[(dist_code, race)]
+            race_breakdown[race] = {
+                'mean': _safe(r["mean"]),
+                'median': _safe(dist_race_med.loc[(dist_code, race)]),
+                'count': int(r["n"]),
+            }
+        d['race_breakdown'] = race_breakdown
+
+        off_stats = dist_offense.loc[dist_code][["mean", "n"]].rename(columns={"n": "count"})
+        off_stats = off_stats[off_stats['count'] >= 10].sort_values('count', ascending=False).head(10)
+        d['top_offenses'] = [
+            {'offense': off, 'mean': _safe(r['mean']), 'count': int(r['count'])}
+            for off, r in off_stats.iterrows()
+        ]
+
+        yr_race = dist_year_race.loc[dist_code]
+        yr_race = yr_race[yr_race['n'] >= 10]
+        d['yearly_trend'] = [
+            {'year': int(year), 'race': race, 'mean': float(r['mean']), 'count': int(r['n'])}
+            for (year, race), r in yr_race.iterrows()
+        ]
+
+        rank = rank_lookup.get(dist_name)
+        if rank:
+            d['rank'] = int(rank)
+            d['rank_total'] = total_ranked
+            pctile = (total_ranked - rank) / total_ranked * 100
+            d['percentile'] = _safe(pctile)
+        else:
+            d['rank'] = None
+            d['rank_total'] = total_ranked
+
+        your_district[dist_name] = d
+
+    results['your_district'] = your_district
+    results['your_district_meta'] = {
+        'national_avg': nat_avg,
+        'national_median': nat_median,
+        'national_below': nat_below,
+        'national_race_avg': nat_race_avg,
+        'n_districts': len(districts),
+    }
+
+    # ── Page: Gender Gap ──
+    print("Computing Gender Gap stats...")
+    by_sex = stats(cells, ["Sex"])
+    gender_overall = {
+        'male_avg': _safe(by_sex["mean"].get("Male", np.nan)),
+        'female_avg': _safe(by_sex["mean"].get("Female", np.nan)),
+    }
+    g_stats = stats(cells, ["Offense", "Sex"])
+    gender_by_offense = []
+    for offense in g_stats.index.get_level_values(0).unique():
+        off_data = g_stats.loc[offense]
+        m = off_data.loc["Male"] if "Male" in off_data.index else None
+        f = off_data.loc["Female"] if "Female" in off_data.index else None
+        gender_by_offense.append({
+            'offense': offense,
+            'male_mean': _safe(m["mean"]) if m is not None else None,
+            'female_mean': _safe(f["mean"]) if f is not None else None,
+            'male_count': int(m["n"]) if m is not None else 0,
+            'female_count': int(f["n"]) if f is not None else 0,
+        })
+    results['gender'] = {
+        'overall': gender_overall,
+        'by_offense': gender_by_offense,
+    }
+
+    # ── Page: Plea vs Trial ──
+    print("Computing Plea vs Trial stats...")
+    pleaded = cells[cells["Plea Type"].notna() & cells["Race"].notna()]
+    plea_race = stats(pleaded, ["Plea Type", "Race"])
+    plea_race_list = [
+        {'plea_type': plea, 'race': race, 'mean': float(r['mean']), 'count': int(r['n'])}
+        for (plea, race), r in plea_race.iterrows()
+    ]
+    race_plea = stats(pleaded, ["Race"])["n"]
+    trials = plea_race["n"].xs("Trial", level=0) if "Trial" in plea_race.index.get_level_values(0) else pd.Series(dtype=float)
+    trial_rates = [{'race': race, 'trial_rate': _safe(trials.get(race, 0) / race_plea.get(race, np.nan) * 100)}
+                   for race in RACES]
+    trial_pct = float(trials.sum() / pleaded["n"].sum() * 100)
+
+    plea_by_offense = {}
+    off_plea = stats(pleaded, ["Offense", "Plea Type", "Race"])
+    for offense in LOTTERY_OFFENSES:
+        rows = off_plea.loc[offense] if offense in off_plea.index.get_level_values(0) else off_plea.iloc[:0]
+        rows = rows[rows["n"] >= 10]
+        plea_by_offense[offense] = [
+            {'plea_type': plea, 'race': race, 'mean': float(r['mean']), 'count': int(r['n'])}
+            for (plea, race), r in rows.iterrows()
+        ]
+    results['plea'] = {
+        'plea_race': plea_race_list,
+        'trial_rates': trial_rates,
+        'trial_pct': trial_pct,
+        'by_offense': plea_by_offense,
+    }
+
+    # ── Page: The Trend (leniency gap tab) ──
+    print("Computing below-guideline rates by year × race...")
+    year_race = stats(cells, ["Year", "Race"])
+    results['below_guideline_trend'] = [
+        {'year': year, 'race': race,
+         'rate': _safe(year_race["below_rate"].get((year, race), np.nan) * 100)}
+        for year in years for race in RACES
+    ]
+    return results
+
+
+# ── Fused ingestion ───────────────────────────────────────────
+
+def year_cube(suffix, year_label):
+    """Decode one year's records chunk by chunk, folding each cleaned chunk into its cubes."""
+    import sas_layout
+    from dat_reader import iter_dat_chunks, iter_zip_chunks
+
+    source = year_source(suffix, year_label)
+    if source is None:
+        return None
+    sas_file, dat_file, zip_path = source
+    print(f"Processing FY{year_label}...")
+    colspecs, _, missing = sas_layout.resolve(sas_layout.year_layout(year_label, zip_path or sas_file), KEY_VARS)
+    if missing:
+        print(f"  Missing vars: {missing}")
+    chunks = iter_zip_chunks(zip_path, colspecs) if zip_path else iter_dat_chunks(dat_file, colspecs)
+    return _fold(chunks, int(year_label))
+
+
+def _fold(chunks, year):
+    parts, offset = [], 0
+    for chunk in chunks:
+        chunk["FISCAL_YEAR"] = year
+        cleaned = clean(conform(chunk, KEY_VARS + ["FISCAL_YEAR"]))
+        parts.append(aggregate(cleaned, offset))
+        offset += len(cleaned)
+        if len(parts) >= 16:  # keep the running cubes small
+            parts = [merge(parts)]
+    if not parts:
+        return None
+    cube = merge(parts)
+    print(f"  → {cube['rows']:,} valid cases in {len(cube['cells']):,} cells")
+    return cube
+
+
+def from_sources(workers=1, max_memory_mb=None):
+    """Cubes for every year, straight from the .dat files (FY2024 from the slim CSV)."""
+    cubes, offset = [], 0
+    for _, cube in map_years(year_cube, sorted(DAT_YEARS.items()), workers=workers, max_memory_mb=max_memory_mb):
+        if cube is not None:
+            cubes.append(_shift(cube, offset))
+            offset += cube["rows"]
+    slim_path = os.path.join("data", "individual_fy24", "slim.csv")
+    if os.path.exists(slim_path):
+        print("Loading FY2024 from slim CSV...")
+        cube = _fold(pd.read_csv(slim_path, chunksize=200_000, low_memory=False), 2024)
+        if cube is not None:
+            cubes.append(_shift(cube, offset))
+    return merge(cubes)
+
+
+def main():
+    args = pool_args()
+    cube = from_sources(workers=args.workers, max_memory_mb=args.max_memory_mb)
+    save(cube)
+    print(f"Cubes: {cube['rows']:,} cases → {len(cube['cells']):,} cells")
+
+    # Only the descriptive sections are replaced; regression results are kept
+    results = {}
+    if os.path.exists(PRECOMPUTED_PATH):
+        with open(PRECOMPUTED_PATH) as f:
+            results = json.load(f)
+    results.update(describe(cube))
+    json_str = json.dumps(results, indent=2)
+    with open(PRECOMPUTED_PATH, "w") as f:
+        f.write(json_str)
+    print(f"Done! Wrote {PRECOMPUTED_PATH} ({len(json_str)//1024}KB)")
+
+
+if __name__ == "__main__":
+    main()
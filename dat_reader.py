@@ -0,0 +1,257 @@
+"""
+Vectorized fixed-width reader for USSC .dat files.
+Memory-maps the file, slices every requested column span for a whole block of
+records at once (as a fixed-stride byte view when all records share a length),
+and decodes numbers and missing values ('.', blanks) in bulk with NumPy.
+Memory use is bounded by the block size, not the file size.
+
+The same decoder can be fed straight from an opafyXXnid.zip member stream, so
+the uncompressed .sas/.dat never have to be extracted to disk.
+
+Every reader takes an optional ingest_profile accumulator, which each decoded
+block is folded into before it is handed on.
+"""
+import os
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import ingest_profile
+
+CHUNK_BYTES = 32 * 1024 * 1024
+
+_NL, _CR, _SPACE, _TAB = 10, 13, 32, 9
+_DOT, _MINUS, _PLUS = 46, 45, 43
+
+
+def decode_numeric(cells):
+    """
+    Decode a (n, width) byte matrix of padded numeric fields to float64.
+    Blanks, '.', and malformed fields come back as NaN, as with pd.to_numeric(errors='coerce')
+    (exponent notation is not accepted; the USSC layouts never use it).
+    Scans the field one character position at a time across all rows (Horner's rule).
+    """
+    n, w = cells.shape
+    cols = np.ascontiguousarray(cells.T)
+    mantissa = np.zeros(n, dtype=np.int64)
+    n_digits = np.zeros(n, dtype=np.int8)
+    n_frac = np.zeros(n, dtype=np.int8)
+    n_dots = np.zeros(n, dtype=np.int8)
+    started = np.zeros(n, dtype=bool)
+    ended = np.zeros(n, dtype=bool)
+    negative = np.zeros(n, dtype=bool)
+    bad = np.zeros(n, dtype=bool)
+    for c in cols:
+        d = c - np.uint8(48)
+        is_digit = d < 10
+        is_dot = c == _DOT
+        is_sign = (c == _MINUS) | (c == _PLUS)
+        is_blank = (c == _SPACE) | (c == _TAB) | (c == _CR) | (c == _NL) | (c == 0)
+        bad |= (is_sign & started) | (~is_blank & ended) | ~(is_blank | is_digit | is_dot | is_sign)
+        mantissa = np.where(is_digit, mantissa * 10 + d, mantissa)
+        n_digits += is_digit
+        n_frac += is_digit & (n_dots > 0)
+        n_dots += is_dot
+        negative |= c == _MINUS
+        ended |= is_blank & started
+        started |= ~is_blank
+    values = mantissa / 10.0 ** n_frac
+    values[negative] *= -1
+    values[bad | (n_digits == 0) | (n_dots > 1)] = np.nan
+    return values
+
+
+def _decode_records(records, colspecs):
+    """Decode a (n, record_length) byte matrix of fixed-stride records."""
+    return {name: decode_numeric(records[:, start:end]) for name, (start, end) in colspecs.items()}
+
+
+def _line_bounds(buf):
+    """Start offset and content length (newline / CR stripped) of each non-empty line."""
+    nl = np.flatnonzero(buf == _NL)
+    starts = np.concatenate(([0], nl + 1))
+    ends = np.concatenate((nl, [len(buf)]))
+    if starts[-1] >= len(buf):
+        starts, ends = starts[:-1], ends[:-1]
+    lens = ends - starts
+    has_cr = lens > 0
+    has_cr[has_cr] = buf[ends[has_cr] - 1] == _CR
+    lens = lens - has_cr
+    keep = lens > 0
+    return starts[keep], lens[keep]
+
+
+def decode_block(buf, colspecs):
+    """
+    Decode a buffer of whole records whose lengths may vary.
+    colspecs: {name: (start, end)} with 0-indexed start and exclusive end.
+    Returns {name: float64 array}, one entry per non-empty line.
+    """
+    starts, lens = _line_bounds(buf)
+    out = {}
+    for name, (start, end) in colspecs.items():
+        # Gather the field for every line, blank-padding past each line's end
+        offs = np.arange(start, end)
+        idx = np.minimum(starts[:, None] + offs, max(len(buf) - 1, 0))
+        cells = np.where(offs < lens[:, None], buf[idx], _SPACE).astype(np.uint8)
+        out[name] = decode_numeric(cells)
+    return out
+
+
+def _record_length(buf):
+    """Record length (terminator included) if buf is a run of equal-length lines, else None."""
+    probe = np.flatnonzero(buf[:1 << 20] == _NL)
+    if len(probe) == 0:
+        return None
+    length = int(probe[0]) + 1
+    n = len(buf) // length
+    if not np.all(buf[length - 1:n * length:length] == _NL):
+        return None
+    return length
+
+
+def _iter_blocks(buf, chunk_bytes):
+    """Split a byte array into newline-aligned blocks of roughly chunk_bytes."""
+    pos, size = 0, len(buf)
+    while pos < size:
+        end = min(pos + chunk_bytes, size)
+        while end < size:
+            nl = np.flatnonzero(buf[end - 1:min(end - 1 + chunk_bytes, size)] == _NL)
+            if len(nl):
+                end = end + int(nl[0])
+                break
+            end = min(end + chunk_bytes, size)
+        yield buf[pos:end]
+        pos = end
+
+
+def _decode_buffer(buf, colspecs):
+    """Decode a newline-aligned buffer, as a strided view when its records share a length."""
+    length = _record_length(buf)
+    if length is None:
+        return decode_block(buf, colspecs)
+    n = len(buf) // length
+    decoded = _decode_records(buf[:n * length].reshape(n, length), colspecs)
+    if len(buf) > n * length:
+        tail = decode_block(buf[n * length:], colspecs)
+        decoded = {name: np.concatenate((decoded[name], tail[name])) for name in decoded}
+    return decoded
+
+
+def _iter_decoded(buf, colspecs, chunk_bytes):
+    """Yield decoded column dicts block by block, using a zero-copy strided view when possible."""
+    length = _record_length(buf)
+    if length is None:
+        for block in _iter_blocks(buf, chunk_bytes):
+            yield decode_block(block, colspecs)
+        return
+    n = len(buf) // length
+    records = buf[:n * length].reshape(n, length)
+    step = max(1, chunk_bytes // length)
+    for r in range(0, n, step):
+        yield _decode_records(records[r:r + step], colspecs)
+    if len(buf) > n * length:
+        yield decode_block(buf[n * length:], colspecs)
+
+
+def _profiled(blocks, profile):
+    """Pass decoded blocks through, folding each into profile on the way (if one is given)."""
+    for decoded in blocks:
+        if profile is not None:
+            ingest_profile.update(profile, decoded)
+        yield decoded
+
+
+def _map(dat_path):
+    return np.memmap(dat_path, dtype=np.uint8, mode="r") if os.path.getsize(dat_path) else None
+
+
+def iter_dat_chunks(dat_path, colspecs, chunk_bytes=CHUNK_BYTES, profile=None):
+    """Yield one DataFrame per block of roughly chunk_bytes of the memory-mapped .dat file."""
+    buf = _map(dat_path)
+    if buf is None:
+        return
+    for decoded in _profiled(_iter_decoded(buf, colspecs, chunk_bytes), profile):
+        yield pd.DataFrame(decoded)
+
+
+def _infer_dtypes(columns):
+    """Narrow all-integer, NaN-free columns to int64, as pd.read_fwf would."""
+    for name, values in columns.items():
+        if len(values) and not np.isnan(values).any() and np.all(values == np.floor(values)):
+            columns[name] = values.astype(np.int64)
+    return columns
+
+
+def read_dat(dat_path, colspecs, chunk_bytes=CHUNK_BYTES, profile=None):
+    """
+    Drop-in replacement for pd.read_fwf(dat_path, colspecs=..., names=...) followed by
+    pd.to_numeric(errors='coerce') on USSC .dat files.
+    colspecs: {name: (start, end)} as returned by sas_layout.resolve.
+    Output columns are preallocated, so peak memory is the result plus one block.
+    """
+    names = list(colspecs)
+    buf = _map(dat_path)
+    if buf is None:
+        return pd.DataFrame({name: np.empty(0) for name in names})
+    length = _record_length(buf)
+    if length is not None:
+        # Whole records, plus however many short lines the ragged tail holds
+        n_records = len(buf) // length
+        capacity = n_records + 1 + int(np.count_nonzero(buf[n_records * length:] == _NL))
+    else:
+        capacity = 1 + sum(int(np.count_nonzero(b == _NL)) for b in _iter_blocks(buf, chunk_bytes))
+    out = {name: np.empty(capacity, dtype=np.float64) for name in names}
+    n = 0
+    for decoded in _profiled(_iter_decoded(buf, colspecs, chunk_bytes), profile):
+        k = len(decoded[names[0]]) if names else 0
+        for name in names:
+            out[name][n:n + k] = decoded[name]
+        n += k
+    return pd.DataFrame(_infer_dtypes({name: out[name][:n] for name in names}))
+
+
+# ── Zip streaming ─────────────────────────────────────────────
+
+def zip_members(zip_path):
+    """Return (sas_member, dat_member) names inside a USSC zip; either may be None."""
+    with zipfile.ZipFile(zip_path) as z:
+        names = [n for n in z.namelist() if not n.startswith("__MACOSX") and not n.endswith("/")]
+    sas = next((n for n in names if n.lower().endswith(".sas")), None)
+    dat = next((n for n in names if n.lower().endswith(".dat")), None)
+    return sas, dat
+
+
+def _iter_zip_decoded(zip_path, colspecs, chunk_bytes):
+    """Decoded column dicts per ~chunk_bytes of the .dat member; partial records carry over."""
+    _, dat = zip_members(zip_path)
+    if dat is None:
+        raise ValueError(f"No .dat file in {zip_path}")
+    with zipfile.ZipFile(zip_path) as z, z.open(dat) as f:
+        carry = b""
+        while True:
+            data = f.read(chunk_bytes)
+            if not data:
+                break
+            data = carry + data
+            cut = data.rfind(b"\n") + 1
+            carry = data[cut:]
+            if cut:
+                yield _decode_buffer(np.frombuffer(data, dtype=np.uint8, count=cut), colspecs)
+        if carry:
+            yield _decode_buffer(np.frombuffer(carry, dtype=np.uint8), colspecs)
+
+
+def iter_zip_chunks(zip_path, colspecs, chunk_bytes=CHUNK_BYTES, profile=None):
+    """Yield one DataFrame per ~chunk_bytes of the .dat member, decompressed in memory."""
+    for decoded in _profiled(_iter_zip_decoded(zip_path, colspecs, chunk_bytes), profile):
+        yield pd.DataFrame(decoded)
+
+
+def read_zip(zip_path, colspecs, chunk_bytes=CHUNK_BYTES, profile=None):
+    """read_dat for a .dat member streamed from a zip archive; nothing is written to disk."""
+    parts = list(_profiled(_iter_zip_decoded(zip_path, colspecs, chunk_bytes), profile))
+    columns = {name: np.concatenate([p.pop(name) for p in parts] or [np.empty(0)])
+               for name in colspecs}
+    return pd.DataFrame(_infer_dtypes(columns))
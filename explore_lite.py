@@ -1,8 +1,9 @@
 """
 Justice Index — USSC FY2024 Data Explorer (lightweight)
-Only loads the columns we need to avoid choking on 27k cols.
+Only loads the columns we need to avoid choking on 27k cols
+(via wide_csv's byte-offset index, so reruns read cached columns).
 """
-import pandas as pd
+import wide_csv
 
 DATA_PATH = "data/individual_fy24/opafy24nid.csv"
 
@@ -17,7 +18,7 @@ COLS = [
 print("Loading selected columns from FY2024 data...")
 
 # First check which columns exist
-headers = pd.read_csv(DATA_PATH, nrows=0).columns.tolist()
+headers = wide_csv.header(DATA_PATH)
 available = [c for c in COLS if c in headers]
 missing = [c for c in COLS if c not in headers]
 
@@ -25,7 +26,7 @@ print(f"Found {len(available)}/{len(COLS)} target columns")
 if missing:
     print(f"Missing: {missing}")
 
-df = pd.read_csv(DATA_PATH, usecols=available, low_memory=False)
+df = wide_csv.read_columns(DATA_PATH, available)
 print(f"Loaded {len(df):,} cases\n")
 
 # --- Sentence stats ---
@@ -0,0 +1,333 @@
+"""
+Parallel per-fiscal-year ingestion driver.
+Runs a per-year parse function across worker processes (or in-process) and
+hands results back in year order so the combined output is identical to a
+serial run. Workers write their year straight to the output (store partition
+or CSV part) and return only counts and coverage. Each year's parse can be
+capped with RLIMIT_DATA.
+
+Also keeps data/ingest_manifest.json: for each fiscal year, the hashes of its
+.dat records and SAS layout (zipped or extracted alike), the variables
+resolved from that layout, and the store partition it was written to, so only
+years whose inputs changed are re-parsed. Each year's compiled record layout
+is kept by sas_layout, so add_variable.py can pull extra variables out of the
+raw records later.
+
+year_source finds a year's raw .sas/.dat, extracted or inside its zip, for the
+builders and for cubes.py.
+"""
+import argparse
+import errno
+import hashlib
+import io
+import json
+import os
+import shutil
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, redirect_stdout
+
+from dat_reader import zip_members
+from ussc_download import ZIP_NAMES, cached_path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Variables every ingest script extracts from each year
+KEY_VARS = ["SENTTOT", "NEWRACE", "MONSEX", "AGE", "OFFGUIDE", "DISTRICT",
+            "XMINSOR", "XMAXSOR", "CRIMHIST", "CRIMPTS", "CITIZEN",
+            "NEWEDUC", "WEAPON", "SENTIMP", "DSPLEA", "INOUT", "PRESENT"]
+
+# Also try OFFTYPE2 as fallback for OFFGUIDE
+ALT_VARS = {"OFFGUIDE": "OFFTYPE2"}
+
+# Variables added to the store later by add_variable.py
+EXTRA_VARS_PATH = os.path.join("data", "extra_vars.json")
+
+
+def load_extra_vars(path=EXTRA_VARS_PATH):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_extra_vars(names, path=EXTRA_VARS_PATH):
+    with open(path, "w") as f:
+        json.dump(names, f, indent=2)
+
+
+def store_vars():
+    """KEY_VARS plus any variables added since, so re-parsed years keep them."""
+    return KEY_VARS + [v for v in load_extra_vars() if v not in KEY_VARS]
+
+
+def add_pool_args(parser):
+    """Add --workers / --max-memory-mb to an ArgumentParser."""
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="parallel worker processes (1 = serial, in-process)")
+    parser.add_argument("--max-memory-mb", type=int, default=None,
+                        help="heap (data segment) cap per year being parsed, in MB")
+    return parser
+
+
+def pool_args(argv=None):
+    """Parse just the pool options from the command line."""
+    return add_pool_args(argparse.ArgumentParser()).parse_args(argv)
+
+
+def _limit_memory(max_memory_mb):
+    """
+    Cap the process's data segment (heap and private writable mappings) via the soft
+    RLIMIT_DATA. Unlike an address-space cap, read-only memory maps of the .dat files
+    and reserved-but-unused thread arenas don't count against it.
+    """
+    if max_memory_mb and resource is not None:
+        _, hard = resource.getrlimit(resource.RLIMIT_DATA)
+        cap = max_memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_DATA, (cap if hard == resource.RLIM_INFINITY else min(cap, hard), hard))
+
+
+@contextmanager
+def _memory_cap(max_memory_mb):
+    """_limit_memory for the duration of a block, then the previous limit again (serial runs)."""
+    if not max_memory_mb or resource is None:
+        yield
+        return
+    previous = resource.getrlimit(resource.RLIMIT_DATA)
+    _limit_memory(max_memory_mb)
+    try:
+        yield
+    finally:
+        resource.setrlimit(resource.RLIMIT_DATA, previous)
+
+
+def _over_budget(e):
+    """True for the errors an allocation past the cap raises: MemoryError, or OSError ENOMEM from mmap."""
+    return isinstance(e, MemoryError) or (isinstance(e, OSError) and e.errno == errno.ENOMEM)
+
+
+def _run_capped(fn, args):
+    """fn(*args), or None (reported) if it runs out of its memory cap."""
+    try:
+        return fn(*args)
+    except (MemoryError, OSError) as e:
+        if not _over_budget(e):
+            raise
+        print("  ❌ Year exceeded its memory cap, skipping")
+        return None
+
+
+def _run_captured(fn, args):
+    """Run fn(*args) in a worker, capturing its per-year log so years don't interleave."""
+    buf = io.StringIO()
+    with redirect_stdout(buf):
+        result = _run_capped(fn, args)
+    return result, buf.getvalue()
+
+
+def map_years(fn, tasks, workers=1, max_memory_mb=None):
+    """
+    Yield (args, fn(*args)) for each task tuple, in task order.
+    fn should return None for a year it skips. With workers > 1 the calls run
+    in a process pool and each year's log is printed as a block once that year
+    is next in order; a worker crash is reported and treated as a skip. A year
+    that runs past max_memory_mb is skipped, serial or parallel.
+    """
+    tasks = list(tasks)
+    if workers <= 1 or len(tasks) <= 1:
+        for args in tasks:
+            with _memory_cap(max_memory_mb):
+                result = _run_capped(fn, args)
+            yield args, result
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                             initializer=_limit_memory, initargs=(max_memory_mb,)) as pool:
+        futures = [pool.submit(_run_captured, fn, args) for args in tasks]
+        for args, future in zip(tasks, futures):
+            try:
+                result, log = future.result()
+            except Exception as e:
+                result, log = None, f"  ❌ Worker failed on {args}: {e!r}\n"
+            print(log, end="", flush=True)
+            yield args, result
+
+
+# ── Year sources ──────────────────────────────────────────────
+
+# Fiscal years read from USSC .dat files (FY02-FY23), suffix → year
+DAT_YEARS = {f"{y:02d}": f"20{y:02d}" for y in range(2, 24)}
+
+
+def year_source(suffix, year_label, data_dir="data"):
+    """(sas, dat, zip_path) for a year: extracted files, or members of its zip; None if unavailable."""
+    extract_dir = os.path.join(data_dir, f"sas_fy{suffix}")
+    sas_file = None
+    dat_file = None
+    zip_path = None
+    
+    if os.path.exists(extract_dir):
+        # Find .sas and .dat files
+        for f in os.listdir(extract_dir):
+            fl = f.lower()
+            if fl.endswith('.sas'):
+                sas_file = os.path.join(extract_dir, f)
+            if fl.endswith('.dat'):
+                dat_file = os.path.join(extract_dir, f)
+    else:
+        # Not extracted: stream straight from the zip instead
+        # Handle variant zip names
+        zip_candidates = [
+            os.path.join(data_dir, f"opafy{suffix}nid.zip"),
+            os.path.join(data_dir, f"opafy{suffix}-nid.zip"),
+        ]
+        zip_path = next((zp for zp in zip_candidates if os.path.exists(zp)), None)
+        if not zip_path and suffix in ZIP_NAMES:
+            zip_path = cached_path(suffix)  # fetched by ussc_download
+        if not zip_path:
+            print(f"⚠️  No zip found for FY{year_label}, skipping")
+            return None
+        try:
+            sas_file, dat_file = zip_members(zip_path)
+        except Exception as e:
+            print(f"  ⚠️  Failed to open {year_label}: {e}")
+            return None
+    
+    if not sas_file or not dat_file:
+        print(f"⚠️  FY{year_label}: missing .sas or .dat, skipping")
+        return None
+    return sas_file, dat_file, zip_path
+
+
+# ── Streaming combine ─────────────────────────────────────────
+# Each year is written out as soon as it is parsed and only a small summary
+# (from ingest_profile, gathered while decoding) travels back, so peak memory
+# is one year, not the whole table.
+
+def conform(df, columns):
+    """df with exactly these columns, in this order (absent ones all-NaN)."""
+    return df.reindex(columns=columns)
+
+
+def print_year_summaries(summaries):
+    """Print totals and per-year counts from {year: summary}, flagging columns with no data."""
+    total = sum(s["rows"] for s in summaries.values())
+    print(f"Total: {total:,} cases across {len(summaries)} years")
+    for year, s in sorted(summaries.items()):
+        empty = [c for c, share in s.get("coverage", {}).items() if share == 0]
+        print(f"  {int(year)}: {s['rows']:,} cases" + (f" (no data: {', '.join(empty)})" if empty else ""))
+
+
+def write_csv_part(df, out_path, year, append=False):
+    """
+    Write one year's rows to a part file next to out_path; returns the part's path.
+    With append, rows are added to the year's existing part (no second header).
+    """
+    part_dir = out_path + ".parts"
+    os.makedirs(part_dir, exist_ok=True)
+    part = os.path.join(part_dir, f"{year}.csv")
+    df.to_csv(part, index=False, mode="a" if append else "w", header=not append)
+    return part
+
+
+def join_csv_parts(parts, out_path):
+    """Stream part CSVs (all with the same header) into out_path in order, then delete them."""
+    tmp = out_path + ".tmp"
+    with open(tmp, "wb") as out:
+        for i, part in enumerate(parts):
+            with open(part, "rb") as f:
+                header = f.readline()
+                if i == 0:
+                    out.write(header)
+                shutil.copyfileobj(f, out, 1 << 20)
+    os.replace(tmp, out_path)
+    for part in parts:
+        os.remove(part)
+    shutil.rmtree(out_path + ".parts", ignore_errors=True)
+
+
+# ── Manifest ──────────────────────────────────────────────────
+
+MANIFEST_PATH = os.path.join("data", "ingest_manifest.json")
+
+
+def sha256_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path, cached=None):
+    """
+    {path, size, mtime_ns, sha256} for a file. If cached describes the same
+    path, size and mtime, its hash is reused instead of re-reading the file.
+    """
+    st = os.stat(path)
+    if cached and (cached.get("path"), cached.get("size"), cached.get("mtime_ns")) == (path, st.st_size, st.st_mtime_ns):
+        return cached
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return {"path": path, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": h.hexdigest()}
+
+
+def dat_digest(source, cached=None):
+    """
+    Canonical identity of a year's records, the same whether they are read from the
+    extracted .dat or from the USSC zip holding it: {path, size, mtime_ns, sha256},
+    with sha256 of the .dat bytes themselves (a zip's member is hashed as it
+    decompresses). cached is reused while path, size and mtime are unchanged.
+    """
+    if not source.endswith(".zip"):
+        return file_digest(source, cached)
+    st = os.stat(source)
+    if cached and (cached.get("path"), cached.get("size"), cached.get("mtime_ns")) == (source, st.st_size, st.st_mtime_ns):
+        return cached
+    _, dat = zip_members(source)
+    if dat is None:
+        raise ValueError(f"No .dat file in {source}")
+    h = hashlib.sha256()
+    with zipfile.ZipFile(source) as z, z.open(dat) as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return {"path": source, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": h.hexdigest()}
+
+
+def year_entry(source, layout, resolved, missing, prev=None):
+    """
+    Manifest entry for a year's inputs: source is the .dat or zip it is parsed from,
+    layout its compiled sas_layout (identified by the .sas bytes' sha256). Every ingest
+    script builds its entries here, so they agree on what counts as unchanged.
+    """
+    return {"source": dat_digest(source, (prev or {}).get("source")),
+            "layout": {"path": layout["source"]["id"][0], "sha256": layout["source"]["sha256"]},
+            "resolved": resolved, "missing": missing}
+
+
+def load_manifest(path=MANIFEST_PATH):
+    """{fiscal year (str): entry}; empty if there is no manifest yet."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(dict(sorted(manifest.items())), f, indent=2)
+    os.replace(tmp, path)
+
+
+def _sha(digest):
+    return digest.get("sha256") if digest else None
+
+
+def is_current(prev, entry):
+    """True if entry's inputs match what prev was built from and prev's partition is still on disk."""
+    if not prev or not entry or not prev.get("partition") or not os.path.isdir(prev["partition"]):
+        return False
+    return (_sha(prev.get("source")) == _sha(entry.get("source")) and
+            _sha(prev.get("layout")) == _sha(entry.get("layout")) and
+            prev.get("resolved") == entry.get("resolved"))
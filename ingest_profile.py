@@ -0,0 +1,140 @@
+"""
+Per-year data-quality profile, gathered while records are decoded.
+The dat_reader readers fold every decoded block into a profile
+(read_dat(..., profile=p)), so null rates, value ranges, code frequencies and
+sentinel counts come out of the same pass as the data, and the builders'
+per-year summaries need no further scan of the table.
+
+data/ingest_profile.json keeps the profile of every parsed year; drift()
+compares them across years (a variable with no data in some years, codes that
+come and go), so schema changes such as OFFGUIDE's absence in FY02-10 show up
+at parse time.
+"""
+import json
+import os
+
+import numpy as np
+
+PROFILE_PATH = os.path.join("data", "ingest_profile.json")
+
+# Coded variables that get a full frequency table
+CODE_VARS = {"NEWRACE", "MONSEX", "OFFGUIDE", "OFFTYPE2", "DISTRICT", "CRIMHIST", "CITIZEN", "NEWEDUC",
+             "WEAPON", "SENTIMP", "DSPLEA", "INOUT", "PRESENT"}
+
+# Values at or above these are codes, not measurements (9996+ guideline codes, 470 = life)
+SENTINELS = {"XMINSOR": 9996, "XMAXSOR": 9996, "SENTTOT": 470}
+
+# Only code sets this small are checked for codes that come and go between years
+DRIFT_MAX_CODES = 12
+
+
+def new():
+    return {"rows": 0, "columns": {}}
+
+
+def _floats(values):
+    if hasattr(values, "to_numpy"):
+        return values.to_numpy("float64", na_value=np.nan)
+    return np.asarray(values, dtype=np.float64)
+
+
+def update(profile, columns):
+    """Fold one block of columns ({name: values} or a DataFrame) into profile, in place; returns it."""
+    n = 0
+    for name in columns:
+        v = _floats(columns[name])
+        n = len(v)
+        col = profile["columns"].setdefault(name, {"rows": 0, "nulls": 0, "min": None, "max": None,
+                                                   "codes": {}, "sentinel": 0})
+        present = v[~np.isnan(v)]
+        col["rows"] += n
+        col["nulls"] += n - len(present)
+        if not len(present):
+            continue
+        lo, hi = float(present.min()), float(present.max())
+        col["min"] = lo if col["min"] is None else min(col["min"], lo)
+        col["max"] = hi if col["max"] is None else max(col["max"], hi)
+        if name in CODE_VARS:
+            codes, counts = np.unique(present, return_counts=True)
+            for code, k in zip(codes.tolist(), counts.tolist()):
+                col["codes"][code] = col["codes"].get(code, 0) + k
+        if name in SENTINELS:
+            col["sentinel"] += int(np.count_nonzero(present >= SENTINELS[name]))
+    profile["rows"] += n
+    return profile
+
+
+def year_summary(profile, columns):
+    """Row count and the share of non-null values per column (0 for columns never decoded)."""
+    n, cols = profile["rows"], profile["columns"]
+    return {"rows": n, "coverage": {c: round((cols[c]["rows"] - cols[c]["nulls"]) / n, 4) if n and c in cols else 0.0
+                                    for c in columns}}
+
+
+def _code_key(code):
+    return str(int(code)) if float(code).is_integer() else repr(code)
+
+
+def summarize(profile, columns):
+    """JSON-ready profile of one year: null rate, range, code counts and sentinel counts per column."""
+    out = {}
+    for name in columns:
+        col = profile["columns"].get(name)
+        if col is None or not col["rows"]:
+            out[name] = {"absent": True, "null_rate": 1.0}
+            continue
+        s = {"null_rate": round(col["nulls"] / col["rows"], 4), "min": col["min"], "max": col["max"]}
+        if name in CODE_VARS:
+            s["codes"] = {_code_key(c): k for c, k in sorted(col["codes"].items())}
+        if name in SENTINELS:
+            s[f"at_least_{SENTINELS[name]}"] = col["sentinel"]
+        out[name] = s
+    return {"rows": profile["rows"], "columns": out}
+
+
+def load(path=PROFILE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(profiles, path=PROFILE_PATH):
+    """Merge {year: summarize(...)} into the profile file, replacing those years."""
+    merged = dict(load(path), **profiles)
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(dict(sorted(merged.items())), f, indent=1)
+    os.replace(tmp, path)
+
+
+def drift(profiles):
+    """Messages for variables with no data in some years, and small code sets that change between years."""
+    years = sorted(profiles)
+    names = list(dict.fromkeys(c for y in years for c in profiles[y]["columns"]))
+    messages = []
+    for name in names:
+        cols = {y: profiles[y]["columns"].get(name, {"absent": True, "null_rate": 1.0}) for y in years}
+        has_data = [y for y in years if cols[y]["null_rate"] < 1]
+        no_data = [y for y in years if cols[y]["null_rate"] == 1]
+        if has_data and no_data:
+            messages.append(f"{name}: no data in FY{', FY'.join(no_data)}")
+        codes = {y: set(cols[y].get("codes", {})) for y in has_data}
+        seen = set().union(*codes.values()) if codes else set()
+        if not seen or len(seen) > DRIFT_MAX_CODES:
+            continue
+        for code in sorted(seen, key=float):
+            absent = [y for y in has_data if code not in codes[y]]
+            if absent:
+                messages.append(f"{name}: code {code} not seen in FY{', FY'.join(absent)}")
+    return messages
+
+
+def print_drift(profiles):
+    messages = drift(profiles)
+    if not messages:
+        print("✓ No schema drift across years")
+        return
+    print(f"⚠️  Schema drift across {len(profiles)} years:")
+    for m in messages:
+        print(f"  {m}")
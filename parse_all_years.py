@@ -1,41 +1,25 @@
-"""Parse ALL USSC years (FY2002-2024) into one combined CSV."""
-import os, re, sys
+"""Parse ALL USSC years (FY2002-2024) into the year-partitioned Parquet store.
+Only years whose inputs changed since the last run (per data/ingest_manifest.json)
+are re-parsed; their partitions are replaced and the rest are left alone.
+Usage: python parse_all_years.py [--workers N] [--max-memory-mb MB] [--force]"""
+import argparse, os, sys
 import pandas as pd
+from dat_reader import read_dat
+import ingest_profile
+import sas_layout
+from ingest import (DAT_YEARS, add_pool_args, conform, file_digest, is_current, load_manifest,
+                    map_years, print_year_summaries, save_manifest, store_vars, year_entry)
+from case_store import partition_path, store_size_mb, write_store
 
 DATA_DIR = "data"
+STORE_PATH = os.path.join(DATA_DIR, "combined_all_years.parquet")
 
-KEY_VARS = ["SENTTOT", "NEWRACE", "MONSEX", "AGE", "OFFGUIDE", "DISTRICT",
-            "XMINSOR", "XMAXSOR", "CRIMHIST", "CRIMPTS", "CITIZEN",
-            "NEWEDUC", "WEAPON", "SENTIMP", "DSPLEA", "INOUT", "PRESENT"]
+# KEY_VARS plus anything added later with add_variable.py
+STORE_VARS = store_vars()
+COLUMNS = STORE_VARS + ["FISCAL_YEAR"]
 
-def parse_sas_positions(sas_path):
-    with open(sas_path, 'r', errors='replace') as f:
-        text = f.read()
-    input_match = re.search(r'INPUT\s(.*?);', text, re.DOTALL)
-    if not input_match:
-        raise ValueError(f"No INPUT section found in {sas_path}")
-    input_text = input_match.group(1)
-    positions = {}
-    for m in re.finditer(r'(\w+)\s+\$?\s*(\d+)-(\d+)', input_text):
-        name = m.group(1).upper()
-        start = int(m.group(2)) - 1
-        end = int(m.group(3))
-        positions[name] = (start, end)
-    for m in re.finditer(r'(\w+)\s+\$?\s*(\d+)(?:\s|$)', input_text):
-        name = m.group(1).upper()
-        pos = int(m.group(2))
-        if name not in positions and pos > 10:
-            positions[name] = (pos - 1, pos)
-    return positions
-
-# All years to process
-YEARS = {}
-for yr in range(2, 24):
-    YEARS[f"{yr:02d}"] = str(2000 + yr)
-
-all_frames = []
-
-for suffix, year_label in sorted(YEARS.items()):
+def find_sources(suffix):
+    """(sas_file, dat_file) for a year's extracted files; either may be None."""
     sas_dir = os.path.join(DATA_DIR, f"sas_fy{suffix}")
     
     # Try different naming patterns
@@ -50,68 +34,128 @@ for suffix, year_label in sorted(YEARS.items()):
     
     sas_file = next((f for f in sas_candidates if os.path.exists(f)), None)
     dat_file = next((f for f in dat_candidates if os.path.exists(f)), None)
+    return sas_file, dat_file
+
+
+def current_entry(suffix, year_label, prev):
+    """Manifest entry for a year's current inputs, or None if they can't be read."""
+    sas_file, dat_file = find_sources(suffix)
+    if not sas_file or not dat_file:
+        return None
+    try:
+        layout = sas_layout.year_layout(year_label, sas_file)
+    except Exception:
+        return None
+    _, resolved, missing = sas_layout.resolve(layout, STORE_VARS)
+    return year_entry(dat_file, layout, resolved, missing, prev)
+
+
+def process_year(suffix, year_label, profile=None):
+    """Parse one fiscal year's .dat (profiling it as it decodes); returns a DataFrame, or None to skip the year."""
+    sas_file, dat_file = find_sources(suffix)
     
     if not sas_file or not dat_file:
         print(f"⚠️  FY{year_label}: missing sas={sas_file is not None} dat={dat_file is not None}, skipping")
-        continue
+        return None
     
     print(f"Processing FY{year_label}...")
     
     try:
-        positions = parse_sas_positions(sas_file)
+        layout = sas_layout.year_layout(year_label, sas_file)
     except Exception as e:
         print(f"  ❌ SAS parse failed: {e}")
-        continue
+        return None
     
-    available = {v: positions[v] for v in KEY_VARS if v in positions}
-    missing = [v for v in KEY_VARS if v not in positions]
+    available, _, missing = sas_layout.resolve(layout, STORE_VARS)
     if missing:
         print(f"  Missing vars: {missing}")
     
-    print(f"  Found {len(available)}/{len(KEY_VARS)} key variables")
-    
-    colspecs = [(pos[0], pos[1]) for pos in available.values()]
-    names = list(available.keys())
+    print(f"  Found {len(available)}/{len(STORE_VARS)} key variables")
     
     try:
-        df = pd.read_fwf(dat_file, colspecs=colspecs, names=names,
-                         na_values=['.', ' .', '  .', '   .'])
+        df = read_dat(dat_file, available, profile=profile)
         df["FISCAL_YEAR"] = int(year_label)
-        
-        # Ensure numeric types for key columns
-        for col in names:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        
-        all_frames.append(df)
         print(f"  → {len(df):,} cases")
+        return df
     except Exception as e:
         print(f"  ❌ Parse failed: {e}")
-        continue
+        return None
 
-# Add FY2024 from slim CSV
-slim_path = os.path.join(DATA_DIR, "individual_fy24", "slim.csv")
-if os.path.exists(slim_path):
-    print("Loading FY2024 from slim CSV...")
-    df24 = pd.read_csv(slim_path, low_memory=False)
-    df24["FISCAL_YEAR"] = 2024
-    all_frames.append(df24)
-    print(f"  → {len(df24):,} cases")
 
-print(f"\nCombining {len(all_frames)} years...")
-combined = pd.concat(all_frames, ignore_index=True)
+def store_year(suffix, year_label):
+    """Parse one year and write it straight to its store partition; returns its summary and profile."""
+    profile = ingest_profile.new()
+    df = process_year(suffix, year_label, profile)
+    if df is None:
+        return None
+    df = conform(df, COLUMNS)
+    write_store(df, STORE_PATH)
+    return dict(ingest_profile.year_summary(profile, STORE_VARS),
+                profile=ingest_profile.summarize(profile, STORE_VARS))
 
-# Ensure all KEY_VARS columns exist
-for col in KEY_VARS:
-    if col not in combined.columns:
-        combined[col] = pd.NA
 
-combined = combined[KEY_VARS + ["FISCAL_YEAR"]]
+def main():
+    parser = add_pool_args(argparse.ArgumentParser())
+    parser.add_argument("--force", action="store_true", help="re-parse every year, ignoring the manifest")
+    args = parser.parse_args()
+    manifest = load_manifest()
+    entries, todo, summaries, profiles = {}, [], {}, {}
+    
+    # Only years whose source, layout or resolved variables changed get re-parsed
+    for suffix, year_label in sorted(DAT_YEARS.items()):
+        prev = manifest.get(year_label, {})
+        entry = current_entry(suffix, year_label, prev)
+        if not args.force and is_current(prev, entry):
+            print(f"✓ FY{year_label}: unchanged ({prev['rows']:,} cases)")
+            manifest[year_label] = dict(prev, source=entry["source"], layout=entry["layout"])
+            continue
+        entries[year_label] = entry
+        todo.append((suffix, year_label))
+    
+    # Years run in parallel, each writing its own partition; only summaries come back
+    for (_, year_label), summary in map_years(store_year, todo,
+                                              workers=args.workers, max_memory_mb=args.max_memory_mb):
+        if summary is not None:
+            profiles[year_label] = summary.pop("profile")
+            summaries[year_label] = summary
+    
+    # Add FY2024 from slim CSV
+    slim_path = os.path.join(DATA_DIR, "individual_fy24", "slim.csv")
+    if os.path.exists(slim_path):
+        prev = manifest.get("2024", {})
+        entry = {"source": file_digest(slim_path, prev.get("source")), "layout": None, "resolved": None}
+        if not args.force and is_current(prev, entry):
+            print(f"✓ FY2024: unchanged ({prev['rows']:,} cases)")
+            manifest["2024"] = dict(prev, source=entry["source"])
+        else:
+            print("Loading FY2024 from slim CSV...")
+            df24 = pd.read_csv(slim_path, low_memory=False)
+            profile = ingest_profile.update(ingest_profile.new(), df24[[c for c in STORE_VARS if c in df24]])
+            df24["FISCAL_YEAR"] = 2024
+            df24 = conform(df24, COLUMNS)
+            write_store(df24, STORE_PATH)
+            summaries["2024"] = ingest_profile.year_summary(profile, STORE_VARS)
+            profiles["2024"] = ingest_profile.summarize(profile, STORE_VARS)
+            entries["2024"] = entry
+            print(f"  → {len(df24):,} cases")
+            del df24
+    
+    for year_label, summary in summaries.items():
+        entry = entries.get(year_label) or {}
+        entry.update(partition=partition_path(year_label, STORE_PATH), **summary)
+        manifest[year_label] = entry
+    save_manifest(manifest)
+    ingest_profile.save(profiles)
+    
+    if not summaries:
+        print("\n✅ Store is up to date, nothing to parse")
+        return
+    
+    print()
+    print_year_summaries(summaries)
+    ingest_profile.print_drift(ingest_profile.load())
+    print(f"\n✅ Saved to {STORE_PATH} ({store_size_mb(STORE_PATH):.1f} MB)")
 
-print(f"Total: {len(combined):,} cases across {combined['FISCAL_YEAR'].nunique()} years")
-for year in sorted(combined["FISCAL_YEAR"].unique()):
-    n = len(combined[combined["FISCAL_YEAR"] == year])
-    print(f"  {int(year)}: {n:,} cases")
 
-out_path = os.path.join(DATA_DIR, "combined_all_years.csv")
-combined.to_csv(out_path, index=False)
-print(f"\n✅ Saved to {out_path} ({os.path.getsize(out_path)/1024/1024:.1f} MB)")
+if __name__ == "__main__":
+    main()
@@ -10,10 +10,15 @@ This isolates the independent effect of race on sentencing.
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
+from scipy.stats import norm
 from statsmodels.iolib.summary2 import summary_col
+from regression_engine import fit_groups, fit_logit
 
 DATA_PATH = "data/individual_fy24/slim.csv"
 
+# Two-sided 95% normal critical value, as statsmodels' conf_int uses
+Z_95 = norm.ppf(0.975)
+
 RACE_MAP = {1: "White", 2: "Black", 3: "Hispanic"}
 SEX_MAP = {0: "Male", 1: "Female"}
 OFFENSE_MAP = {
@@ -124,43 +129,38 @@ print("=" * 70)
 
 results_by_offense = []
 
-for off_code, off_name in sorted(OFFENSE_MAP.items()):
-    off_data = valid[valid["OFFGUIDE"] == off_code].copy()
-    
-    if len(off_data) < 200:
-        continue
-    
-    feats = ["is_black", "is_hispanic", "is_female", "XMINSOR", "CRIMPTS", "AGE",
-             "is_illegal_alien", "has_weapon"]
+# Every offense's model in one batched fit (regression_engine.fit_groups)
+feats = ["is_black", "is_hispanic", "is_female", "XMINSOR", "CRIMPTS", "AGE",
+         "is_illegal_alien", "has_weapon"]
+off_data = valid[valid["OFFGUIDE"].isin(list(OFFENSE_MAP))]
+off_data = off_data[off_data.groupby("OFFGUIDE")["SENTTOT"].transform("size") >= 200]
+X_off = sm.add_constant(off_data[feats].fillna(0), has_constant="add")
+fits = fit_groups(X_off, off_data["SENTTOT"], off_data["OFFGUIDE"])
+
+for off_code, m in fits.groupby("OFFGUIDE", sort=True):
+    off_name = OFFENSE_MAP[int(off_code)]
+    m = m.set_index("term")
+    n, r2 = int(m["n"].iloc[0]), m["r2"].iloc[0]
     
-    X_off = off_data[feats].fillna(0)
-    X_off = sm.add_constant(X_off)
-    y_off = off_data["SENTTOT"]
-    
-    try:
-        m = sm.OLS(y_off, X_off).fit(cov_type='HC1')
-    except Exception:
-        continue
-    
-    b_coef = m.params.get("is_black", 0)
-    b_p = m.pvalues.get("is_black", 1)
-    h_coef = m.params.get("is_hispanic", 0)
-    h_p = m.pvalues.get("is_hispanic", 1)
-    f_coef = m.params.get("is_female", 0)
-    f_p = m.pvalues.get("is_female", 1)
+    b_coef = m.at["is_black", "coef"]
+    b_p = m.at["is_black", "pvalue"]
+    h_coef = m.at["is_hispanic", "coef"]
+    h_p = m.at["is_hispanic", "pvalue"]
+    f_coef = m.at["is_female", "coef"]
+    f_p = m.at["is_female", "pvalue"]
     
     b_sig = "***" if b_p < 0.001 else "**" if b_p < 0.01 else "*" if b_p < 0.05 else ""
     h_sig = "***" if h_p < 0.001 else "**" if h_p < 0.01 else "*" if h_p < 0.05 else ""
     f_sig = "***" if f_p < 0.001 else "**" if f_p < 0.01 else "*" if f_p < 0.05 else ""
     
     results_by_offense.append({
-        "offense": off_name, "n": int(m.nobs), "r2": m.rsquared,
+        "offense": off_name, "n": n, "r2": r2,
         "black_coef": b_coef, "black_p": b_p, "black_sig": b_sig,
         "hispanic_coef": h_coef, "hispanic_p": h_p, "hispanic_sig": h_sig,
         "female_coef": f_coef, "female_p": f_p, "female_sig": f_sig,
     })
     
-    print(f"\n  📌 {off_name} (n={int(m.nobs):,}, R²={m.rsquared:.3f}):")
+    print(f"\n  📌 {off_name} (n={n:,}, R²={r2:.3f}):")
     print(f"     Black effect:    {b_coef:+6.1f} months {b_sig} (p={b_p:.4f})")
     print(f"     Hispanic effect: {h_coef:+6.1f} months {h_sig} (p={h_p:.4f})")
     print(f"     Female effect:   {f_coef:+6.1f} months {f_sig} (p={f_p:.4f})")
@@ -173,8 +173,6 @@ print("MODEL 3: LOGISTIC REGRESSION — BELOW-GUIDELINE SENTENCES")
 print("  (Who is more likely to receive mercy?)")
 print("=" * 70)
 
-from statsmodels.discrete.discrete_model import Logit
-
 valid["below_guideline"] = (valid["SENTTOT"] < valid["XMINSOR"]).astype(int)
 
 feats_logit = ["is_black", "is_hispanic", "is_female", "CRIMPTS", "AGE",
@@ -186,9 +184,9 @@ X_logit = valid[feats_logit].fillna(0)
 X_logit = sm.add_constant(X_logit)
 y_logit = valid["below_guideline"]
 
-logit_model = Logit(y_logit, X_logit).fit(disp=0, cov_type='HC1')
+logit_model = fit_logit(X_logit, y_logit, cov='HC1')
 
-print(f"\nPseudo R² = {logit_model.prsquared:.4f}")
+print(f"\nPseudo R² = {logit_model.rsquared:.4f}")
 print(f"N = {int(logit_model.nobs):,}")
 
 # Convert to odds ratios
@@ -196,13 +194,12 @@ print("\n--- ODDS RATIOS (key variables) ---")
 print(f"{'Variable':<25s} {'OR':>8s} {'95% CI':>18s} {'P>|z|':>8s} {'Sig':>5s}")
 print("-" * 70)
 
-conf = logit_model.conf_int()
 for var in ["is_black", "is_hispanic", "is_female", "CRIMPTS", "AGE", "is_illegal_alien", "has_weapon"]:
     coef = logit_model.params[var]
     p = logit_model.pvalues[var]
     or_val = np.exp(coef)
-    ci_lo = np.exp(conf.loc[var, 0])
-    ci_hi = np.exp(conf.loc[var, 1])
+    ci_lo = np.exp(coef - Z_95 * logit_model.bse[var])
+    ci_hi = np.exp(coef + Z_95 * logit_model.bse[var])
     sig = "***" if p < 0.001 else "**" if p < 0.01 else "*" if p < 0.05 else ""
     print(f"  {var:<23s} {or_val:>8.3f} [{ci_lo:.3f} - {ci_hi:.3f}] {p:>8.4f} {sig:>5s}")
 
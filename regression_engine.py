@@ -0,0 +1,929 @@
+"""
+Sufficient-statistics OLS engine for the precomputed regressions.
+The design COLUMNS (const, Black, Hispanic, Female, XMINSOR, CRIMPTS, AGE,
+IllegalAlien, WEAPON and the offense dummies) is encoded once by encode(),
+then one pass accumulates X'X, X'y and y'y for every (year, OFFGUIDE) cell.
+Any model over a union of cells (overall, one year, one offense, one
+offense × year) is solved from its summed cell statistics; models without
+offense dummies use the leading block of the same matrices. A second pass
+accumulates each cell's HC1 meat, sum(e² x x'), under the coefficients of every
+model the cell belongs to.
+
+Coefficients, HC1 standard errors, p-values and R² match
+statsmodels OLS(y, X).fit(cov_type='HC1').
+
+The leniency logits (below-guideline sentence on the same predictors) are fitted
+by Newton-Raphson with every group's iteration stacked: fit_logit for one model,
+fit_logit_groups for one per year, offense, district or any other key, warm
+started from the pooled fit and flagging groups with separated outcomes.
+
+For the deployed app, precompute stores data/regression_cells.npz: every
+cell's sums of all products of four entries of u = [const, predictors, y].
+The offense dummies are constant within a cell, so these moments give X'X, X'y
+and the HC1 meat of any union of cells without the case data (solve_cells).
+Only numpy and pandas are needed, as on Render.
+
+Usage: python regression_engine.py [--budget-mb MB]   # overall model streamed from the case store
+"""
+import itertools
+import math
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+PREDICTORS = ['Black', 'Hispanic', 'Female', 'XMINSOR', 'CRIMPTS', 'AGE', 'IllegalAlien', 'WEAPON']
+OFFENSE_DUMMIES = [1, 4, 5, 7, 13, 16, 17, 21, 22, 26, 27, 30]
+COLUMNS = ['const'] + PREDICTORS + [f'off_{code}' for code in OFFENSE_DUMMIES]
+# Width of the design without offense dummies (its leading block)
+BASE = 1 + len(PREDICTORS)
+
+RAW_COLUMNS = ['SENTTOT', 'NEWRACE', 'MONSEX', 'AGE', 'XMINSOR', 'CRIMPTS', 'CITIZEN', 'WEAPON', 'OFFGUIDE']
+
+# Relative eigenvalue cutoff for the rank of a Gram matrix scaled to unit diagonal
+RCOND = 1e-12
+
+Fit = namedtuple('Fit', ['params', 'bse', 'pvalues', 'rsquared', 'nobs'])
+
+CELLS_PATH = os.path.join("data", "regression_cells.npz")
+
+# u = [const, predictors, y]; its fourth-order moments are stored once per sorted index quadruple
+_U = BASE + 1
+_PAIRS = list(itertools.combinations_with_replacement(range(_U), 2))
+_QUADS = list(itertools.combinations_with_replacement(range(_U), 4))
+_QUAD_INDEX = np.empty((_U,) * 4, dtype=np.int64)
+for _q, _quad in enumerate(_QUADS):
+    for _perm in itertools.permutations(_quad):
+        _QUAD_INDEX[_perm] = _q
+
+
+# ── Design and cells ──────────────────────────────────────────
+
+def design(df):
+    """
+    (X [n, len(COLUMNS)] float64, y, keep mask over df's rows): the COLUMNS design
+    for the rows with every raw column present, built straight into one array.
+    """
+    raw = np.column_stack([df[c].to_numpy('float64', na_value=np.nan) for c in RAW_COLUMNS])
+    keep = ~np.isnan(raw).any(axis=1)
+    raw = raw[keep]
+    senttot, newrace, monsex, age, xminsor, crimpts, citizen, weapon, offguide = raw.T
+    X = np.empty((len(raw), len(COLUMNS)))
+    X[:, 0] = 1.0
+    X[:, 1] = newrace == 2
+    X[:, 2] = newrace == 3
+    X[:, 3] = monsex == 1
+    X[:, 4] = xminsor
+    X[:, 5] = crimpts
+    X[:, 6] = age
+    X[:, 7] = citizen == 3
+    X[:, 8] = weapon
+    for j, code in enumerate(OFFENSE_DUMMIES, start=BASE):
+        X[:, j] = offguide == code
+    return X, senttot.copy(), keep
+
+
+def cells(df, keep):
+    """
+    Cell id of every kept row, and the cell table (Year, OFFGUIDE, Offense,
+    rows = all cases in the cell, n = cases with a complete design).
+    """
+    key = pd.DataFrame({'Year': df['Year'].to_numpy('int64'),
+                        'OFFGUIDE': df['OFFGUIDE'].to_numpy('int64'),
+                        'Offense': df['Offense'].astype(object).to_numpy()})
+    table = key.groupby(['Year', 'OFFGUIDE'], sort=True).agg(Offense=('Offense', 'first'),
+                                                             rows=('Offense', 'size')).reset_index()
+    ids = pd.MultiIndex.from_frame(table[['Year', 'OFFGUIDE']]).get_indexer(
+        pd.MultiIndex.from_frame(key.loc[keep, ['Year', 'OFFGUIDE']]))
+    table['n'] = np.bincount(ids, minlength=len(table))
+    return ids, table
+
+
+def _segments(ids, n_cells):
+    """Row order grouping the cells together, and each cell's [start, end) in it."""
+    order = np.argsort(ids, kind='stable')
+    bounds = np.searchsorted(ids[order], np.arange(n_cells + 1))
+    return order, bounds
+
+
+def cell_stats(X, y, ids, n_cells):
+    """Per-cell X'X [c, k, k], X'y [c, k] and y'y [c], in one pass over the rows."""
+    k = X.shape[1]
+    xtx, xty, yty = np.zeros((n_cells, k, k)), np.zeros((n_cells, k)), np.zeros(n_cells)
+    order, bounds = _segments(ids, n_cells)
+    for c in range(n_cells):
+        rows = order[bounds[c]:bounds[c + 1]]
+        Xc, yc = X[rows], y[rows]
+        xtx[c] = Xc.T @ Xc
+        xty[c] = Xc.T @ yc
+        yty[c] = yc @ yc
+    return xtx, xty, yty
+
+
+# ── Encoded features, shared by every model ──────────────────
+
+Features = namedtuple('Features', ['X', 'y', 'keys', 'index', 'cell_ids', 'cells', 'offenses'])
+
+# Columns with a row index set in Features.index
+INDEX_KEYS = ['Year', 'Offense', 'DISTRICT']
+
+
+def _index_sets(values):
+    """{value: sorted row positions} for one key column."""
+    codes, uniques = pd.factorize(values, sort=True)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return {u: order[bounds[i]:bounds[i + 1]] for i, u in enumerate(uniques.tolist())}
+
+
+def encode(df):
+    """
+    The analysis table encoded once for every model: the contiguous design X and y
+    of design(), the kept rows' keys (Year, OFFGUIDE, Offense, DISTRICT), row index
+    sets per year, offense and district, the (year, OFFGUIDE) cells, and the
+    offenses in order of first appearance.
+    """
+    X, y, keep = design(df)
+    keys = pd.DataFrame({'Year': df['Year'].to_numpy('int64')[keep],
+                         'OFFGUIDE': df['OFFGUIDE'].to_numpy('int64')[keep],
+                         'Offense': df['Offense'].astype(object).to_numpy()[keep],
+                         'DISTRICT': df['DISTRICT'].to_numpy('float64', na_value=np.nan)[keep]})
+    index = {c: _index_sets(keys[c].to_numpy()) for c in INDEX_KEYS}
+    cell_ids, table = cells(df, keep)
+    return Features(X, y, keys, index, cell_ids, table, list(pd.unique(df['Offense'].astype(object))))
+
+
+def rows(features, year=None, offense=None, district=None):
+    """Sorted positions in features.X of the rows matching every given key (a value or a list of values)."""
+    out = None
+    for name, wanted in zip(INDEX_KEYS, [year, offense, district]):
+        if wanted is None:
+            continue
+        sets = features.index[name]
+        values = wanted if isinstance(wanted, (list, tuple, set, np.ndarray)) else [wanted]
+        idx = np.sort(np.concatenate([sets[v] for v in values if v in sets] or [np.empty(0, dtype=np.int64)]))
+        out = idx if out is None else np.intersect1d(out, idx, assume_unique=True)
+    return np.arange(len(features.y)) if out is None else out
+
+
+def fit_subset(features, idx, offense_dummies=True):
+    """OLS with HC1 on the rows idx of the encoded design (a gather, no re-encoding). Returns a Fit."""
+    k = len(COLUMNS) if offense_dummies else BASE
+    X, y = features.X[idx, :k], features.y[idx]
+    beta, inv, rank = solve(X.T @ X, X.T @ y)
+    e = y - X @ beta
+    Xe = X * e[:, None]
+    n = len(y)
+    return _fit(beta, hc1(inv, Xe.T @ Xe, n, rank), 1 - (e @ e) / (y @ y - y.sum() ** 2 / n), n, COLUMNS[:k])
+
+
+# ── Solving ───────────────────────────────────────────────────
+
+def solve(xtx, xty):
+    """
+    (beta, pinv(X'X), rank) for a Gram matrix or a stack of them. The rank is read
+    off the Gram scaled to unit diagonal; the pseudo-inverse keeps that many
+    leading eigenvalues of the unscaled Gram, so rank-deficient designs get
+    statsmodels' minimum-norm coefficients.
+    """
+    scale = np.sqrt(np.diagonal(xtx, axis1=-2, axis2=-1)).copy()
+    scale[scale == 0] = 1.0
+    ws = np.linalg.eigvalsh(xtx / (scale[..., :, None] * scale[..., None, :]))
+    rank = (ws > RCOND * ws.max(axis=-1, keepdims=True)).sum(axis=-1)
+    w, V = np.linalg.eigh(xtx)
+    keep = np.arange(w.shape[-1]) >= (w.shape[-1] - rank)[..., None]  # eigh sorts ascending
+    winv = np.where(keep, 1.0 / np.where(keep, w, 1.0), 0.0)
+    inv = (V * winv[..., None, :]) @ np.swapaxes(V, -1, -2)
+    beta = (inv @ xty[..., None])[..., 0]
+    return beta, inv, rank
+
+
+def hc1(inv, meat, n, rank):
+    """HC1 covariance: n / (n - rank) * inv @ meat @ inv (NaN without residual degrees of freedom)."""
+    n, rank = np.asarray(n, dtype=np.float64), np.asarray(rank)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        factor = np.where(n > rank, n / (n - rank), np.nan)
+    return factor[..., None, None] * (inv @ meat @ inv)
+
+
+_erfc = np.frompyfunc(math.erfc, 1, 1)
+
+
+def _pvalues(z):
+    """Two-sided normal p-values, as statsmodels reports for robust covariances."""
+    return _erfc(np.abs(z) / math.sqrt(2)).astype(np.float64)
+
+
+def _fit(beta, cov, r2, n, names):
+    bse = np.sqrt(np.clip(np.diagonal(cov), 0, None))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = beta / bse
+    pvalues = _pvalues(z)
+    return Fit(pd.Series(beta, index=names), pd.Series(bse, index=names), pd.Series(pvalues, index=names),
+               float(r2), float(n))
+
+
+def fit_models(X, y, ids, xtx, xty, yty, models):
+    """
+    Fit models given as (cell ids, k): OLS on the first k columns of the rows in those cells.
+    Coefficients come from the summed cell statistics; one more pass over the rows
+    accumulates every model's HC1 meat. Returns a Fit per model.
+    """
+    solved = []
+    for model_cells, k in models:
+        G, b = xtx[model_cells, :k, :k].sum(axis=0), xty[model_cells, :k].sum(axis=0)
+        beta, inv, rank = solve(G, b)
+        solved.append((beta, inv, rank, G[0, 0], b[0], yty[model_cells].sum()))
+
+    # Second pass: each cell's meat and residual sum of squares under every model covering it
+    by_cell = {}
+    for m, (model_cells, _) in enumerate(models):
+        for c in np.atleast_1d(model_cells):
+            by_cell.setdefault(int(c), []).append(m)
+    meats = [np.zeros((k, k)) for _, k in models]
+    ssr = np.zeros(len(models))
+    order, bounds = _segments(ids, len(xtx))
+    for c, members in by_cell.items():
+        rows = order[bounds[c]:bounds[c + 1]]
+        if not len(rows):
+            continue
+        Xc, yc = X[rows], y[rows]
+        for m in members:
+            k = models[m][1]
+            e = yc - Xc[:, :k] @ solved[m][0]
+            Xe = Xc[:, :k] * e[:, None]
+            meats[m] += Xe.T @ Xe
+            ssr[m] += e @ e
+
+    fits = []
+    for m, (_, k) in enumerate(models):
+        beta, inv, rank, n, sum_y, yy = solved[m]
+        tss = yy - sum_y ** 2 / n
+        fits.append(_fit(beta, hc1(inv, meats[m], n, rank), 1 - ssr[m] / tss, n, COLUMNS[:k]))
+    return fits
+
+
+# ── Batched subgroup regressions ──────────────────────────────
+
+# Pair products per chunk in _grouped_gram (floats)
+GRAM_CHUNK = 1 << 22
+# Average rows per group from which a per-group matrix product beats the pair sums
+GRAM_BLAS_ROWS = 64
+
+
+def _grouped_gram(A, starts):
+    """
+    A'A for every group of rows of A, which must be sorted by group (group g is
+    rows starts[g]:starts[g + 1], none empty). Groups averaging GRAM_BLAS_ROWS rows
+    or more get one BLAS product each; many small groups are done as chunks of
+    row-wise pair products summed per group with np.add.reduceat. Returns [G, k, k].
+    """
+    n, k = A.shape
+    if n >= GRAM_BLAS_ROWS * (len(starts) - 1):
+        gram = np.empty((len(starts) - 1, k, k))
+        for g, (lo, hi) in enumerate(zip(starts[:-1], starts[1:])):
+            np.dot(A[lo:hi].T, A[lo:hi], out=gram[g])
+        return gram
+    a, b = np.triu_indices(k)
+    sums = np.zeros((len(starts) - 1, len(a)))
+    step = max(1, GRAM_CHUNK // len(a))
+    for lo in range(0, n, step):
+        hi = min(n, lo + step)
+        g0 = np.searchsorted(starts, lo, side='right') - 1
+        g1 = np.searchsorted(starts, hi, side='left')
+        P = A[lo:hi, a] * A[lo:hi, b]
+        sums[g0:g1] += np.add.reduceat(P, np.maximum(starts[g0:g1], lo) - lo, axis=0)
+    gram = np.zeros((len(sums), k, k))
+    gram[:, a, b] = sums
+    gram[:, b, a] = sums
+    return gram
+
+
+def _group_rows(X, y, groups, min_n, names):
+    """
+    Shared setup of the grouped fitters: (names, X, y, group id per row, group keys,
+    rows per group, groups fitted). Rows with a missing value or key are dropped,
+    groups with fewer than min_n rows left are skipped, and the rest are numbered
+    0..len(fitted)-1.
+    """
+    if names is None:
+        names = list(X.columns) if hasattr(X, 'columns') else [f'x{j}' for j in range(np.shape(X)[1])]
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keys = groups.to_frame() if isinstance(groups, pd.Series) else pd.DataFrame(groups)
+    # factorize gives a missing key a code of its own, so only rows with every key are coded
+    keyed = keys.notna().all(axis=1).to_numpy()
+    codes = np.full(len(keys), -1)
+    codes[keyed], uniques = pd.MultiIndex.from_frame(keys[keyed]).factorize(sort=True)
+    ok = (codes >= 0) & ~np.isnan(X).any(axis=1) & ~np.isnan(y)
+    counts = np.bincount(codes[ok], minlength=len(uniques))
+    fitted = np.flatnonzero(counts >= max(min_n, 1))
+    renumber = np.full(len(uniques), -1)
+    renumber[fitted] = np.arange(len(fitted))
+    ok &= renumber[np.maximum(codes, 0)] >= 0
+    keys = uniques.to_frame(index=False).set_axis(list(keys.columns), axis=1)
+    return names, X[ok], y[ok], renumber[codes[ok]], keys, counts, fitted
+
+
+def _tidy(keys, fitted, names):
+    """Key columns and term of a tidy result frame: one row per fitted group and term."""
+    out = keys.iloc[np.repeat(fitted, len(names))].reset_index(drop=True)
+    out['term'] = np.tile(names, len(fitted))
+    return out
+
+
+def collapse(X, y, gid):
+    """
+    Unique (group, covariate row) patterns, sorted by group: (gid, X, count,
+    sum of y, sum of y²) per pattern. Together these are sufficient for OLS with
+    HC1 standard errors, since every row of a pattern shares its fitted value.
+    """
+    rows = np.ascontiguousarray(np.column_stack([gid, X]))
+    _, first, inverse = np.unique(rows.view(np.dtype((np.void, rows.itemsize * rows.shape[1]))).ravel(),
+                                  return_index=True, return_inverse=True)
+    order = np.argsort(gid[first], kind='stable')
+    position = np.empty_like(order)
+    position[order] = np.arange(len(order))
+    inverse = position[inverse.ravel()]
+    first = first[order]
+    m = len(first)
+    return (gid[first], X[first], np.bincount(inverse, minlength=m).astype(np.float64),
+            np.bincount(inverse, y, minlength=m), np.bincount(inverse, y * y, minlength=m))
+
+
+def fit_groups(X, y, groups, min_n=1, collapse_patterns=False, names=None):
+    """
+    OLS with HC1 standard errors for every group at once: the same fit as
+    sm.OLS(y[g], X[g]).fit(cov_type='HC1') per group, with all groups' Grams,
+    solves and meats computed as stacked array operations.
+
+    X is a DataFrame (or array) that includes the constant, y a vector and groups a
+    Series or DataFrame of key columns, all aligned row for row. Rows with a missing
+    value or key are dropped; groups with fewer than min_n remaining rows are skipped.
+    With collapse_patterns, each group's rows are first collapsed to their unique
+    covariate patterns (count, sum of y, sum of y²) and the fit runs on those,
+    with identical results; worth it when the regressors are few small integers.
+    Returns a tidy frame, one row per group and term: the key columns, term, coef,
+    se, pvalue, r2 and n. Terms are named after X's columns, or `names` for an array.
+    """
+    names, X, y, gid, keys, counts, fitted = _group_rows(X, y, groups, min_n, names)
+    if collapse_patterns:
+        gid, Xs, w, sy, syy = collapse(X, y, gid)
+    else:
+        order = np.argsort(gid, kind='stable')
+        gid, Xs = gid[order], X[order]
+        sy = y[order]
+        w, syy = np.ones(len(sy)), sy * sy
+    starts = np.searchsorted(gid, np.arange(len(fitted) + 1))
+    k = len(names)
+
+    # Row weights: sqrt(count) * x gives X'WX, and sum_y / sqrt(count) gives X'y
+    root = np.sqrt(w)
+    gram = _grouped_gram(np.column_stack([Xs * root[:, None], sy / root]), starts)
+    beta, inv, rank = solve(gram[:, :k, :k], gram[:, :k, k])
+    # Each pattern's sum of squared residuals: sum(y²) - 2 f sum(y) + count f², f its fitted value
+    f = np.einsum('ij,ij->i', Xs, beta[gid])
+    e2 = np.clip(syy - 2 * f * sy + w * f * f, 0, None)
+    cov = hc1(inv, _grouped_gram(Xs * np.sqrt(e2)[:, None], starts), counts[fitted], rank)
+    bse = np.sqrt(np.clip(np.diagonal(cov, axis1=1, axis2=2), 0, None))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = beta / bse
+
+    # R² against the group mean when the design has a constant, as statsmodels does
+    n = counts[fitted].astype(np.float64)
+    ssr = np.bincount(gid, e2, minlength=len(fitted))
+    tss = np.bincount(gid, syy, minlength=len(fitted))
+    if len(Xs) and (Xs == 1).all(axis=0).any():
+        tss = tss - np.bincount(gid, sy, minlength=len(fitted)) ** 2 / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = 1 - ssr / tss
+
+    out = _tidy(keys, fitted, names)
+    out['coef'] = beta.ravel()
+    out['se'] = bse.ravel()
+    out['pvalue'] = _pvalues(z).ravel()
+    out['r2'] = np.repeat(r2, k)
+    out['n'] = np.repeat(counts[fitted], k)
+    return out
+
+
+# ── Batched logistic regression ──────────────────────────────
+
+# statsmodels' Newton defaults for Logit.fit
+LOGIT_MAX_ITER = 35
+LOGIT_TOL = 1e-8
+# A fitted linear predictor this large (p within ~3e-7 of 0 or 1) in a group that
+# does not converge means the outcome is (quasi-)separated, not slow convergence
+SEPARATION_ETA = 15.0
+
+
+def _expit(eta):
+    return np.exp(-np.logaddexp(0.0, -eta))
+
+
+def _solve_finite(gram, rhs):
+    """
+    solve() for the groups whose Gram and right-hand side are finite, NaN for the
+    rest; information matrices whose weights underflowed may also come back NaN.
+    """
+    ok = np.isfinite(gram).all(axis=(1, 2)) & np.isfinite(rhs).all(axis=1)
+    beta, inv, rank = np.full(rhs.shape, np.nan), np.full(gram.shape, np.nan), np.zeros(len(rhs), dtype=np.int64)
+    if ok.any():
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            beta[ok], inv[ok], rank[ok] = solve(gram[ok], rhs[ok])
+    return beta, inv, rank
+
+
+def _logit_newton(X, y, gid, starts, beta, max_iter=LOGIT_MAX_ITER, tol=LOGIT_TOL):
+    """
+    Newton-Raphson (IRLS) logits for every group of rows at once (rows sorted by
+    group, as for _grouped_gram), starting from beta [G, k]. Each iteration stacks
+    the groups' weighted Grams X'WX and scores X'(y - p) and solves them together;
+    a group stops once no coefficient moves by tol, and later iterations only touch
+    the rows of groups still moving. A group whose step overflows (a separated
+    outcome driving its estimates off to infinity) stops where it is.
+    Returns (beta, iterations, converged).
+    """
+    G = len(beta)
+    beta = beta.copy()
+    sizes = np.diff(starts)
+    iterations = np.zeros(G, dtype=np.int64)
+    converged = np.zeros(G, dtype=bool)
+    stopped = np.zeros(G, dtype=bool)
+    for _ in range(max_iter):
+        active = np.flatnonzero(~converged & ~stopped)
+        if not len(active):
+            break
+        if len(active) == G:
+            Xa, ya, local, bounds = X, y, gid, starts
+        else:
+            lengths = sizes[active]
+            bounds = np.concatenate([[0], np.cumsum(lengths)])
+            r = np.repeat(starts[active] - bounds[:-1], lengths) + np.arange(bounds[-1])
+            Xa, ya, local = X[r], y[r], np.repeat(np.arange(len(active)), lengths)
+        p = _expit(np.einsum('ij,ij->i', Xa, beta[active][local]))
+        hessian = _grouped_gram(Xa * np.sqrt(p * (1 - p))[:, None], bounds)
+        score = np.add.reduceat(Xa * (ya - p)[:, None], bounds[:-1], axis=0)
+        step = _solve_finite(hessian, score)[0]
+        moved = np.isfinite(beta[active] + step).all(axis=1)
+        beta[active[moved]] += step[moved]
+        iterations[active] += 1
+        stopped[active[~moved]] = True
+        converged[active] = moved & (np.abs(step).max(axis=1) < tol)
+    return beta, iterations, converged
+
+
+def _logit_summary(X, y, gid, starts, beta):
+    """
+    At each group's coefficients: (pinv of the information X'WX, its rank, the score
+    outer-product sum, log-likelihood, null log-likelihood, largest |X beta|).
+    """
+    G = len(beta)
+    eta = np.einsum('ij,ij->i', X, beta[gid])
+    p = _expit(eta)
+    inv, rank = _solve_finite(_grouped_gram(X * np.sqrt(p * (1 - p))[:, None], starts), np.zeros(beta.shape))[1:]
+    meat = _grouped_gram(X * (y - p)[:, None], starts)
+    # y log p + (1 - y) log(1 - p), from log-sum-exp so extreme eta stay finite
+    llf = np.bincount(gid, y * eta - np.logaddexp(0.0, eta), minlength=G)
+    n = np.diff(starts).astype(np.float64)
+    ybar = np.bincount(gid, y, minlength=G) / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        llnull = n * np.where((ybar > 0) & (ybar < 1), ybar * np.log(ybar) + (1 - ybar) * np.log1p(-ybar), 0.0)
+    return inv, rank, meat, llf, llnull, np.fmax.reduceat(np.abs(eta), starts[:-1])
+
+
+def _logit_status(y, gid, starts, converged, max_eta, rank, k):
+    """'converged', 'separation', 'rank deficient' or 'not converged' per group."""
+    n = np.diff(starts)
+    ones = np.bincount(gid, y, minlength=len(n))
+    separated = (ones == 0) | (ones == n) | (~converged & ~(max_eta <= SEPARATION_ETA))
+    status = np.where(converged, 'converged', 'not converged').astype(object)
+    status[rank < k] = 'rank deficient'
+    status[separated] = 'separation'
+    return status
+
+
+def fit_logit(X, y, cov='nonrobust', names=None):
+    """
+    Logit by Newton-Raphson, as sm.Logit(y, X).fit() (or .fit(cov_type='HC1') with
+    cov='HC1': the score sandwich, which statsmodels leaves without a degrees-of-freedom
+    factor for a likelihood model), X including the constant. Returns a Fit whose
+    rsquared is McFadden's pseudo R², as statsmodels' prsquared.
+    """
+    if names is None:
+        names = list(X.columns) if hasattr(X, 'columns') else [f'x{j}' for j in range(np.shape(X)[1])]
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    gid, starts = np.zeros(len(y), dtype=np.int64), np.array([0, len(y)])
+    beta = _logit_newton(X, y, gid, starts, np.zeros((1, X.shape[1])))[0]
+    inv, rank, meat, llf, llnull, _ = _logit_summary(X, y, gid, starts, beta)
+    if cov == 'HC1':
+        inv = inv @ meat @ inv
+    return _fit(beta[0], inv[0], 1 - llf[0] / llnull[0], len(y), names)
+
+
+def fit_logit_groups(X, y, groups, min_n=1, cov='HC1', names=None, max_iter=LOGIT_MAX_ITER, tol=LOGIT_TOL):
+    """
+    A logit for every group at once: the pooled logit is fitted first and every
+    group's Newton iterations start from its coefficients, with all groups'
+    information matrices, scores and solves done as stacked array operations.
+    Arguments and row handling are those of fit_groups; y is 0/1. Standard errors
+    are fit_logit's HC1 sandwiches (cov='nonrobust' for the inverse information).
+    Returns a tidy frame, one row per group and term: the key columns, term, coef,
+    odds_ratio, se, pvalue, n, iterations and status: 'converged', 'separation'
+    (the outcome is constant or (quasi-)perfectly predicted in the group, so its
+    estimates run off to infinity), 'rank deficient' (collinear columns in the
+    group, so its coefficients are the minimum-norm ones and not identified) or
+    'not converged' within max_iter.
+    """
+    names, X, y, gid, keys, counts, fitted = _group_rows(X, y, groups, min_n, names)
+    order = np.argsort(gid, kind='stable')
+    gid, X, y = gid[order], X[order], y[order]
+    starts = np.searchsorted(gid, np.arange(len(fitted) + 1))
+    k = len(names)
+
+    pooled = _logit_newton(X, y, np.zeros(len(y), dtype=np.int64), np.array([0, len(y)]),
+                           np.zeros((1, k)), max_iter, tol)[0]
+    beta, iterations, converged = _logit_newton(X, y, gid, starts, np.repeat(pooled, len(fitted), axis=0),
+                                                max_iter, tol)
+    inv, rank, meat, _, _, max_eta = _logit_summary(X, y, gid, starts, beta)
+    cov = inv @ meat @ inv if cov == 'HC1' else inv
+    bse = np.sqrt(np.clip(np.diagonal(cov, axis1=1, axis2=2), 0, None))
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        z = beta / bse
+        odds = np.exp(beta)
+
+    out = _tidy(keys, fitted, names)
+    out['coef'] = beta.ravel()
+    out['odds_ratio'] = odds.ravel()
+    out['se'] = bse.ravel()
+    out['pvalue'] = _pvalues(z).ravel()
+    out['n'] = np.repeat(counts[fitted], k)
+    out['iterations'] = np.repeat(iterations, k)
+    out['status'] = np.repeat(_logit_status(y, gid, starts, converged, max_eta, rank, k), k)
+    return out
+
+
+# ── Sparse designs ───────────────────────────────────────────
+
+def sparse_design(df, offense_dummies=True, dummies=()):
+    """
+    (X, y, names): the design of design() as a scipy.sparse CSR matrix, optionally
+    without the offense dummies and with a dummy per level (but the first) of each
+    column in `dummies` (e.g. DISTRICT, Year). Built from each column's nonzeros, so
+    memory grows with the number of nonzeros, not rows × columns.
+    """
+    from scipy import sparse
+    raw_columns = RAW_COLUMNS if offense_dummies else RAW_COLUMNS[:-1]
+    raw = np.column_stack([df[c].to_numpy('float64', na_value=np.nan) for c in raw_columns])
+    keep = ~np.isnan(raw).any(axis=1)
+    for c in dummies:
+        keep &= df[c].notna().to_numpy()
+    raw = raw[keep]
+    senttot, newrace, monsex, age, xminsor, crimpts, citizen, weapon = raw.T[:8]
+    dense = [np.ones(len(raw)), newrace == 2, newrace == 3, monsex == 1, xminsor, crimpts, age, citizen == 3, weapon]
+    names = COLUMNS[:BASE]
+    if offense_dummies:
+        dense += [raw[:, 8] == code for code in OFFENSE_DUMMIES]
+        names = COLUMNS
+
+    rows, cols, data = [], [], []
+    for j, v in enumerate(dense):
+        nz = np.flatnonzero(v)
+        rows.append(nz)
+        cols.append(np.full(len(nz), j))
+        data.append(np.asarray(v, dtype=np.float64)[nz])
+    names = list(names)
+    for c in dummies:
+        codes, levels = pd.factorize(df[c].to_numpy()[keep], sort=True)
+        nz = np.flatnonzero(codes > 0)
+        rows.append(nz)
+        cols.append(len(names) + codes[nz] - 1)
+        data.append(np.ones(len(nz)))
+        names += [f'{c}_{level}' for level in levels[1:]]
+    X = sparse.csr_matrix((np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+                          shape=(len(raw), len(names)))
+    return X, senttot.copy(), names
+
+
+def fit_sparse(X, y, names, solver='normal'):
+    """
+    OLS with HC1 standard errors on a sparse design (first column the constant).
+    solver='normal' solves the sparse normal equations X'X b = X'y; 'lsqr' solves
+    the least-squares problem on X itself (scipy.sparse.linalg.lsqr), avoiding the
+    squared condition number of X'X. The HC1 covariance uses pinv(X'X) and the
+    sparse meat X' diag(e²) X either way. Returns a Fit, as statsmodels reports it.
+    """
+    X = X.tocsr()
+    n, k = X.shape
+    beta, inv, rank = solve((X.T @ X).toarray(), X.T @ y)
+    if solver == 'lsqr':
+        from scipy.sparse.linalg import lsqr
+        beta = lsqr(X, y, atol=1e-14, btol=1e-14, iter_lim=10 * k)[0]
+    elif solver != 'normal':
+        raise ValueError(f"Unknown solver: {solver}")
+    e = y - X @ beta
+    meat = (X.T @ X.multiply((e * e)[:, None])).toarray()
+    r2 = 1 - (e @ e) / (y @ y - y.sum() ** 2 / n)
+    return _fit(beta, hc1(inv, meat, n, rank), r2, n, names)
+
+
+# ── Streaming from the case store ─────────────────────────────
+
+# Working-set budget for fit_streaming: a chunk's raw columns, design and temporaries
+STREAM_BUDGET_MB = 256
+
+
+def stream_chunk_rows(budget_mb=STREAM_BUDGET_MB):
+    """Rows per chunk so that a chunk's raw frame, design and temporaries stay within budget_mb (with 4× headroom)."""
+    bytes_per_row = 8 * (2 * len(RAW_COLUMNS) + 3 * len(COLUMNS))
+    return max(1000, budget_mb * 1024 * 1024 // (4 * bytes_per_row))
+
+
+def store_chunks(budget_mb=STREAM_BUDGET_MB, path=None):
+    """Factory of chunk iterators over the valid rows of the case store, sized for budget_mb."""
+    import case_store
+    path = path or case_store.STORE_PATH
+    return lambda: case_store.iter_store(columns=RAW_COLUMNS, filters=case_store.VALID_FILTERS,
+                                         batch_rows=stream_chunk_rows(budget_mb), path=path)
+
+
+def fit_streaming(chunks, k=len(COLUMNS)):
+    """
+    The overall model (first k design columns) from a stream of raw chunks, in two
+    passes: X'X, X'y and y'y, then, under the solved coefficients, the HC1 meat.
+    `chunks` is called once per pass and must yield frames with RAW_COLUMNS.
+    Only one chunk's design is held at a time. Returns a Fit.
+    """
+    xtx, xty, yy, sum_y, n = np.zeros((k, k)), np.zeros(k), 0.0, 0.0, 0
+    for chunk in chunks():
+        X, y, _ = design(chunk)
+        X = X[:, :k]
+        xtx += X.T @ X
+        xty += X.T @ y
+        yy += y @ y
+        sum_y += y.sum()
+        n += len(y)
+    beta, inv, rank = solve(xtx, xty)
+
+    meat, ssr = np.zeros((k, k)), 0.0
+    for chunk in chunks():
+        X, y, _ = design(chunk)
+        X = X[:, :k]
+        e = y - X @ beta
+        Xe = X * e[:, None]
+        meat += Xe.T @ Xe
+        ssr += e @ e
+    return _fit(beta, hc1(inv, meat, n, rank), 1 - ssr / (yy - sum_y ** 2 / n), n, COLUMNS[:k])
+
+
+# ── Absorbed fixed effects ────────────────────────────────────
+
+def demean(v, codes, sizes, tol=1e-10, max_iter=1000):
+    """
+    Residual of v (in place) after projecting out every fixed-effect set, by
+    alternating projections: subtract each set's group means in turn until a
+    sweep moves v by less than tol relative to its scale. Returns the sweeps used.
+    """
+    scale = max(np.abs(v).max(), 1.0)
+    for sweep in range(1, max_iter + 1):
+        change = 0.0
+        for c, counts in zip(codes, sizes):
+            means = np.bincount(c, weights=v, minlength=len(counts)) / counts
+            v -= means[c]
+            change = max(change, np.abs(means).max())
+        if change <= tol * scale:
+            return sweep
+    print(f"  ⚠️  Fixed effects not converged after {max_iter} sweeps ({change:.2g})")
+    return max_iter
+
+
+def fit_absorbed(X, y, fe, cluster=None, tol=1e-10, max_iter=1000):
+    """
+    OLS of y on X with the categorical columns of `fe` absorbed as fixed effects:
+    the same coefficients as adding a dummy per level, without building them.
+    X must not include a constant (the fixed effects absorb it). Columns are
+    demeaned one at a time, so memory stays at about the size of X.
+
+    Standard errors are HC1, or clustered on `cluster` (statsmodels' cluster
+    correction), with degrees of freedom counting the absorbed levels as the
+    dummy regression would (levels - 1 per set beyond the first, assuming the
+    sets are connected). R² is that of the full model, fixed effects included.
+    Rows with a missing value, level or cluster are dropped. Returns a Fit.
+    """
+    names = list(X.columns) if hasattr(X, 'columns') else [f'x{j}' for j in range(np.shape(X)[1])]
+    X = np.array(X, dtype=np.float64)
+    y = np.array(y, dtype=np.float64)
+    fe = pd.DataFrame(fe)
+    codes = np.stack([pd.factorize(fe[c])[0] for c in fe.columns])
+    ok = ~np.isnan(X).any(axis=1) & ~np.isnan(y) & (codes >= 0).all(axis=0)
+    if cluster is not None:
+        clusters = pd.factorize(np.asarray(cluster))[0]
+        ok &= clusters >= 0
+        clusters = pd.factorize(clusters[ok])[0]
+    X, y, codes = X[ok], y[ok], codes[:, ok]
+    # Re-number levels over the rows kept, so every level has cases
+    codes = np.stack([pd.factorize(c)[0] for c in codes])
+    sizes = [np.bincount(c) for c in codes]
+    n = len(y)
+
+    tss = ((y - y.mean()) ** 2).sum()
+    demean(y, codes, sizes, tol, max_iter)
+    for j in range(X.shape[1]):
+        demean(X[:, j], codes, sizes, tol, max_iter)
+
+    beta, inv, rank = solve(X.T @ X, X.T @ y)
+    e = y - X @ beta
+    k = rank + sum(len(c) for c in sizes) - (len(sizes) - 1)
+    if cluster is None:
+        Xe = X * e[:, None]
+        cov = n / (n - k) * (inv @ (Xe.T @ Xe) @ inv)
+    else:
+        g = clusters.max() + 1
+        scores = np.stack([np.bincount(clusters, weights=X[:, j] * e, minlength=g) for j in range(X.shape[1])], axis=1)
+        cov = g / (g - 1) * (n - 1) / (n - k) * (inv @ (scores.T @ scores) @ inv)
+    bse = np.sqrt(np.clip(np.diagonal(cov), 0, None))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = beta / bse
+    return Fit(pd.Series(beta, index=names), pd.Series(bse, index=names), pd.Series(_pvalues(z), index=names),
+               float(1 - (e @ e) / tss), float(n))
+
+
+# District, year and offense (OFFGUIDE) fixed effects, errors clustered by district
+FE_ABSORB = ['DISTRICT', 'Year', 'OFFGUIDE']
+FE_CLUSTER = 'DISTRICT'
+
+
+def fit_fixed_effects(features, absorb=FE_ABSORB, cluster=FE_CLUSTER):
+    """The overall model's predictors (from encode()) with `absorb` as fixed effects in place of the offense dummies."""
+    X = pd.DataFrame(features.X[:, 1:BASE], columns=PREDICTORS)
+    keys = features.keys
+    return fit_absorbed(X, features.y, keys[absorb], cluster=keys[cluster].to_numpy() if cluster else None)
+
+
+# ── Stored cell moments (for the deployed app) ───────────────
+
+def cell_moments(X, y, ids, n_cells):
+    """Per-cell sums of every product of four entries of u = [const, predictors, y]: [c, len(_QUADS)]."""
+    pair_pos = {pair: i for i, pair in enumerate(_PAIRS)}
+    rows_of = np.array([pair_pos[q[:2]] for q in _QUADS])
+    cols_of = np.array([pair_pos[q[2:]] for q in _QUADS])
+    a, b = np.array(_PAIRS).T
+    moments = np.zeros((n_cells, len(_QUADS)))
+    order, bounds = _segments(ids, n_cells)
+    for c in range(n_cells):
+        rows = order[bounds[c]:bounds[c + 1]]
+        u = np.column_stack([X[rows, :BASE], y[rows]])
+        P = u[:, a] * u[:, b]
+        moments[c] = (P.T @ P)[rows_of, cols_of]
+    return moments
+
+
+def build_cells(features):
+    """(cell table, cell moments) for the encoded analysis table."""
+    return features.cells, cell_moments(features.X, features.y, features.cell_ids, len(features.cells))
+
+
+def save_cells(table, moments, path=CELLS_PATH):
+    np.savez_compressed(path, year=table['Year'].to_numpy(), offguide=table['OFFGUIDE'].to_numpy(),
+                        offense=table['Offense'].to_numpy(str), rows=table['rows'].to_numpy(),
+                        n=table['n'].to_numpy(), moments=moments)
+
+
+def load_cells(path=CELLS_PATH):
+    """(cell table, cell moments) as saved by precompute, or None if there are none."""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as z:
+        table = pd.DataFrame({'Year': z['year'], 'OFFGUIDE': z['offguide'], 'Offense': z['offense'].astype(object),
+                              'rows': z['rows'], 'n': z['n']})
+        return table, z['moments']
+
+
+def _embedding(code, k):
+    """A [k, BASE] with x = A z for a row of offense `code`: the offense dummy copies the constant."""
+    A = np.zeros((k, BASE))
+    A[:BASE] = np.eye(BASE)
+    if k > BASE and code in OFFENSE_DUMMIES:
+        A[BASE + OFFENSE_DUMMIES.index(code), 0] = 1.0
+    return A
+
+
+def solve_cells(table, moments, members, offense_dummies=True):
+    """
+    OLS with HC1 over the union of cells `members` (positions in table), from their
+    moments alone. Cells sharing an offense code share their dummy pattern, so their
+    moments are summed before being expanded. Returns a Fit, or None for no cases.
+    """
+    k = len(COLUMNS) if offense_dummies else BASE
+    codes = table['OFFGUIDE'].to_numpy()[members]
+    groups = []
+    G, b, yy = np.zeros((k, k)), np.zeros(k), 0.0
+    for code in np.unique(codes):
+        T = moments[members[codes == code]].sum(axis=0)[_QUAD_INDEX]
+        A = _embedding(int(code), k)
+        G += A @ T[:BASE, :BASE, 0, 0] @ A.T
+        b += A @ T[:BASE, BASE, 0, 0]
+        yy += T[BASE, BASE, 0, 0]
+        groups.append((T, A))
+    n = G[0, 0]
+    if not n:
+        return None
+    beta, inv, rank = solve(G, b)
+
+    # Residuals e = u'w with w = [-A'beta, 1]: sum(e^2 z z') = T . w . w, per offense code
+    meat, ssr = np.zeros((k, k)), 0.0
+    for T, A in groups:
+        w = np.append(-(A.T @ beta), 1.0)
+        meat += A @ np.einsum('abcd,c,d->ab', T[:BASE, :BASE], w, w) @ A.T
+        ssr += w @ T[:, :, 0, 0] @ w
+    return _fit(beta, hc1(inv, meat, n, rank), 1 - ssr / (yy - b[0] ** 2 / n), n, COLUMNS[:k])
+
+
+# ── Precompute's regression sections ──────────────────────────
+
+TREND_OFFENSES = ["Drug Trafficking", "Firearms", "Robbery"]
+
+
+def fit_sections(features):
+    """
+    The overall, yearly, by-offense and offense-trend models of precompute.py
+    (same subgroups and size thresholds), from two passes over the encoded design.
+    Returns {'overall': Fit, 'yearly': {year: Fit}, 'by_offense': {offense: Fit},
+    'trends': {offense: {year: Fit}}}, in precompute's iteration order.
+    """
+    X, y, ids, table = features.X, features.y, features.cell_ids, features.cells
+    xtx, xty, yty = cell_stats(X, y, ids, len(table))
+    K = len(COLUMNS)
+
+    models, slots = [(np.arange(len(table)), K)], [('overall', None, None)]
+    for year in sorted(table['Year'].unique()):
+        members = np.flatnonzero(table['Year'] == year)
+        if table['n'].iloc[members].sum() >= 50:
+            models.append((members, K))
+            slots.append(('yearly', int(year), None))
+    # Offenses in order of first appearance, as df['Offense'].unique() gives
+    for offense in features.offenses:
+        members = np.flatnonzero(table['Offense'] == offense)
+        if table['rows'].iloc[members].sum() >= 200 and table['n'].iloc[members].sum() >= 200:
+            models.append((members, BASE))
+            slots.append(('by_offense', offense, None))
+    for offense in TREND_OFFENSES:
+        for year in sorted(table['Year'].unique()):
+            members = np.flatnonzero((table['Offense'] == offense) & (table['Year'] == year))
+            if table['rows'].iloc[members].sum() >= 100 and table['n'].iloc[members].sum() >= 50:
+                models.append((members, BASE))
+                slots.append(('trends', offense, int(year)))
+
+    out = {'overall': None, 'yearly': {}, 'by_offense': {}, 'trends': {o: {} for o in TREND_OFFENSES}}
+    for (section, a, b), fit in zip(slots, fit_models(X, y, ids, xtx, xty, yty, models)):
+        if section == 'overall':
+            out['overall'] = fit
+        elif section == 'trends':
+            out['trends'][a][b] = fit
+        else:
+            out[section][a] = fit
+    return out
+
+
+# ── Leniency logits ───────────────────────────────────────────
+
+# Groupings of the leniency breakdowns: label → key column of Features.keys
+LENIENCY_BY = {'Year': 'Year', 'Offense': 'Offense', 'District': 'DISTRICT'}
+LENIENCY_MIN_N = 200
+
+
+def leniency_design(features):
+    """(X [n, BASE], below) of the leniency logit: the design's predictors, and 1 where SENTTOT < XMINSOR."""
+    X = features.X[:, :BASE]
+    return X, (features.y < X[:, COLUMNS.index('XMINSOR')]).astype(np.float64)
+
+
+def fit_leniency(features):
+    """The pooled leniency logit of precompute.py (model standard errors). Returns a Fit."""
+    X, below = leniency_design(features)
+    return fit_logit(X, below, names=COLUMNS[:BASE])
+
+
+def fit_leniency_groups(features, key, min_n=LENIENCY_MIN_N):
+    """The leniency logit per value of the key column (e.g. 'Year', 'DISTRICT'): fit_logit_groups' frame."""
+    X, below = leniency_design(features)
+    return fit_logit_groups(X, below, features.keys[key], min_n=min_n, names=COLUMNS[:BASE])
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Fit the overall model by streaming the case store")
+    parser.add_argument("--budget-mb", type=int, default=STREAM_BUDGET_MB,
+                        help=f"working-set budget per chunk (default {STREAM_BUDGET_MB})")
+    args = parser.parse_args()
+    print(f"Streaming the case store in chunks of {stream_chunk_rows(args.budget_mb):,} rows...")
+    model = fit_streaming(store_chunks(args.budget_mb))
+    print(f"N = {int(model.nobs):,}   R² = {model.rsquared:.4f}")
+    for var in PREDICTORS:
+        print(f"  {var:<14s} {model.params[var]:>+9.3f}  (HC1 se {model.bse[var]:.3f}, p={model.pvalues[var]:.4f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,31 +22,38 @@ def _load_precomputed():
 def _has_precomputed():
     return _load_precomputed() is not None
 
+_CELLS_PATH = os.path.join(os.path.dirname(__file__), "data", "regression_cells.npz")
+_CELLS = None
+
+def _load_cells():
+    """Per-(year, offense) regression cells saved by precompute.py, or None."""
+    global _CELLS
+    if _CELLS is None:
+        import regression_engine
+        _CELLS = regression_engine.load_cells(_CELLS_PATH)
+    return _CELLS
+
 
 # ── Live computation helpers (only used locally) ──
 
-_OFFENSE_DUMMIES = [1, 4, 5, 7, 13, 16, 17, 21, 22, 26, 27, 30]
-
-def _prepare_features(df, include_offense_dummies=True):
-    import statsmodels.api as sm
-    cols = ['SENTTOT', 'NEWRACE', 'MONSEX', 'AGE', 'XMINSOR', 'CRIMPTS', 'CITIZEN', 'WEAPON']
-    if include_offense_dummies:
-        cols.append('OFFGUIDE')
-    data = df[cols].copy()
-    data['Black'] = (data['NEWRACE'] == 2).astype(int)
-    data['Hispanic'] = (data['NEWRACE'] == 3).astype(int)
-    data['Female'] = (data['MONSEX'] == 1).astype(int)
-    data['IllegalAlien'] = (data['CITIZEN'] == 3).astype(int)
-    data = data.dropna()
-    predictors = ['Black', 'Hispanic', 'Female', 'XMINSOR', 'CRIMPTS', 'AGE', 'IllegalAlien', 'WEAPON']
-    if include_offense_dummies:
-        for code in _OFFENSE_DUMMIES:
-            col = f'off_{code}'
-            data[col] = (data['OFFGUIDE'] == code).astype(int)
-            predictors.append(col)
-    X = sm.add_constant(data[predictors])
-    y = data['SENTTOT']
-    return X, y
+def _prepare_sparse_features(df, include_offense_dummies=True, dummies=()):
+    """
+    (X, y, columns) for the controlled models with X a scipy.sparse CSR matrix, which
+    can also carry dummies for the `dummies` columns (e.g. DISTRICT, Year); fit it
+    with regression_engine.fit_sparse.
+    """
+    import regression_engine
+    return regression_engine.sparse_design(df, include_offense_dummies, dummies)
+
+_FEATURES = None
+
+def _features(df):
+    """regression_engine.encode(df), encoded once per case table and shared by the live fallbacks."""
+    global _FEATURES
+    if _FEATURES is None or _FEATURES[0] is not df:
+        import regression_engine
+        _FEATURES = (df, regression_engine.encode(df))
+    return _FEATURES[1]
 
 _VAR_NAMES = {
     'Black': 'Black (vs White)', 'Hispanic': 'Hispanic (vs White)',
@@ -56,21 +63,94 @@ _VAR_NAMES = {
 }
 
 
+def _fit_overall(df):
+    """The overall model on df's unique covariate patterns, as a term-indexed frame."""
+    import regression_engine
+    f = _features(df)
+    model = pd.Series(0, index=range(len(f.y)), name='model')
+    return regression_engine.fit_groups(f.X, f.y, model, collapse_patterns=True,
+                                        names=regression_engine.COLUMNS).set_index('term')
+
+
 @st.cache_data
 def run_overall_regression(df=None):
     pc = _load_precomputed()
     if pc:
         return pc['overall']
-    import statsmodels.api as sm
-    X, y = _prepare_features(df)
-    model = sm.OLS(y, X).fit(cov_type='HC1')
+    fit = _fit_overall(df)
     coefficients = []
     for var in ['Black', 'Hispanic', 'Female', 'XMINSOR', 'CRIMPTS', 'AGE', 'IllegalAlien', 'WEAPON']:
         coefficients.append({
             'variable': _VAR_NAMES.get(var, var),
-            'effect': round(model.params[var], 2),
-            'pvalue': round(model.pvalues[var], 6),
-            'significant': model.pvalues[var] < 0.05,
+            'effect': round(fit.at[var, 'coef'], 2),
+            'pvalue': round(fit.at[var, 'pvalue'], 6),
+            'significant': fit.at[var, 'pvalue'] < 0.05,
+        })
+    return {
+        'r_squared': round(fit['r2'].iloc[0], 4),
+        'n_obs': int(fit['n'].iloc[0]),
+        'coefficients': coefficients,
+    }
+
+
+@st.cache_data
+def run_fixed_effects_regression(df=None):
+    """
+    The overall model with district, year and offense fixed effects absorbed
+    (standard errors clustered by district). None if neither precomputed nor df.
+    """
+    pc = _load_precomputed()
+    if pc:
+        return pc.get('fixed_effects')
+    if df is None:
+        return None
+    import regression_engine
+    model = regression_engine.fit_fixed_effects(_features(df))
+    return {
+        'absorbed': regression_engine.FE_ABSORB,
+        'cluster': regression_engine.FE_CLUSTER,
+        'r_squared': round(model.rsquared, 4),
+        'n_obs': int(model.nobs),
+        'coefficients': [{
+            'variable': _VAR_NAMES.get(var, var),
+            'effect': round(float(model.params[var]), 2),
+            'pvalue': round(float(model.pvalues[var]), 6),
+            'significant': bool(model.pvalues[var] < 0.05),
+        } for var in regression_engine.PREDICTORS],
+    }
+
+
+@st.cache_data
+def run_controlled_regression(years=None, offenses=None, df=None, offense_dummies=True):
+    """
+    The overall model (HC1; offense dummies unless offense_dummies=False, as in the
+    by-offense models) restricted to a year range (lo, hi) and/or a list of offenses. Solved from the stored regression cells when present, so it
+    works on Render; otherwise the cells are built from df. None if under 50 cases,
+    or if there are neither stored cells nor df.
+    """
+    import regression_engine
+    cells = _load_cells()
+    if cells is None:
+        if df is None:
+            return None
+        cells = regression_engine.build_cells(_features(df))
+    table, moments = cells
+    mask = np.ones(len(table), dtype=bool)
+    if years is not None:
+        mask &= table['Year'].between(*years).to_numpy()
+    if offenses:
+        mask &= table['Offense'].isin(offenses).to_numpy()
+    members = np.flatnonzero(mask)
+    if table['n'].iloc[members].sum() < 50:
+        return None
+    model = regression_engine.solve_cells(table, moments, members, offense_dummies)
+    coefficients = []
+    for var in regression_engine.PREDICTORS:
+        coefficients.append({
+            'variable': _VAR_NAMES.get(var, var),
+            'effect': round(float(model.params[var]), 2),
+            'pvalue': round(float(model.pvalues[var]), 6),
+            'significant': bool(model.pvalues[var] < 0.05),
         })
     return {
         'r_squared': round(model.rsquared, 4),
@@ -79,29 +159,37 @@ def run_overall_regression(df=None):
     }
 
 
+@st.cache_data
+def controlled_options(df=None):
+    """(years, offenses) run_controlled_regression can be restricted to; None if there are neither stored cells nor df."""
+    cells = _load_cells()
+    if cells is not None:
+        table = cells[0]
+        return sorted(int(y) for y in table['Year'].unique()), sorted(table['Offense'].unique())
+    if df is None:
+        return None
+    return sorted(int(y) for y in df['Year'].unique()), sorted(df['Offense'].astype(str).unique())
+
+
 @st.cache_data
 def run_yearly_regression(df=None):
     pc = _load_precomputed()
     if pc:
         return pd.DataFrame(pc['yearly'])
-    import statsmodels.api as sm
+    import regression_engine
+    f = _features(df)
+    fits = regression_engine.fit_groups(f.X, f.y, f.keys['Year'], min_n=50, collapse_patterns=True,
+                                        names=regression_engine.COLUMNS)
     rows = []
-    for year in sorted(df['Year'].unique()):
-        sub = df[df['Year'] == year]
-        try:
-            X, y = _prepare_features(sub)
-            if len(y) < 50:
-                continue
-            model = sm.OLS(y, X).fit(cov_type='HC1')
-            rows.append({
-                'Year': year, 'Black_Effect': round(model.params['Black'], 2),
-                'Black_pvalue': round(model.pvalues['Black'], 6),
-                'Female_Effect': round(model.params['Female'], 2),
-                'Hispanic_Effect': round(model.params['Hispanic'], 2),
-                'R2': round(model.rsquared, 4), 'N': int(model.nobs),
-            })
-        except Exception:
-            continue
+    for year, fit in fits.groupby('Year', sort=True):
+        fit = fit.set_index('term')
+        rows.append({
+            'Year': year, 'Black_Effect': round(fit.at['Black', 'coef'], 2),
+            'Black_pvalue': round(fit.at['Black', 'pvalue'], 6),
+            'Female_Effect': round(fit.at['Female', 'coef'], 2),
+            'Hispanic_Effect': round(fit.at['Hispanic', 'coef'], 2),
+            'R2': round(fit['r2'].iloc[0], 4), 'N': int(fit['n'].iloc[0]),
+        })
     return pd.DataFrame(rows)
 
 
@@ -110,25 +198,21 @@ def run_offense_regressions(df=None, min_cases=200):
     pc = _load_precomputed()
     if pc:
         return pd.DataFrame(pc['by_offense'])
-    import statsmodels.api as sm
+    import regression_engine
+    f = _features(df)
+    sizes = df['Offense'].astype(object).value_counts()
+    idx = regression_engine.rows(f, offense=list(sizes.index[sizes >= min_cases]))
+    fits = regression_engine.fit_groups(f.X[idx, :regression_engine.BASE], f.y[idx], f.keys['Offense'].iloc[idx],
+                                        min_n=min_cases, names=regression_engine.COLUMNS[:regression_engine.BASE])
     rows = []
-    for offense in df['Offense'].unique():
-        sub = df[df['Offense'] == offense]
-        if len(sub) < min_cases:
-            continue
-        try:
-            X, y = _prepare_features(sub, include_offense_dummies=False)
-            if len(y) < min_cases:
-                continue
-            model = sm.OLS(y, X).fit(cov_type='HC1')
-            p = model.pvalues['Black']
-            stars = '***' if p < 0.001 else '**' if p < 0.01 else '*' if p < 0.05 else ''
-            rows.append({
-                'Offense': offense, 'Black_Effect': round(model.params['Black'], 2),
-                'Black_pvalue': round(p, 6), 'Significance_Stars': stars, 'N': int(model.nobs),
-            })
-        except Exception:
-            continue
+    for name, fit in fits.groupby('Offense', sort=False):
+        fit = fit.set_index('term')
+        p = fit.at['Black', 'pvalue']
+        stars = '***' if p < 0.001 else '**' if p < 0.01 else '*' if p < 0.05 else ''
+        rows.append({
+            'Offense': name, 'Black_Effect': round(fit.at['Black', 'coef'], 2),
+            'Black_pvalue': round(p, 6), 'Significance_Stars': stars, 'N': int(fit['n'].iloc[0]),
+        })
     return pd.DataFrame(rows).sort_values('Black_Effect', ascending=False).reset_index(drop=True)
 
 
@@ -137,20 +221,10 @@ def run_leniency_regression(df=None):
     pc = _load_precomputed()
     if pc:
         return pc['leniency']
-    import statsmodels.api as sm
-    data = df[['Below Guideline', 'NEWRACE', 'MONSEX', 'AGE', 'XMINSOR', 'CRIMPTS', 'CITIZEN', 'WEAPON']].copy()
-    data['Black'] = (data['NEWRACE'] == 2).astype(int)
-    data['Hispanic'] = (data['NEWRACE'] == 3).astype(int)
-    data['Female'] = (data['MONSEX'] == 1).astype(int)
-    data['IllegalAlien'] = (data['CITIZEN'] == 3).astype(int)
-    data['Below_Guideline'] = data['Below Guideline'].astype(int)
-    data = data.dropna()
-    predictors = ['Black', 'Hispanic', 'Female', 'XMINSOR', 'CRIMPTS', 'AGE', 'IllegalAlien', 'WEAPON']
-    X = sm.add_constant(data[predictors])
-    y = data['Below_Guideline']
-    model = sm.Logit(y, X).fit(disp=0)
+    import regression_engine
+    model = regression_engine.fit_leniency(_features(df))
     results = []
-    for var in predictors:
+    for var in regression_engine.PREDICTORS:
         results.append({
             'variable': _VAR_NAMES.get(var, var),
             'odds_ratio': round(np.exp(model.params[var]), 4),
@@ -160,6 +234,41 @@ def run_leniency_regression(df=None):
     return results
 
 
+@st.cache_data
+def run_leniency_by(by='Year', df=None):
+    """
+    Leniency odds ratios (Black, Hispanic, Female) per Year, Offense or District, one
+    logit each with robust SEs. Groups whose fit hit separation, had collinear
+    controls or did not converge keep their row with Status set and no odds
+    ratios. None if neither precomputed nor df.
+    """
+    pc = _load_precomputed()
+    if pc:
+        return pd.DataFrame(pc['leniency_by'][by]) if 'leniency_by' in pc else None
+    if df is None:
+        return None
+    import regression_engine
+    from cubes import _district_name
+    key = regression_engine.LENIENCY_BY[by]
+    rows = []
+    for value, fit in regression_engine.fit_leniency_groups(_features(df), key).groupby(key, sort=True):
+        fit = fit.set_index('term')
+        ok = fit['status'].iloc[0] == 'converged'
+        if by == 'District':
+            value = _district_name(value)
+        elif by == 'Year':
+            value = int(value)
+        rows.append({
+            by: value,
+            'Black_OR': round(fit.at['Black', 'odds_ratio'], 4) if ok else None,
+            'Black_pvalue': round(fit.at['Black', 'pvalue'], 6) if ok else None,
+            'Hispanic_OR': round(fit.at['Hispanic', 'odds_ratio'], 4) if ok else None,
+            'Female_OR': round(fit.at['Female', 'odds_ratio'], 4) if ok else None,
+            'N': int(fit['n'].iloc[0]), 'Status': fit['status'].iloc[0],
+        })
+    return pd.DataFrame(rows)
+
+
 @st.cache_data
 def get_offense_trends(df=None):
     """Returns dict of {offense: DataFrame with Year, Effect}."""
@@ -167,23 +276,21 @@ def get_offense_trends(df=None):
     if pc:
         return {k: pd.DataFrame(v) for k, v in pc['offense_trends'].items()}
     # Live fallback
-    import statsmodels.api as sm
+    import regression_engine
+    offenses = ["Drug Trafficking", "Firearms", "Robbery"]
+    f = _features(df)
+    sizes = pd.DataFrame({"Offense": df["Offense"].astype(object), "Year": df["Year"]}).value_counts()
+    idx = regression_engine.rows(f, offense=offenses)
+    keys = f.keys[["Offense", "Year"]].iloc[idx]
+    idx = idx[pd.MultiIndex.from_frame(keys).isin(sizes.index[sizes >= 100])]
+    fits = regression_engine.fit_groups(f.X[idx, :regression_engine.BASE], f.y[idx],
+                                        f.keys[["Offense", "Year"]].iloc[idx], min_n=50,
+                                        names=regression_engine.COLUMNS[:regression_engine.BASE])
+    black = fits[fits["term"] == "Black"]
     results = {}
-    for offense in ["Drug Trafficking", "Firearms", "Robbery"]:
-        years_data = []
-        for year in sorted(df["Year"].unique()):
-            sub = df[(df["Offense"] == offense) & (df["Year"] == year)]
-            if len(sub) < 100:
-                continue
-            try:
-                X, y = _prepare_features(sub, include_offense_dummies=False)
-                if len(y) < 50:
-                    continue
-                m = sm.OLS(y, X).fit(cov_type='HC1')
-                years_data.append({"Year": year, "Effect": round(m.params["Black"], 1)})
-            except Exception:
-                continue
-        results[offense] = pd.DataFrame(years_data)
+    for offense in offenses:
+        rows = black[black["Offense"] == offense].sort_values("Year")
+        results[offense] = pd.DataFrame({"Year": rows["Year"].to_numpy(), "Effect": rows["coef"].round(1).to_numpy()})
     return results
 
 
@@ -192,10 +299,8 @@ def get_fitted_model(df=None):
     pc = _load_precomputed()
     if pc:
         return pc['model_params'], pc['model_columns']
-    import statsmodels.api as sm
-    X, y = _prepare_features(df)
-    model = sm.OLS(y, X).fit(cov_type='HC1')
-    return dict(model.params), list(X.columns)
+    fit = _fit_overall(df)
+    return dict(fit['coef']), list(fit.index)
 
 
 @st.cache_data
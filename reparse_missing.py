@@ -1,18 +1,28 @@
 """
 Re-download and parse missing/broken years, fix OFFTYPE2→OFFGUIDE.
-Downloads one year at a time, parses, deletes raw files to save space.
+Zips are fetched concurrently into the ussc_download cache (so reruns only
+revalidate them) and each is parsed straight from the zip stream (no extraction).
+Years whose records and layout hashes match data/ingest_manifest.json are not re-parsed.
+FY2018+ (not re-parsed here) are copied from the legacy combined_all_years.csv into the
+store the first time, so a fresh store still holds every year.
+Usage: python reparse_missing.py [--force]
 """
-import os, re, subprocess, zipfile, glob
+import os, sys
 import pandas as pd
+import ingest_profile
+import sas_layout
+from dat_reader import read_zip, zip_members
+from case_store import append_store, partition_path, store_size_mb, store_years, write_store
+from ussc_download import fetch_all, zip_url
+from ingest import conform, file_digest, is_current, load_manifest, save_manifest, store_vars, year_entry
 
 DATA_DIR = "data"
+STORE_PATH = os.path.join(DATA_DIR, "combined_all_years.parquet")
+# Earlier combined output; its FY2018+ rows seed a new store
+LEGACY_CSV = os.path.join(DATA_DIR, "combined_all_years.csv")
 
-KEY_VARS = ["SENTTOT", "NEWRACE", "MONSEX", "AGE", "OFFGUIDE", "DISTRICT",
-            "XMINSOR", "XMAXSOR", "CRIMHIST", "CRIMPTS", "CITIZEN",
-            "NEWEDUC", "WEAPON", "SENTIMP", "DSPLEA", "INOUT", "PRESENT"]
-
-# Also try OFFTYPE2 as fallback for OFFGUIDE
-ALT_VARS = {"OFFGUIDE": "OFFTYPE2"}
+# KEY_VARS plus anything added later with add_variable.py
+STORE_VARS = store_vars()
 
 # Years that need re-downloading/re-parsing
 # FY02-10: need OFFTYPE2 mapped to OFFGUIDE
@@ -24,156 +34,130 @@ YEARS_TO_PROCESS = {
     "14": "2014", "15": "2015", "16": "2016", "17": "2017",
 }
 
-# Known USSC download URLs (patterns vary by year)
-URL_PATTERNS = {
-    "02": "https://www.ussc.gov/sites/default/files/zip/opafy02nid.zip",
-    "03": "https://www.ussc.gov/sites/default/files/zip/opafy03nid.zip",
-    "04": "https://www.ussc.gov/sites/default/files/zip/opafy04nid.zip",
-    "05": "https://www.ussc.gov/sites/default/files/zip/opafy05nid.zip",
-    "06": "https://www.ussc.gov/sites/default/files/zip/opafy06nid.zip",
-    "07": "https://www.ussc.gov/sites/default/files/zip/opafy07nid.zip",
-    "08": "https://www.ussc.gov/sites/default/files/zip/opafy08nid.zip",
-    "09": "https://www.ussc.gov/sites/default/files/zip/opafy09nid.zip",
-    "10": "https://www.ussc.gov/sites/default/files/zip/opafy10nid.zip",
-    "11": "https://www.ussc.gov/sites/default/files/zip/opafy11nid.zip",
-    "12": "https://www.ussc.gov/sites/default/files/zip/opafy12nid.zip",
-    "13": "https://www.ussc.gov/sites/default/files/zip/opafy13nid.zip",
-    "14": "https://www.ussc.gov/sites/default/files/zip/opafy14nid.zip",
-    "15": "https://www.ussc.gov/sites/default/files/zip/opafy15nid.zip",
-    "16": "https://www.ussc.gov/sites/default/files/zip/opafy16-nid.zip",
-    "17": "https://www.ussc.gov/sites/default/files/zip/opafy17-nid.zip",
-}
+def process_year(suffix, year_label, zip_path, prev=None, force=False, profile=None):
+    """
+    Parse one year from its cached zip, profiling it as it decodes. Returns (df, manifest entry);
+    df is None if the year failed, or if its zip and layout match prev and force is off.
+    """
+    try:
+        # Read the layout straight from the zip — nothing is extracted to disk
+        sas_member, dat_member = zip_members(zip_path)
+        if not sas_member or not dat_member:
+            print(f"  ❌ Missing sas ({int(bool(sas_member))}) or dat ({int(bool(dat_member))})")
+            return None, None
 
+        # Compiled SAS layout (reused while the zip's .sas member is unchanged)
+        layout = sas_layout.year_layout(year_label, zip_path)
 
-def parse_sas_positions(sas_path):
-    with open(sas_path, 'r', errors='replace') as f:
-        text = f.read()
-    input_match = re.search(r'INPUT\s(.*?);', text, re.DOTALL)
-    if not input_match:
-        raise ValueError(f"No INPUT section found in {sas_path}")
-    input_text = input_match.group(1)
-    positions = {}
-    for m in re.finditer(r'(\w+)\s+\$?\s*(\d+)-(\d+)', input_text):
-        name = m.group(1).upper()
-        start = int(m.group(2)) - 1
-        end = int(m.group(3))
-        positions[name] = (start, end)
-    for m in re.finditer(r'(\w+)\s+\$?\s*(\d+)(?:\s|$)', input_text):
-        name = m.group(1).upper()
-        pos = int(m.group(2))
-        if name not in positions and pos > 10:
-            positions[name] = (pos - 1, pos)
-    return positions
-
-
-def process_year(suffix, year_label, url):
-    tmp_dir = os.path.join(DATA_DIR, f"_tmp_fy{suffix}")
-    os.makedirs(tmp_dir, exist_ok=True)
-    zip_path = os.path.join(tmp_dir, f"fy{suffix}.zip")
+        # Build column mapping, using the layout's aliases for fallbacks (OFFTYPE2 → OFFGUIDE)
+        available, resolved, missing = sas_layout.resolve(layout, STORE_VARS)
+
+        entry = year_entry(zip_path, layout, resolved, missing, prev)
+        entry["source"] = dict(entry["source"], url=zip_url(suffix))
+        if not force and is_current(prev, entry):
+            print(f"  ✓ Unchanged since last run ({prev['rows']:,} cases), skipping")
+            return None, entry
 
-    try:
-        # Download
-        print(f"  Downloading FY{year_label}...")
-        r = subprocess.run(["curl", "-sL", "-o", zip_path, url], timeout=120)
-        if r.returncode != 0 or not os.path.exists(zip_path) or os.path.getsize(zip_path) < 1000:
-            print(f"  ❌ Download failed")
-            return None
-
-        # Extract
-        print(f"  Extracting...")
-        with zipfile.ZipFile(zip_path, 'r') as z:
-            z.extractall(tmp_dir)
-
-        # Find .sas and .dat files
-        sas_files = glob.glob(os.path.join(tmp_dir, "*.sas")) + glob.glob(os.path.join(tmp_dir, "**/*.sas"), recursive=True)
-        dat_files = glob.glob(os.path.join(tmp_dir, "*.dat")) + glob.glob(os.path.join(tmp_dir, "**/*.dat"), recursive=True)
-
-        if not sas_files or not dat_files:
-            print(f"  ❌ Missing sas ({len(sas_files)}) or dat ({len(dat_files)})")
-            return None
-
-        sas_file = sas_files[0]
-        dat_file = dat_files[0]
-
-        # Parse SAS positions
-        positions = parse_sas_positions(sas_file)
-
-        # Build column mapping, using ALT_VARS for fallbacks
-        available = {}
-        for v in KEY_VARS:
-            if v in positions:
-                available[v] = positions[v]
-            elif v in ALT_VARS and ALT_VARS[v] in positions:
-                available[v] = positions[ALT_VARS[v]]  # Map OFFTYPE2 → OFFGUIDE
-
-        missing = [v for v in KEY_VARS if v not in available]
         if missing:
             print(f"  Missing vars: {missing}")
-        print(f"  Found {len(available)}/{len(KEY_VARS)} key variables")
-
-        # Parse
-        colspecs = [(pos[0], pos[1]) for pos in available.values()]
-        names = list(available.keys())
-        df = pd.read_fwf(dat_file, colspecs=colspecs, names=names,
-                         na_values=['.', ' .', '  .', '   .'],
-                         encoding='latin-1')
-        for col in names:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+        print(f"  Found {len(available)}/{len(STORE_VARS)} key variables")
+
+        # Parse, decompressing the .dat member in memory
+        df = read_zip(zip_path, available, profile=profile)
         df["FISCAL_YEAR"] = int(year_label)
         print(f"  → {len(df):,} cases")
-        return df
+        return df, entry
 
     except Exception as e:
         print(f"  ❌ Failed: {e}")
-        return None
-    finally:
-        # Clean up immediately
-        import shutil
-        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return None, None
+
+
+def seed_from_csv(manifest, csv_path=LEGACY_CSV):
+    """
+    Copy the years this script does not re-parse (FY2018+) from the legacy combined CSV
+    into the store, for any of them the store doesn't have yet; returns the years copied.
+    The CSV is streamed: each chunk's rows go straight to their year's partition.
+    """
+    if not os.path.exists(csv_path):
+        return []
+    skip = set(store_years(STORE_PATH)) | {int(y) for y in YEARS_TO_PROCESS.values()}
+    header = pd.read_csv(csv_path, nrows=0).columns
+    usecols = [c for c in STORE_VARS + ["FISCAL_YEAR"] if c in header]
+    profiles = {}
+    for chunk in pd.read_csv(csv_path, usecols=usecols, chunksize=500_000, low_memory=False):
+        chunk = conform(chunk[~chunk["FISCAL_YEAR"].isin(skip)], STORE_VARS + ["FISCAL_YEAR"])
+        for year, rows in chunk.groupby("FISCAL_YEAR", sort=True):
+            year_label = str(int(year))
+            if year_label in profiles:
+                append_store(rows, STORE_PATH)
+            else:
+                # First rows of the year replace whatever partition it had
+                write_store(rows, STORE_PATH)
+                profiles[year_label] = ingest_profile.new()
+            ingest_profile.update(profiles[year_label], rows[STORE_VARS])
+    if not profiles:
+        return []
+    source = file_digest(csv_path)
+    years = sorted(profiles)
+    for year_label in years:
+        manifest[year_label] = dict(source=source, layout=None, resolved=None,
+                                    partition=partition_path(year_label, STORE_PATH),
+                                    **ingest_profile.year_summary(profiles[year_label], STORE_VARS))
+    save_manifest(manifest)
+    total = sum(manifest[y]["rows"] for y in years)
+    print(f"Copied FY{', FY'.join(years)} ({total:,} cases) into the store from {csv_path}")
+    return years
 
 
 def main():
-    frames = []
+    force = "--force" in sys.argv
+    manifest = load_manifest()
+    written = []
+
+    # Years this script doesn't re-parse come over from the legacy CSV the first time
+    written += seed_from_csv(manifest)
+
+    # Download (or revalidate the cached copies of) every year at once
+    zips = fetch_all(sorted(YEARS_TO_PROCESS))
 
     for suffix, year_label in sorted(YEARS_TO_PROCESS.items()):
-        if suffix not in URL_PATTERNS:
-            print(f"⚠️  FY{year_label}: no URL, skipping")
+        if not zips[suffix]:
+            print(f"⚠️  FY{year_label}: download failed, skipping")
             continue
         print(f"Processing FY{year_label}...")
-        df = process_year(suffix, year_label, URL_PATTERNS[suffix])
-        if df is not None and len(df) > 0:
-            frames.append(df)
-
-    if not frames:
-        print("No new data parsed!")
+        profile = ingest_profile.new()
+        df, entry = process_year(suffix, year_label, zips[suffix],
+                                 prev=manifest.get(year_label), force=force, profile=profile)
+        if df is None and entry is not None:
+            # Unchanged: keep the entry but refresh its digests (path, mtime) for the next run
+            manifest[year_label] = dict(manifest[year_label], source=entry["source"], layout=entry["layout"])
+            save_manifest(manifest)
+        if df is None or len(df) == 0:
+            continue
+        # Replace just this year's partition right away; FY2018+ partitions are left alone
+        df = conform(df, STORE_VARS + ["FISCAL_YEAR"])
+        write_store(df, STORE_PATH)
+        entry.update(partition=partition_path(year_label, STORE_PATH),
+                     **ingest_profile.year_summary(profile, STORE_VARS))
+        manifest[year_label] = entry
+        save_manifest(manifest)
+        ingest_profile.save({year_label: ingest_profile.summarize(profile, STORE_VARS)})
+        written.append(year_label)
+        del df
+
+    if not written:
+        print("No new data parsed — every year is up to date!")
         return
 
-    new_data = pd.concat(frames, ignore_index=True)
-    print(f"\nNew data: {len(new_data):,} cases across {new_data['FISCAL_YEAR'].nunique()} years")
-
-    # Load existing data (FY2018-2024 from the old combined)
-    existing = pd.read_csv(os.path.join(DATA_DIR, "combined_all_years.csv"), low_memory=False)
-    # Keep only FY2018+ from existing (we're replacing everything before that)
-    existing = existing[existing["FISCAL_YEAR"] >= 2018]
-    print(f"Existing FY2018+: {len(existing):,} cases")
-
-    # Combine
-    combined = pd.concat([new_data, existing], ignore_index=True)
-    for col in KEY_VARS:
-        if col not in combined.columns:
-            combined[col] = pd.NA
-    combined = combined[KEY_VARS + ["FISCAL_YEAR"]]
-    combined = combined.sort_values("FISCAL_YEAR").reset_index(drop=True)
-
-    print(f"\nFinal: {len(combined):,} cases across {combined['FISCAL_YEAR'].nunique()} years")
-    for yr in sorted(combined["FISCAL_YEAR"].unique()):
-        n = len(combined[combined["FISCAL_YEAR"] == yr])
-        offguide_pct = combined[combined["FISCAL_YEAR"] == yr]["OFFGUIDE"].notna().mean() * 100
-        print(f"  FY{int(yr)}: {n:,} cases (OFFGUIDE: {offguide_pct:.0f}%)")
-
-    out_path = os.path.join(DATA_DIR, "combined_all_years.csv")
-    combined.to_csv(out_path, index=False)
-    print(f"\n✅ Saved to {out_path} ({os.path.getsize(out_path)/1024/1024:.1f} MB)")
+    print(f"\nStored {len(written)} years: {', '.join(written)}")
+    print(f"\nFinal: {sum(e['rows'] for e in manifest.values()):,} cases across {len(manifest)} years")
+    for yr, e in sorted(manifest.items()):
+        coverage = e.get("coverage", {}).get("OFFGUIDE")
+        print(f"  FY{yr}: {e['rows']:,} cases" + (f" (OFFGUIDE: {coverage * 100:.0f}%)" if coverage is not None else ""))
+    ingest_profile.print_drift(ingest_profile.load())
+
+    print(f"\n✅ Saved to {STORE_PATH} ({store_size_mb(STORE_PATH):.1f} MB)")
 
     # Clean up old file
     old = os.path.join(DATA_DIR, "combined_fy19_fy24.csv")
@@ -0,0 +1,127 @@
+"""
+Compiled USSC record layouts, one per fiscal year.
+Each year's .sas INPUT statement is parsed once into a layout:
+
+    data/layouts/FY<year>.json
+        version    LAYOUT_VERSION it was compiled with
+        source     identity of the .sas it came from (size/mtime, or the zip member's CRC) and its sha256
+        fields     {VAR: [start, end, "num" | "$"]}   0-indexed start, exclusive end
+        aliases    {VAR: source VAR} fallbacks from ingest.ALT_VARS this layout needs (OFFGUIDE → OFFTYPE2)
+        alt_vars   the ALT_VARS the aliases were worked out from (a change recompiles)
+
+Later runs reuse the compiled layout as long as the .sas is unchanged, so no
+parser re-reads or re-regexes it; a changed .sas (by hash) is recompiled and
+reported.
+"""
+import json
+import os
+import re
+import zipfile
+
+from dat_reader import zip_members
+from ingest import ALT_VARS, sha256_bytes
+
+LAYOUT_VERSION = 1
+LAYOUT_DIR = os.path.join("data", "layouts")
+
+_INPUT = re.compile(r'INPUT\s(.*?);', re.DOTALL | re.IGNORECASE)
+# Range columns: VARNAME  start-end  or  VARNAME $ start-end
+_RANGE = re.compile(r'(\w+)\s+(\$?)\s*(\d+)-(\d+)')
+# Single-column: VARNAME  pos  (just a number, no dash)
+_SINGLE = re.compile(r'(\w+)\s+(\$?)\s*(\d+)(?:\s|$)')
+
+
+def compile_text(text):
+    """{"fields", "aliases"} for the text of a .sas file."""
+    input_match = _INPUT.search(text)
+    if not input_match:
+        raise ValueError("No INPUT section found")
+    input_text = input_match.group(1)
+    fields = {}
+    for m in _RANGE.finditer(input_text):
+        fields[m.group(1).upper()] = [int(m.group(3)) - 1, int(m.group(4)), m.group(2) or "num"]
+    for m in _SINGLE.finditer(input_text):
+        name, pos = m.group(1).upper(), int(m.group(3))
+        if name not in fields and pos > 10:  # smaller bare numbers are format widths, not positions
+            fields[name] = [pos - 1, pos, m.group(2) or "num"]
+    aliases = {v: src for v, src in ALT_VARS.items() if v not in fields and src in fields}
+    return {"fields": fields, "aliases": aliases}
+
+
+def _source_id(source):
+    """Cheap identity of a .sas file (path, size, mtime), or of the .sas member of a zip (path, member, size, CRC)."""
+    if source.endswith(".zip"):
+        sas, _ = zip_members(source)
+        if sas is None:
+            raise ValueError(f"No .sas file in {source}")
+        with zipfile.ZipFile(source) as z:
+            info = z.getinfo(sas)
+        return [source, sas, info.file_size, info.CRC]
+    st = os.stat(source)
+    return [source, st.st_size, st.st_mtime_ns]
+
+
+def _read_source(source):
+    if source.endswith(".zip"):
+        sas, _ = zip_members(source)
+        with zipfile.ZipFile(source) as z:
+            return z.read(sas)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def _path(year, layout_dir):
+    return os.path.join(layout_dir, f"FY{year}.json")
+
+
+def load(year, layout_dir=LAYOUT_DIR):
+    """A year's compiled layout as last saved, or None (never compiled, or from an older version)."""
+    path = _path(year, layout_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        layout = json.load(f)
+    return layout if layout.get("version") == LAYOUT_VERSION else None
+
+
+def save(year, layout, layout_dir=LAYOUT_DIR):
+    os.makedirs(layout_dir, exist_ok=True)
+    path = _path(year, layout_dir)
+    with open(path + ".tmp", "w") as f:
+        json.dump(layout, f, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def year_layout(year, source, layout_dir=LAYOUT_DIR):
+    """
+    The compiled layout for a year whose .sas is `source` (the .sas file, or the USSC zip holding it).
+    Compiled on first use and whenever the .sas changes; otherwise read back from data/layouts/.
+    """
+    cached = load(year, layout_dir)
+    source_id = _source_id(source)
+    if cached and cached["source"]["id"] == source_id and cached.get("alt_vars") == ALT_VARS:
+        return cached
+    data = _read_source(source)
+    sha = sha256_bytes(data)
+    if cached and cached["source"]["sha256"] != sha:
+        print(f"  ⚠️  FY{year}: SAS layout changed since it was compiled, recompiling")
+    layout = dict(compile_text(data.decode("latin-1")), version=LAYOUT_VERSION, alt_vars=ALT_VARS,
+                  source={"id": source_id, "sha256": sha})
+    save(year, layout, layout_dir)
+    return layout
+
+
+def resolve(layout, names):
+    """
+    Slicing plan for names, falling back to the layout's aliases (e.g. OFFTYPE2 for OFFGUIDE in older years).
+    Returns (colspecs {var: (start, end)}, resolved {var: source var}, missing vars).
+    """
+    fields, aliases = layout["fields"], layout["aliases"]
+    colspecs, resolved = {}, {}
+    for v in names:
+        src = v if v in fields else aliases.get(v)
+        if src is not None:
+            start, end, _ = fields[src]
+            colspecs[v] = (start, end)
+            resolved[v] = src
+    return colspecs, resolved, [v for v in names if v not in resolved]
@@ -0,0 +1,13 @@
+import numpy as np
+
+from dat_reader import read_dat
+
+
+def test_read_dat_ragged_tail(tmp_path):
+    # Three full-width records, then a tail shorter than one record holding several short lines
+    path = tmp_path / "cases.dat"
+    path.write_bytes(b"0012345678\n0023456789\n0034567890\n4\n5\n6\n")
+    df = read_dat(str(path), {"A": (0, 3), "B": (3, 6)})
+    assert len(df) == 6
+    assert df["A"].tolist() == [1, 2, 3, 4, 5, 6]
+    assert np.isnan(df["B"].iloc[3:]).all()
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+import pytest
+
+from regression_engine import (OFFENSE_DUMMIES, design, fit_groups, fit_logit_groups, fit_sparse, hc1,
+                               solve, sparse_design)
+
+
+def test_fit_logit_groups_rank_deficient():
+    # Two groups of the same size; in group 'b' the second column repeats the first
+    rng = np.random.default_rng(0)
+    n = 400
+    x1 = rng.normal(size=2 * n)
+    x2 = np.where(np.arange(2 * n) < n, rng.normal(size=2 * n), x1)
+    X = np.column_stack([np.ones(2 * n), x1, x2])
+    y = (rng.random(2 * n) < 1 / (1 + np.exp(-(0.3 + 0.8 * x1 - 0.5 * x2)))).astype(np.float64)
+    groups = pd.Series(np.repeat(['a', 'b'], n), name='g')
+    out = fit_logit_groups(X, y, groups, names=['const', 'x1', 'x2'])
+    status = out.groupby('g')['status'].first()
+    assert status['a'] == 'converged'
+    assert status['b'] == 'rank deficient'
+
+
+def test_fit_groups_skips_missing_keys():
+    rng = np.random.default_rng(1)
+    n = 300
+    X = np.column_stack([np.ones(n), rng.normal(size=n)])
+    y = X @ [1.0, 2.0] + rng.normal(size=n)
+    year = pd.Series(np.where(np.arange(n) % 3 == 0, np.nan, np.arange(n) % 3 + 2020.0), name='Year')
+    out = fit_groups(X, y, year, names=['const', 'x'])
+    assert sorted(out['Year'].unique()) == [2021.0, 2022.0]
+    assert out.groupby('Year')['n'].first().tolist() == [100, 100]
+    g = (year == 2021).to_numpy()
+    params = solve(X[g].T @ X[g], X[g].T @ y[g])[0]
+    assert np.allclose(out.loc[out['Year'] == 2021, 'coef'], params)
+
+
+@pytest.mark.parametrize("solver", ["normal", "lsqr"])
+def test_fit_sparse_matches_dense(solver):
+    pytest.importorskip("scipy")
+    rng = np.random.default_rng(2)
+    n = 2000
+    df = pd.DataFrame({
+        'SENTTOT': rng.gamma(2.0, 30.0, n), 'NEWRACE': rng.integers(1, 4, n), 'MONSEX': rng.integers(0, 2, n),
+        'AGE': rng.integers(18, 70, n), 'XMINSOR': rng.gamma(2.0, 20.0, n), 'CRIMPTS': rng.integers(0, 13, n),
+        'CITIZEN': rng.integers(1, 4, n), 'WEAPON': rng.integers(0, 2, n),
+        'OFFGUIDE': rng.choice(OFFENSE_DUMMIES + [2, 3], n),
+        'DISTRICT': rng.integers(0, 12, n).astype(float), 'Year': rng.integers(2018, 2025, n),
+    })
+    df.loc[::97, 'DISTRICT'] = np.nan
+    X, y, names = sparse_design(df, dummies=('DISTRICT', 'Year'))
+
+    dense, y_dense, keep = design(df)
+    located = df['DISTRICT'].notna().to_numpy()
+    extra = pd.get_dummies(df.loc[keep & located, ['DISTRICT', 'Year']].astype('category'), drop_first=True)
+    dense = np.column_stack([dense[located[keep]], extra.to_numpy(np.float64)])
+    y_dense = y_dense[located[keep]]
+    assert np.array_equal(X.toarray(), dense) and np.array_equal(y, y_dense)
+
+    beta, inv, rank = solve(dense.T @ dense, dense.T @ y_dense)
+    e = y_dense - dense @ beta
+    bse = np.sqrt(np.diagonal(hc1(inv, (dense * (e * e)[:, None]).T @ dense, len(e), rank)))
+    fit = fit_sparse(X, y, names, solver=solver)
+    assert list(fit.params.index) == names
+    assert np.allclose(fit.params, beta, rtol=1e-7, atol=1e-9)
+    assert np.allclose(fit.bse, bse, rtol=1e-7, atol=1e-9)
@@ -0,0 +1,142 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ussc_download import DownloadError, ZIP_NAMES, cached_path, fetch, zip_url
+
+
+def _zip_bytes(text):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr("opafy24nid.dat", text * 2000)
+    return buf.getvalue()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves server.body under server.etag, honouring Range/If-Range and If-None-Match."""
+
+    def do_HEAD(self):
+        self._respond(head=True)
+
+    def do_GET(self):
+        self._respond(head=False)
+
+    def _respond(self, head):
+        server = self.server
+        server.requests.append((self.command, dict(self.headers)))
+        body, etag = server.body, server.etag
+        if etag and self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        start = 0
+        ranged = self.headers.get("Range")
+        if ranged and (self.headers.get("If-Range") in (None, etag)):
+            start = int(ranged.split("=")[1].split("-")[0])
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        if etag:
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+        if not head:
+            # server.drop_after cuts the connection part way, as a dropped transfer
+            self.wfile.write(body[start:server.drop_after] if server.drop_after else body[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.body, httpd.etag, httpd.drop_after, httpd.requests = _zip_bytes("a"), '"v1"', None, []
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    httpd.base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _fetch(server, tmp_path, **kwargs):
+    return fetch("24", base_url=server.base_url, cache_dir=str(tmp_path), timeout=5, **kwargs)
+
+
+def test_fresh_download(server, tmp_path):
+    path = _fetch(server, tmp_path)
+    assert open(path, "rb").read() == server.body
+    assert os.path.basename(path) == hashlib.sha256(server.body).hexdigest() + ".zip"
+    assert cached_path("24", server.base_url, str(tmp_path)) == path
+    assert not os.listdir(tmp_path / "partial")
+
+
+def test_resume_from_partial(server, tmp_path):
+    half = len(server.body) // 2
+    partial = tmp_path / "partial"
+    partial.mkdir()
+    part = partial / (ZIP_NAMES["24"] + ".part")
+    part.write_bytes(server.body[:half])
+    (partial / (ZIP_NAMES["24"] + ".part.json")).write_text(
+        json.dumps({"url": zip_url("24", server.base_url), "etag": '"v1"', "last_modified": None}))
+    path = _fetch(server, tmp_path)
+    assert open(path, "rb").read() == server.body
+    headers = server.requests[-1][1]
+    assert headers["Range"] == f"bytes={half}-" and headers["If-Range"] == '"v1"'
+
+
+def test_dropped_connection_then_resume(server, tmp_path):
+    server.drop_after = len(server.body) // 3
+    with pytest.raises(DownloadError, match="rerun to resume"):
+        _fetch(server, tmp_path)
+    server.drop_after = None
+    path = _fetch(server, tmp_path)
+    assert open(path, "rb").read() == server.body
+    assert "Range" in server.requests[-1][1]
+
+
+def test_not_modified_returns_cached(server, tmp_path):
+    path = _fetch(server, tmp_path)
+    server.requests.clear()
+    assert _fetch(server, tmp_path) == path
+    assert [method for method, _ in server.requests] == ["HEAD"]
+    assert server.requests[0][1]["If-None-Match"] == '"v1"'
+
+
+def test_changed_etag_downloads_again(server, tmp_path):
+    old = _fetch(server, tmp_path)
+    server.body, server.etag = _zip_bytes("b"), '"v2"'
+    new = _fetch(server, tmp_path)
+    assert new != old
+    assert open(new, "rb").read() == server.body
+    assert cached_path("24", server.base_url, str(tmp_path)) == new
+
+
+def test_no_validator_keeps_cached(server, tmp_path):
+    server.etag = None
+    path = _fetch(server, tmp_path)
+    server.requests.clear()
+    assert _fetch(server, tmp_path) == path
+    assert server.requests == []
+
+
+def test_checksum_mismatch(server, tmp_path):
+    with pytest.raises(DownloadError, match="Checksum mismatch"):
+        _fetch(server, tmp_path, expected_sha256="0" * 64)
+    assert cached_path("24", server.base_url, str(tmp_path)) is None
+
+
+def test_not_a_zip(server, tmp_path):
+    server.body = b"<html>moved</html>"
+    with pytest.raises(DownloadError, match="not a zip"):
+        _fetch(server, tmp_path)
+    assert not os.path.exists(tmp_path / "partial" / (ZIP_NAMES["24"] + ".part"))
@@ -5,6 +5,7 @@ Is the racial sentencing gap getting better or worse over time?
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
+from regression_engine import fit_groups
 
 DATA_PATH = "data/combined_fy19_fy24.csv"
 RACE_MAP = {1: "White", 2: "Black", 3: "Hispanic"}
@@ -76,25 +77,23 @@ print("-" * 65)
 yearly_black_effect = []
 yearly_female_effect = []
 
-for year in sorted(valid["FISCAL_YEAR"].unique()):
-    ydf = valid[valid["FISCAL_YEAR"] == year]
-    
-    feats = ["is_black", "is_hispanic", "is_female", "XMINSOR", "CRIMPTS", "AGE", "is_illegal_alien"] + off_cols
-    X = ydf[feats].fillna(0)
-    X = sm.add_constant(X)
-    y = ydf["SENTTOT"]
-    
-    m = sm.OLS(y, X).fit(cov_type='HC1')
+# All years' models in one batched fit (regression_engine.fit_groups)
+feats = ["is_black", "is_hispanic", "is_female", "XMINSOR", "CRIMPTS", "AGE", "is_illegal_alien"] + off_cols
+X = sm.add_constant(valid[feats].fillna(0), has_constant="add")
+fits = fit_groups(X, valid["SENTTOT"], valid["FISCAL_YEAR"])
+
+for year, m in fits.groupby("FISCAL_YEAR", sort=True):
+    m = m.set_index("term")
     
-    b_coef = m.params["is_black"]
-    b_p = m.pvalues["is_black"]
+    b_coef = m.at["is_black", "coef"]
+    b_p = m.at["is_black", "pvalue"]
     b_sig = "***" if b_p < 0.001 else "**" if b_p < 0.01 else "*" if b_p < 0.05 else ""
-    f_coef = m.params["is_female"]
+    f_coef = m.at["is_female", "coef"]
     
     yearly_black_effect.append({"year": int(year), "effect": b_coef, "p": b_p})
     yearly_female_effect.append({"year": int(year), "effect": f_coef})
     
-    print(f"  {int(year):<6d} {b_coef:>+10.1f} mo {b_p:>10.4f} {b_sig:>5s} {f_coef:>+11.1f} mo {int(m.nobs):>8,}")
+    print(f"  {int(year):<6d} {b_coef:>+10.1f} mo {b_p:>10.4f} {b_sig:>5s} {f_coef:>+11.1f} mo {int(m['n'].iloc[0]):>8,}")
 
 # ============================================================
 # 3. BELOW-GUIDELINE RATE BY RACE — OVER TIME
@@ -126,28 +125,23 @@ for off_code, off_name in [(10, "Drug Trafficking"), (13, "Firearms"), (26, "Rob
     print("=" * 65)
     
     off_data = valid[valid["OFFGUIDE"] == off_code]
+    off_data = off_data[off_data.groupby("FISCAL_YEAR")["SENTTOT"].transform("size") >= 100]
     
     print(f"\n{'Year':<8s} {'Black Effect':>14s} {'p-value':>10s} {'Sig':>5s} {'N':>8s}")
     print("-" * 50)
     
-    for year in sorted(off_data["FISCAL_YEAR"].unique()):
-        ydf = off_data[off_data["FISCAL_YEAR"] == year]
-        if len(ydf) < 100:
-            continue
-        
-        feats = ["is_black", "is_hispanic", "is_female", "XMINSOR", "CRIMPTS", "AGE", "is_illegal_alien"]
-        X = ydf[feats].fillna(0)
-        X = sm.add_constant(X)
-        y = ydf["SENTTOT"]
-        
-        try:
-            m = sm.OLS(y, X).fit(cov_type='HC1')
-            b_coef = m.params["is_black"]
-            b_p = m.pvalues["is_black"]
-            b_sig = "***" if b_p < 0.001 else "**" if b_p < 0.01 else "*" if b_p < 0.05 else ""
-            print(f"  {int(year):<6d} {b_coef:>+10.1f} mo {b_p:>10.4f} {b_sig:>5s} {int(m.nobs):>8,}")
-        except:
+    feats = ["is_black", "is_hispanic", "is_female", "XMINSOR", "CRIMPTS", "AGE", "is_illegal_alien"]
+    X = sm.add_constant(off_data[feats].fillna(0), has_constant="add")
+    fits = fit_groups(X, off_data["SENTTOT"], off_data["FISCAL_YEAR"])
+    
+    for year, m in fits[fits["term"] == "is_black"].groupby("FISCAL_YEAR", sort=True):
+        b_coef = m["coef"].iloc[0]
+        b_p = m["pvalue"].iloc[0]
+        if np.isnan(b_p):
             print(f"  {int(year):<6d}  (insufficient data)")
+            continue
+        b_sig = "***" if b_p < 0.001 else "**" if b_p < 0.01 else "*" if b_p < 0.05 else ""
+        print(f"  {int(year):<6d} {b_coef:>+10.1f} mo {b_p:>10.4f} {b_sig:>5s} {int(m['n'].iloc[0]):>8,}")
 
 # ============================================================
 # SUMMARY
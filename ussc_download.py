@@ -0,0 +1,256 @@
+"""
+Shared download layer for the USSC Individual Offender zips (opafyXXnid.zip).
+Zips land in a content-addressed cache, so reruns don't download again:
+
+    data/zip_cache/objects/<sha256>.zip   verified archives
+    data/zip_cache/partial/<name>.part    interrupted transfers, resumed with HTTP Range
+    data/zip_cache/index.json             url -> sha256, size, ETag, Last-Modified
+
+A cached zip is revalidated with If-None-Match / If-Modified-Since and only
+fetched again if the server has a new version. Every download is hashed as it
+streams and checked against its Content-Length, an optional pinned sha256,
+and the zip format. Several years are fetched concurrently.
+
+Set USSC_BASE_URL (or pass base_url) to point at a mirror or local test server.
+Usage: python ussc_download.py [02 03 ...] [--workers N]
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import shutil
+import threading
+import urllib.error
+import urllib.request
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+BASE_URL = os.environ.get("USSC_BASE_URL", "https://www.ussc.gov/sites/default/files/zip")
+CACHE_DIR = os.path.join("data", "zip_cache")
+TIMEOUT = 60
+BLOCK = 1 << 20
+
+# FY16/17 have a dash in the file name; everything else is opafyXXnid.zip
+ZIP_NAMES = {f"{yr:02d}": f"opafy{yr:02d}nid.zip" for yr in range(2, 25)}
+ZIP_NAMES.update({"16": "opafy16-nid.zip", "17": "opafy17-nid.zip"})
+
+_index_lock = threading.Lock()
+
+
+class DownloadError(Exception):
+    pass
+
+
+def zip_url(suffix, base_url=None):
+    return f"{(base_url or BASE_URL).rstrip('/')}/{ZIP_NAMES[suffix]}"
+
+
+# ── Cache index ───────────────────────────────────────────────
+
+def _index_path(cache_dir):
+    return os.path.join(cache_dir, "index.json")
+
+
+def _load_index(cache_dir):
+    path = _index_path(cache_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _update_index(cache_dir, url, entry):
+    with _index_lock:
+        index = _load_index(cache_dir)
+        index[url] = entry
+        tmp = _index_path(cache_dir) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f, indent=2, sort_keys=True)
+        os.replace(tmp, _index_path(cache_dir))
+
+
+def _object_path(cache_dir, sha256):
+    return os.path.join(cache_dir, "objects", f"{sha256}.zip")
+
+
+def cached_path(suffix, base_url=None, cache_dir=CACHE_DIR):
+    """Path of the cached zip for a year, without touching the network; None if not cached."""
+    entry = _load_index(cache_dir).get(zip_url(suffix, base_url))
+    if entry and os.path.exists(_object_path(cache_dir, entry["sha256"])):
+        return _object_path(cache_dir, entry["sha256"])
+    return None
+
+
+def _sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+# ── Transfer ──────────────────────────────────────────────────
+
+def _open(url, headers, timeout, method="GET"):
+    """urlopen that returns 304/416 responses instead of raising on them."""
+    try:
+        req = urllib.request.Request(url, headers=headers, method=method)
+        return urllib.request.urlopen(req, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code in (304, 416):
+            return e
+        raise
+
+
+def _download(url, part_path, timeout):
+    """
+    Stream url into part_path, resuming from its current size when the server
+    honours the Range request for the same version (If-Range); a fresh 200
+    restarts from zero. Returns (sha256, size, etag, last_modified).
+    """
+    meta_path = part_path + ".json"
+    meta = {}
+    if os.path.exists(part_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+    offset = os.path.getsize(part_path) if meta else 0
+    validator = meta.get("etag") or meta.get("last_modified")
+
+    headers = {}
+    if offset and validator:
+        headers = {"Range": f"bytes={offset}-", "If-Range": validator}
+    resp = _open(url, headers, timeout)
+    if resp.status == 416:  # the partial is already the whole file (or stale); start over
+        resp.close()
+        resp = _open(url, {}, timeout)
+    with resp:
+        if resp.status not in (200, 206):
+            raise DownloadError(f"HTTP {resp.status} for {url}")
+        if resp.status == 200:
+            offset = 0
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        length = resp.headers.get("Content-Length")
+        expected_size = offset + int(length) if length is not None else None
+
+        h = hashlib.sha256()
+        if offset:
+            with open(part_path, "rb") as f:
+                for block in iter(lambda: f.read(BLOCK), b""):
+                    h.update(block)
+        with open(meta_path, "w") as f:
+            json.dump({"url": url, "etag": etag, "last_modified": last_modified}, f)
+        with open(part_path, "ab" if offset else "wb") as f:
+            for block in iter(lambda: resp.read(BLOCK), b""):
+                f.write(block)
+                h.update(block)
+    size = os.path.getsize(part_path)
+    if expected_size is not None and size != expected_size:
+        raise DownloadError(f"Truncated download of {url}: {size:,} of {expected_size:,} bytes; "
+                            "rerun to resume")
+    return h.hexdigest(), size, etag, last_modified
+
+
+def fetch(suffix, base_url=None, cache_dir=CACHE_DIR, expected_sha256=None,
+          revalidate=True, timeout=TIMEOUT):
+    """
+    Return the local path of a year's zip, downloading it only if it isn't
+    cached or the server has a newer version. Raises DownloadError if the
+    transfer fails, is truncated, isn't a zip, or doesn't match expected_sha256.
+    """
+    url = zip_url(suffix, base_url)
+    entry = _load_index(cache_dir).get(url)
+    cached = _object_path(cache_dir, entry["sha256"]) if entry else None
+    if cached and not os.path.exists(cached):
+        entry = cached = None
+    if cached and expected_sha256 and entry["sha256"] != expected_sha256:
+        entry = cached = None
+
+    if cached:
+        # without a validator a conditional request can't answer 304; keep the copy
+        if not revalidate or not (entry.get("etag") or entry.get("last_modified")):
+            return cached
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            with _open(url, headers, timeout, method="HEAD") as resp:
+                status = resp.status
+        except (urllib.error.URLError, OSError) as e:
+            print(f"  ⚠️ FY20{suffix}: can't revalidate ({e}), using cached copy")
+            return cached
+        if status == 304:
+            return cached
+
+    os.makedirs(os.path.join(cache_dir, "partial"), exist_ok=True)
+    os.makedirs(os.path.join(cache_dir, "objects"), exist_ok=True)
+    part_path = os.path.join(cache_dir, "partial", ZIP_NAMES[suffix] + ".part")
+    try:
+        sha256, size, etag, last_modified = _download(url, part_path, timeout)
+    except urllib.error.HTTPError as e:
+        raise DownloadError(f"HTTP {e.code} for {url}") from e
+    except (urllib.error.URLError, http.client.IncompleteRead, OSError) as e:
+        raise DownloadError(f"Download of {url} interrupted ({e}); rerun to resume") from e
+
+    if expected_sha256 and sha256 != expected_sha256:
+        os.remove(part_path)
+        raise DownloadError(f"Checksum mismatch for {url}: got {sha256}, expected {expected_sha256}")
+    if not zipfile.is_zipfile(part_path):
+        os.remove(part_path)
+        raise DownloadError(f"{url} is not a zip archive")
+
+    path = _object_path(cache_dir, sha256)
+    os.replace(part_path, path)
+    os.remove(part_path + ".json")
+    _update_index(cache_dir, url, {"sha256": sha256, "size": size, "etag": etag,
+                                   "last_modified": last_modified})
+    print(f"  ⬇️  FY20{suffix}: {size/1e6:.1f}MB downloaded")
+    return path
+
+
+def fetch_all(suffixes, workers=4, **kwargs):
+    """fetch() several years concurrently; returns {suffix: path or None}, reporting failures."""
+    def one(suffix):
+        try:
+            return fetch(suffix, **kwargs)
+        except DownloadError as e:
+            print(f"  ❌ FY20{suffix}: {e}")
+            return None
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return dict(zip(suffixes, pool.map(one, suffixes)))
+
+
+def verify_cache(cache_dir=CACHE_DIR):
+    """Re-hash every cached zip; drop any whose content no longer matches its name."""
+    bad = []
+    for url, entry in _load_index(cache_dir).items():
+        path = _object_path(cache_dir, entry["sha256"])
+        if os.path.exists(path) and _sha256_file(path) != entry["sha256"]:
+            os.remove(path)
+            bad.append(url)
+    return bad
+
+
+def clear_partials(cache_dir=CACHE_DIR):
+    shutil.rmtree(os.path.join(cache_dir, "partial"), ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("years", nargs="*", default=sorted(ZIP_NAMES), help="two-digit year suffixes")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--verify", action="store_true", help="re-hash cached zips first")
+    args = parser.parse_args()
+    if args.verify:
+        for url in verify_cache():
+            print(f"  ⚠️ Corrupt cached copy of {url} removed")
+    paths = fetch_all(args.years, workers=args.workers)
+    ok = sum(p is not None for p in paths.values())
+    print(f"\n✅ {ok}/{len(paths)} years cached in {CACHE_DIR}")
+
+
+if __name__ == "__main__":
+    main()
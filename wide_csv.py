@@ -0,0 +1,190 @@
+"""
+Column-projected reader for the very wide USSC CSVs (opafy24nid.csv has ~27k columns).
+pandas' usecols still tokenizes every field of every line; this scans the file
+once to build a byte-offset index, then pulls single columns out of it:
+
+    <csv>.idx/index.json        source digest, header, stride, row count
+    <csv>.idx/rows.npy          byte offset of every data line
+    <csv>.idx/checkpoints.npy   offset (within its line) of every STRIDE-th field
+    <csv>.idx/cols/<NAME>.npy   projected columns, parsed as float64
+
+Extracting a column only reads the STRIDE fields around its checkpoint on each
+line, and projected columns are cached, so adding a variable later costs a
+partial read of that one column instead of another full pass.
+
+Usage: python wide_csv.py [opafy24nid.csv] [--slim]   # --slim rewrites individual_fy24/slim.csv
+"""
+import csv
+import io
+import json
+import mmap
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from ingest import KEY_VARS, file_digest
+
+DATA_PATH = "data/individual_fy24/opafy24nid.csv"
+SLIM_PATH = "data/individual_fy24/slim.csv"
+
+STRIDE = 256
+BLOCK = 8 << 20
+COMMA, QUOTE, NEWLINE, CR = ord(","), ord('"'), ord("\n"), ord("\r")
+
+
+def index_dir(path):
+    return path + ".idx"
+
+
+def _scan(buf, start, n_fields):
+    """
+    One vectorized pass over buf[start:]: returns (line offsets, checkpoints).
+    Commas and newlines inside quoted fields are ignored. Every block is cut
+    at an unquoted newline, so quote state never carries across blocks.
+    """
+    rows, checkpoints = [], []
+    fields = np.arange(0, n_fields, STRIDE)
+    pos, size, block = start, len(buf), BLOCK
+    while pos < size:
+        b = np.frombuffer(buf, dtype=np.uint8, count=min(block, size - pos), offset=pos)
+        quoted = np.zeros(len(b), dtype=bool)
+        if (b == QUOTE).any():
+            quoted = (np.cumsum(b == QUOTE) & 1).astype(bool)
+        newlines = np.flatnonzero((b == NEWLINE) & ~quoted)
+        at_eof = pos + len(b) == size
+        if at_eof and (not len(newlines) or newlines[-1] != len(b) - 1):
+            newlines = np.append(newlines, len(b))  # last line has no trailing newline
+        if not len(newlines):
+            block *= 2  # a single line longer than the block
+            continue
+        last = newlines[-1]
+        starts = np.concatenate([[0], newlines[:-1] + 1])
+        ends = newlines.copy()
+        has_cr = (ends > starts) & (b[np.maximum(ends - 1, 0)] == CR)
+        ends[has_cr] -= 1
+        keep = ends > starts  # blank lines
+        starts, ends = starts[keep], ends[keep]
+
+        commas = np.flatnonzero((b[:last] == COMMA) & ~quoted[:last])
+        first = np.searchsorted(commas, starts)
+        counts = np.searchsorted(commas, ends) - first
+        if (counts != n_fields - 1).any():
+            bad = int(np.argmax(counts != n_fields - 1))
+            raise ValueError(f"Line at byte {pos + starts[bad]:,} has {counts[bad] + 1} fields, "
+                             f"header has {n_fields}")
+        # Start of field f is one past the (f-1)th comma on its line; field 0 starts the line
+        cp = commas[first[:, None] + np.maximum(fields - 1, 0)[None, :]] + 1 - starts[:, None]
+        cp[:, 0] = 0
+        # A virtual comma after the line end closes the last stride
+        cp = np.column_stack([cp, ends - starts + 1])
+        rows.append(starts + pos)
+        checkpoints.append(cp.astype(np.int32))
+        pos += int(last) + 1
+        block = BLOCK
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, len(fields) + 1), dtype=np.int32)
+    return np.concatenate(rows).astype(np.int64), np.concatenate(checkpoints)
+
+
+def _read_header(buf):
+    end = buf.find(b"\n")
+    end = len(buf) if end == -1 else end
+    line = buf[:end].decode("utf-8-sig").rstrip("\r")
+    return [h.strip() for h in next(csv.reader([line]))], end + 1
+
+
+def _load_index(path):
+    meta_path = os.path.join(index_dir(path), "index.json")
+    if not os.path.exists(meta_path):
+        return {}
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def build_index(path, force=False):
+    """The index for path, rebuilt (and the column cache dropped) if the file changed."""
+    meta = _load_index(path)
+    source = file_digest(path, meta.get("source"))
+    idx = index_dir(path)
+    if not force and meta.get("source", {}).get("sha256") == source["sha256"] and meta.get("stride") == STRIDE:
+        return meta
+    t = time.time()
+    print(f"Indexing {path}...")
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        header, start = _read_header(buf)
+        rows, checkpoints = _scan(buf, start, len(header))
+    os.makedirs(os.path.join(idx, "cols"), exist_ok=True)
+    for name in os.listdir(os.path.join(idx, "cols")):
+        os.remove(os.path.join(idx, "cols", name))
+    np.save(os.path.join(idx, "rows.npy"), rows)
+    np.save(os.path.join(idx, "checkpoints.npy"), checkpoints)
+    meta = {"source": source, "header": header, "stride": STRIDE, "rows": len(rows)}
+    with open(os.path.join(idx, "index.json"), "w") as f:
+        json.dump(meta, f)
+    print(f"  {len(rows):,} rows × {len(header):,} columns indexed in {time.time() - t:.1f}s")
+    return meta
+
+
+def header(path):
+    return build_index(path)["header"]
+
+
+def _extract(path, meta, names):
+    """Parse the named columns by reading only their stride of each line; returns {name: float64 array}."""
+    idx = index_dir(path)
+    rows = np.load(os.path.join(idx, "rows.npy"))
+    checkpoints = np.load(os.path.join(idx, "checkpoints.npy"))
+    positions = {name: meta["header"].index(name) for name in names}
+    by_stride = {}
+    for name, j in positions.items():
+        by_stride.setdefault(j // STRIDE, []).append((name, j % STRIDE))
+
+    values = {name: [] for name in names}
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        for k, cols in by_stride.items():
+            seg_starts = rows + checkpoints[:, k]
+            seg_ends = rows + checkpoints[:, k + 1] - 1
+            for a, b in zip(seg_starts.tolist(), seg_ends.tolist()):
+                seg = buf[a:b]
+                if b'"' in seg:
+                    fields = next(csv.reader(io.StringIO(seg.decode("utf-8", "replace"))))
+                else:
+                    fields = seg.split(b",")
+                for name, r in cols:
+                    values[name].append(fields[r])
+    out = {}
+    for name, vals in values.items():
+        text = pd.Series(vals, dtype=object).map(lambda v: v.decode("utf-8", "replace") if isinstance(v, bytes) else v)
+        out[name] = pd.to_numeric(text.str.strip().replace("", np.nan), errors="coerce").to_numpy("float64")
+    return out
+
+
+def read_columns(path, columns):
+    """DataFrame of the requested columns (those present in the header), from the column cache where possible."""
+    meta = build_index(path)
+    present = [c for c in columns if c in meta["header"]]
+    cols_dir = os.path.join(index_dir(path), "cols")
+    todo = [c for c in present if not os.path.exists(os.path.join(cols_dir, f"{c}.npy"))]
+    if todo:
+        t = time.time()
+        for name, arr in _extract(path, meta, todo).items():
+            np.save(os.path.join(cols_dir, f"{name}.npy"), arr)
+        print(f"  Projected {len(todo)} new columns in {time.time() - t:.1f}s")
+    return pd.DataFrame({c: np.load(os.path.join(cols_dir, f"{c}.npy")) for c in present})
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    path = args[0] if args else DATA_PATH
+    build_index(path, force="--force" in sys.argv)
+    if "--slim" in sys.argv:
+        df = read_columns(path, KEY_VARS)
+        df.to_csv(SLIM_PATH, index=False)
+        print(f"✅ Wrote {SLIM_PATH}: {len(df):,} rows × {len(df.columns)} columns")
+
+
+if __name__ == "__main__":
+    main()